@@ -38,22 +38,82 @@ def create_app(config_name=None):
                      logger=True, 
                      engineio_logger=True)
     
+    # JSON or msgpack Socket.IO frames, as each client negotiates
+    from app.socket_serializer import socket_serializer
+    socket_serializer.init_app(app)
+    
     # Register blueprints
     from app.api import api_bp
     from app.main import main_bp
     
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(main_bp)
+
+    # Per-request SQL query accounting, slow query log and N+1 detection
+    from app import query_stats
+    query_stats.init_app(app)
+    
+    # Compress large JSON API responses (gzip, plus brotli/zstd when installed)
+    from app import compression
+    compression.init_app(app)
+    
+    # Run blocking database reads on native threads so they don't stall the gevent hub
+    from app.db_pool import db_pool
+    db_pool.init_app(app)
+    
+    # In-memory rolling window answering the upcoming-events endpoints
+    from app.upcoming_window import upcoming_window
+    upcoming_window.init_app(app)
+    
+    # Attach the archive database holding events older than ARCHIVE_HORIZON_DAYS
+    from app.archive import event_archive
+    event_archive.init_app(app)
+    
+    # Calendar-sharded event storage across several SQLite files
+    from app.shards import shard_router
+    shard_router.init_app(app)
     
+    # Commit concurrent event writes together, one transaction per batch
+    from app.group_commit import group_commit
+    group_commit.init_app(app)
+    
+    # Durable job queue for heavy work (purges, imports, exports, push fan-out)
+    from app.jobs import job_queue
+    job_queue.init_app(app)
+    
+    # Set-based calendar deletes, with large calendars emptied in background batches
+    from app.calendar_delete import calendar_deleter
+    calendar_deleter.init_app(app)
+    
+    # Queue and deliver Web Push notifications from a background worker
+    from app.push import push_service
+    push_service.init_app(app)
+    
+    # Online backups through the SQLite backup API, optionally on a schedule
+    from app.backup import database_backup
+    database_backup.init_app(app)
+    
+    # Content-hashed, precompressed static files and the generated service worker
+    from app.assets import asset_pipeline
+    asset_pipeline.init_app(app)
+    
+    # Maintenance CLI commands (search index rebuild, ...)
+    from app.commands import register_commands
+    register_commands(app)
+
     # Add template filter for cache-busting
     import time
     @app.template_filter('cache_bust')
     def cache_bust_filter(filename):
-        """Add timestamp to filename for cache busting in development"""
+        """Point at the content-hashed build if there is one, else add a timestamp in development"""
+        hashed = asset_pipeline.url_for(filename)
+        if hashed:
+            return hashed
         if app.debug:
             try:
                 # Try to get file modification time for more accurate cache busting
-                file_path = os.path.join(app.static_folder, filename.replace('/', os.sep))
+                relative = filename[len(app.static_url_path) + 1:] if filename.startswith(app.static_url_path + '/') else filename
+                file_path = os.path.join(app.static_folder, relative.replace('/', os.sep))
                 if os.path.exists(file_path):
                     mtime = int(os.path.getmtime(file_path))
                     return f"{filename}?v={mtime}&t={int(time.time())}"
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api_bp = Blueprint('api', __name__)
 
-from . import calendar_routes, event_routes, user_routes
\ No newline at end of file
+from . import calendar_routes, event_routes, user_routes, notification_routes, job_routes
\ No newline at end of file
@@ -1,8 +1,24 @@
 from flask import request, jsonify, session
-from app.models import db, Calendar, Event, User, UserCalendar
+from app.models import db, Calendar, Event, EventChange, User, UserCalendar
+from app.db_pool import run_db
+from app.upcoming_window import upcoming_window
+from app.archive import event_archive
+from app.calendar_delete import calendar_deleter
+from app.jobs import job_queue
+from app.shards import shard_router
+from app.cache import LRUCache
 from . import api_bp
 import uuid
 
+def _parse_utc(value):
+    """Parse an ISO datetime into naive UTC, the way events are stored"""
+    from datetime import datetime, timezone
+    
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.replace(tzinfo=None)
+
 @api_bp.route('/users', methods=['POST'])
 def create_or_get_user():
     """Create a new user or get existing user by session"""
@@ -183,9 +199,18 @@ def get_calendar_members(calendar_id):
 @api_bp.route('/calendars/<int:calendar_id>/upcoming-events')
 def get_calendar_upcoming_events(calendar_id):
     """Get upcoming events for a calendar (next 5 events)"""
+    # Served from the in-memory window when it holds enough events for this calendar
+    upcoming_events = upcoming_window.calendar_upcoming(calendar_id, limit=5)
+    if upcoming_events is not None:
+        return jsonify(upcoming_events)
+    
+    return jsonify(run_db(_query_calendar_upcoming_events, calendar_id))
+
+def _query_calendar_upcoming_events(calendar_id):
     from datetime import datetime
     
     calendar = Calendar.query.get_or_404(calendar_id)
+    shard_router.route(calendar_id)
     
     # Get upcoming events (next 5)
     upcoming_events = Event.query.filter(
@@ -193,7 +218,7 @@ def get_calendar_upcoming_events(calendar_id):
         Event.start_time >= datetime.utcnow()
     ).order_by(Event.start_time).limit(5).all()
     
-    return jsonify([event.to_dict() for event in upcoming_events])
+    return [event.to_dict() for event in upcoming_events]
 
 @api_bp.route('/users/calendars')
 def get_user_calendars():
@@ -202,6 +227,9 @@ def get_user_calendars():
     if not user_id:
         return jsonify({'error': 'User session required'}), 401
     
+    return jsonify(run_db(_query_user_calendars, user_id))
+
+def _query_user_calendars(user_id):
     # Get all calendars the user is a member of
     user_calendars = db.session.query(Calendar, UserCalendar).join(
         UserCalendar, Calendar.id == UserCalendar.calendar_id
@@ -214,7 +242,137 @@ def get_user_calendars():
         calendar_dict['joined_at'] = user_calendar.joined_at.isoformat()
         calendars_data.append(calendar_dict)
     
-    return jsonify(calendars_data)
+    return calendars_data
+
+@api_bp.route('/users/agenda')
+def get_user_agenda():
+    """Get the next events across all of the user's calendars, in start order"""
+    from datetime import datetime
+    
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+    
+    from_param = request.args.get('from')
+    try:
+        from_dt = _parse_utc(from_param) if from_param else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    
+    return jsonify(run_db(_query_user_agenda, user_id, from_dt, limit))
+
+def _query_user_agenda(user_id, from_dt, limit):
+    import heapq
+    from datetime import datetime
+    from itertools import islice
+    
+    calendars = db.session.query(Calendar.id, Calendar.name, Calendar.share_code).join(
+        UserCalendar, Calendar.id == UserCalendar.calendar_id
+    ).filter(UserCalendar.user_id == user_id).all()
+    
+    # Small pages: most calendars contribute only a few rows to the merged result
+    page_size = min(limit, max(5, limit // max(len(calendars), 1) + 1))
+    shards = shard_router.placement(calendar.id for calendar in calendars)
+    
+    def calendar_cursor(calendar_id, calendar_name, share_code):
+        """Yield one calendar's events in (start_time, id) order, a page at a time"""
+        last = None
+        while True:
+            query = Event.query.filter(Event.calendar_id == calendar_id)
+            if last is None:
+                query = query.filter(Event.start_time >= from_dt)
+            else:
+                # Keyset pagination on the (calendar_id, start_time) index
+                query = query.filter(db.or_(
+                    Event.start_time > last[0],
+                    db.and_(Event.start_time == last[0], Event.id > last[1])
+                ))
+            # Cursors are interleaved by the merge, so each page is routed on its own
+            with shard_router.shard(shards[calendar_id]):
+                page = query.order_by(Event.start_time, Event.id).limit(page_size).all()
+            for event in page:
+                event_dict = event.to_dict()
+                event_dict['calendar_name'] = calendar_name
+                event_dict['share_code'] = share_code
+                yield (event.start_time, event.id), event_dict
+            if len(page) < page_size:
+                return
+            last = (page[-1].start_time, page[-1].id)
+    
+    def archived_cursor(calendar_id, calendar_name, share_code):
+        """Yield one calendar's archived events starting at or after from_dt, in start order"""
+        for event_dict in event_archive.calendar_events(calendar_id, from_dt):
+            start_time = datetime.fromisoformat(event_dict['start_time'])
+            if start_time >= from_dt:
+                yield (start_time, event_dict['id']), dict(event_dict, calendar_name=calendar_name,
+                                                           share_code=share_code)
+    
+    # k-way merge; islice stops pulling (and querying) once `limit` rows are produced
+    cursors = [calendar_cursor(*calendar) for calendar in calendars]
+    if event_archive.covers(from_dt):
+        cursors += [archived_cursor(*calendar) for calendar in calendars]
+    merged = heapq.merge(*cursors, key=lambda item: item[0])
+    return [event_dict for _, event_dict in islice(merged, limit)]
+
+@api_bp.route('/users/export')
+def export_user_data():
+    """Stream the user's calendars, memberships, events and reminders as an archive"""
+    from flask import Response, stream_with_context
+    from app.data_transfer import export_user, FORMATS, MIMETYPES
+    from datetime import datetime
+    
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    
+    filename = f"calindar-{session.get('username') or user_id}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    response = Response(stream_with_context(export_user(user_id, fmt)), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_bp.route('/users/export', methods=['POST'])
+def queue_user_export():
+    """Queue a gzipped export archive, downloaded from /api/jobs/<id>/download when done"""
+    from app.data_transfer import FORMATS
+    
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+    
+    fmt = (request.get_json(silent=True) or {}).get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    
+    job = job_queue.enqueue('user.export', {'user_id': user_id, 'format': fmt}, user_id=user_id)
+    return jsonify({'job': job.to_dict()}), 202
+
+@api_bp.route('/users/import', methods=['POST'])
+def import_user_data():
+    """Queue the import of an exported archive (multipart 'archive' file or raw body) as new calendars"""
+    import shutil
+    
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+    
+    # The upload is saved for the job, which reads it after this request is gone
+    path = job_queue.file_path('.archive')
+    upload = request.files.get('archive')
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(upload.stream if upload is not None else request.stream, f)
+    
+    job = job_queue.enqueue('user.import', {'file': path, 'user_id': user_id}, user_id=user_id)
+    if job.status == 'failed':
+        return jsonify({'error': job.last_error, 'job': job.to_dict()}), 400
+    if job.status == 'done':
+        return jsonify({'imported': job.to_dict()['result'], 'job': job.to_dict()}), 201
+    return jsonify({'job': job.to_dict()}), 202
 
 @api_bp.route('/calendars/<share_code>')
 def get_calendar_by_share_code(share_code):
@@ -244,27 +402,243 @@ def list_calendars():
 @api_bp.route('/calendars/<int:calendar_id>/events')
 def get_calendar_events(calendar_id):
     """Get all events for a calendar"""
-    calendar = Calendar.query.get_or_404(calendar_id)
-    
     # Optional date range filtering
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
+    try:
+        start_dt = _parse_utc(start_date) if start_date else None
+        end_dt = _parse_utc(end_date) if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    return jsonify(run_db(_query_calendar_events, calendar_id, start_dt, end_dt))
+
+def _query_calendar_events(calendar_id, start_dt=None, end_dt=None):
+    calendar = Calendar.query.get_or_404(calendar_id)
+    shard_router.route(calendar_id)
+    
     query = Event.query.filter_by(calendar_id=calendar_id)
     
-    if start_date:
-        from datetime import datetime
-        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+    if start_dt:
         query = query.filter(Event.end_time >= start_dt)
     
-    if end_date:
-        from datetime import datetime
-        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    if end_dt:
         query = query.filter(Event.start_time <= end_dt)
     
     events = query.order_by(Event.start_time).all()
+    events_data = [event.to_dict() for event in events]
+    
+    # Only ranges reaching back past the archive cutoff touch the archive file
+    if event_archive.covers(start_dt):
+        archived = event_archive.calendar_events(calendar_id, start_dt, end_dt)
+        events_data = sorted(archived + events_data, key=lambda event: event['start_time'])
     
-    return jsonify([event.to_dict() for event in events])
+    return events_data
+
+@api_bp.route('/calendars/<int:calendar_id>/month/<month>/summary')
+def get_calendar_month_summary(calendar_id, month):
+    """Get per-day event counts and first titles for a month grid (month is YYYY-MM)"""
+    from datetime import datetime
+    
+    try:
+        first_day = datetime.strptime(month, '%Y-%m').date()
+    except ValueError:
+        return jsonify({'error': 'Month must be in YYYY-MM format'}), 400
+    
+    titles_per_day = max(0, min(request.args.get('titles', 3, type=int), 10))
+    
+    return jsonify(run_db(_query_month_summary, calendar_id, first_day, titles_per_day))
+
+# Summaries keyed by (calendar_id, month, titles, calendar version, archive cutoff); a new version misses
+_month_summary_cache = LRUCache(max_entries=1024)
+
+def _query_month_summary(calendar_id, first_day, titles_per_day):
+    from datetime import datetime, timedelta
+    from app.models import CalendarVersion
+    
+    Calendar.query.get_or_404(calendar_id)
+    shard_router.route(calendar_id)
+    
+    version = CalendarVersion.get(calendar_id)
+    cutoff = event_archive.cutoff()
+    cache_key = (calendar_id, first_day, titles_per_day, version, cutoff)
+    summary = _month_summary_cache.get(cache_key)
+    if summary is not None:
+        return summary
+    
+    next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    last_day = next_month - timedelta(days=1)
+    
+    # Months reaching back past the archive cutoff add the archived events
+    archived = ''
+    if cutoff is not None and datetime.combine(first_day, datetime.min.time()) < cutoff:
+        archived = """
+            UNION ALL
+            SELECT id, title, start_time, end_time, all_day
+            FROM archive.event
+            WHERE calendar_id = :calendar_id
+              AND end_time >= :first_day
+              AND start_time < :next_month"""
+    
+    # One row per (day, event) overlap; multi-day events appear on every day they
+    # touch, and one ending at midnight stops the day before. Stored datetimes are text
+    # ('2026-11-04 00:00:00.000000' sorts after '2026-11-04'), so the end bound compares
+    # as julianday. Window functions give the per-day count and the order for first-N titles.
+    rows = db.session.execute(db.text(f"""
+        WITH RECURSIVE days(day) AS (
+            SELECT :first_day
+            UNION ALL
+            SELECT date(day, '+1 day') FROM days WHERE day < :last_day
+        ),
+        month_events AS (
+            SELECT id, title, start_time, end_time, all_day
+            FROM event
+            WHERE calendar_id = :calendar_id
+              AND end_time >= :first_day
+              AND start_time < :next_month{archived}
+        ),
+        buckets AS (
+            SELECT days.day AS day, e.id, e.title, e.start_time, e.all_day,
+                   COUNT(*) OVER (PARTITION BY days.day) AS day_count,
+                   ROW_NUMBER() OVER (PARTITION BY days.day ORDER BY e.start_time, e.id) AS position
+            FROM days
+            JOIN month_events e
+              ON e.start_time < date(days.day, '+1 day')
+             AND (julianday(e.end_time) > julianday(days.day) OR e.start_time >= days.day)
+        )
+        SELECT day, day_count, id, title, start_time, all_day, position
+        FROM buckets
+        WHERE position <= :titles OR position = 1
+        ORDER BY day, position
+    """), {
+        'calendar_id': calendar_id,
+        'first_day': first_day.isoformat(),
+        'last_day': last_day.isoformat(),
+        'next_month': next_month.isoformat(),
+        'titles': titles_per_day,
+    }).all()
+    
+    days = []
+    for day, day_count, event_id, title, start_time, all_day, position in rows:
+        if position == 1:
+            days.append({'date': day, 'count': day_count, 'events': []})
+        if position <= titles_per_day:
+            days[-1]['events'].append({
+                'id': event_id,
+                'title': title,
+                'start_time': datetime.fromisoformat(start_time).isoformat(),
+                'all_day': bool(all_day)
+            })
+    
+    summary = {
+        'calendar_id': calendar_id,
+        'month': first_day.strftime('%Y-%m'),
+        'version': version,
+        'days': days
+    }
+    _month_summary_cache.set(cache_key, summary)
+    return summary
+
+@api_bp.route('/calendars/<int:calendar_id>/freebusy')
+def get_calendar_freebusy(calendar_id):
+    """Get merged busy blocks and free slots across all calendars of this calendar's members"""
+    from datetime import timedelta
+
+    start_param = request.args.get('start')
+    end_param = request.args.get('end')
+    if not start_param or not end_param:
+        return jsonify({'error': 'start and end are required'}), 400
+
+    try:
+        start_dt = _parse_utc(start_param)
+        end_dt = _parse_utc(end_param)
+    except ValueError:
+        return jsonify({'error': 'Invalid datetime format'}), 400
+
+    if end_dt <= start_dt:
+        return jsonify({'error': 'end must be after start'}), 400
+    if end_dt - start_dt > timedelta(days=366):
+        return jsonify({'error': 'Window cannot be longer than a year'}), 400
+
+    duration = timedelta(minutes=max(1, request.args.get('duration', 30, type=int)))
+
+    return jsonify(run_db(_query_calendar_freebusy, calendar_id, start_dt, end_dt, duration))
+
+def _query_calendar_freebusy(calendar_id, start_dt, end_dt, duration):
+    from app.freebusy import freebusy
+
+    Calendar.query.get_or_404(calendar_id)
+
+    # Every calendar any member of this calendar belongs to
+    member_ids = db.session.query(UserCalendar.user_id).filter(UserCalendar.calendar_id == calendar_id)
+    calendar_ids = [row[0] for row in db.session.query(UserCalendar.calendar_id).filter(
+        UserCalendar.user_id.in_(member_ids)
+    ).distinct()]
+    if calendar_id not in calendar_ids:
+        calendar_ids.append(calendar_id)
+
+    # Only the interval columns; the (calendar_id, start_time) index bounds each calendar's scan
+    intervals = []
+    for shard_calendar_ids in shard_router.each(calendar_ids):
+        intervals += db.session.query(Event.start_time, Event.end_time).filter(
+            Event.calendar_id.in_(shard_calendar_ids),
+            Event.start_time < end_dt,
+            Event.end_time > start_dt
+        ).all()
+    if event_archive.covers(start_dt):
+        intervals += event_archive.intervals(calendar_ids, start_dt, end_dt)
+
+    busy, free = freebusy(intervals, start_dt, end_dt, duration)
+
+    return {
+        'calendar_id': calendar_id,
+        'calendars': len(calendar_ids),
+        'start': start_dt.isoformat(),
+        'end': end_dt.isoformat(),
+        'duration_minutes': int(duration.total_seconds() // 60),
+        'busy': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in busy],
+        'free': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in free]
+    }
+
+@api_bp.route('/calendars/<int:calendar_id>/search')
+def search_calendar_events(calendar_id):
+    """Full-text search over a calendar's event titles and descriptions"""
+    return _search_response([calendar_id], check_calendar=calendar_id)
+
+@api_bp.route('/users/search')
+def search_user_events():
+    """Full-text search across all of the user's calendars"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+    
+    calendar_ids = [row[0] for row in db.session.query(UserCalendar.calendar_id).filter_by(user_id=user_id)]
+    return _search_response(calendar_ids)
+
+def _search_response(calendar_ids, check_calendar=None):
+    query_text = request.args.get('q', '').strip()
+    if not query_text:
+        return jsonify({'error': 'Search query is required'}), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    results, has_more = run_db(_query_search, calendar_ids, query_text, limit, offset, check_calendar)
+    return jsonify({
+        'query': query_text,
+        'results': results,
+        'limit': limit,
+        'offset': offset,
+        'next_offset': offset + limit if has_more else None
+    })
+
+def _query_search(calendar_ids, query_text, limit, offset, check_calendar=None):
+    from app.search import search_events
+    
+    if check_calendar is not None:
+        Calendar.query.get_or_404(check_calendar)
+    return search_events(calendar_ids, query_text, limit=limit, offset=offset)
 
 @api_bp.route('/calendars/<share_code>/events')
 def get_shared_calendar_events(share_code):
@@ -276,6 +650,65 @@ def get_shared_calendar_events(share_code):
     
     return get_calendar_events(calendar.id)
 
+@api_bp.route('/calendars/<int:calendar_id>/events/changes')
+def get_calendar_event_changes(calendar_id):
+    """Get events changed since a sync cursor (all events when no cursor is given)"""
+    since = request.args.get('since', type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 2000))
+
+    return jsonify(run_db(_query_event_changes, calendar_id, since, limit))
+
+@api_bp.route('/calendars/<share_code>/events/changes')
+def get_shared_calendar_event_changes(share_code):
+    """Get events changed since a sync cursor for a calendar by share code"""
+    calendar = Calendar.query.filter_by(share_code=share_code).first()
+
+    if not calendar:
+        return jsonify({'error': 'Calendar not found'}), 404
+
+    return get_calendar_event_changes(calendar.id)
+
+def _query_event_changes(calendar_id, since, limit):
+    Calendar.query.get_or_404(calendar_id)
+    # Cursors are ids of the change log in the calendar's shard
+    shard_router.route(calendar_id)
+
+    bounds = db.session.query(db.func.min(EventChange.id), db.func.max(EventChange.id)).one()
+    oldest, newest = bounds[0], bounds[1] or 0
+
+    # No cursor, a cursor older than the pruned log, or one from another database: full reload
+    if since is None or (oldest is not None and since < oldest - 1) or since > newest:
+        return {
+            'calendar_id': calendar_id,
+            'cursor': newest,
+            'reset': True,
+            'has_more': False,
+            'events': _query_calendar_events(calendar_id),
+            'deleted': []
+        }
+
+    changes = db.session.query(EventChange.id, EventChange.event_id, EventChange.deleted).filter(
+        EventChange.calendar_id == calendar_id,
+        EventChange.id > since
+    ).order_by(EventChange.id).limit(limit + 1).all()
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Only the latest state of each event matters; the rows are read once at the end
+    changed_ids = {event_id for _, event_id, _ in changes}
+    events = Event.query.filter(Event.id.in_(changed_ids), Event.calendar_id == calendar_id).all() if changed_ids else []
+    current_ids = {event.id for event in events}
+
+    return {
+        'calendar_id': calendar_id,
+        'cursor': changes[-1].id if changes else newest,
+        'reset': False,
+        'has_more': has_more,
+        'events': [event.to_dict() for event in events],
+        'deleted': sorted(changed_ids - current_ids)
+    }
+
 @api_bp.route('/calendars/<int:calendar_id>', methods=['DELETE'])
 def delete_calendar(calendar_id):
     """Delete a calendar (only owner can delete)"""
@@ -299,19 +732,12 @@ def delete_calendar(calendar_id):
         if member_count > 1:
             return jsonify({'error': 'Cannot delete calendar with other members. Remove all members first or transfer ownership.'}), 400
         
-        # Get the calendar
-        calendar = Calendar.query.get_or_404(calendar_id)
-        
-        # Delete all reminders for events in this calendar first
-        from app.models import Reminder
-        reminders_to_delete = db.session.query(Reminder).join(Event).filter(Event.calendar_id == calendar_id).all()
-        for reminder in reminders_to_delete:
-            db.session.delete(reminder)
-        
-        # Delete the calendar (cascade will handle events and user_calendars)
-        db.session.delete(calendar)
-        db.session.commit()
+        # Set-based deletes; large calendars are hidden now and emptied by a background job
+        job = calendar_deleter.delete(calendar_id, user_id=user_id)
+        upcoming_window.remove_calendar(calendar_id)
         
+        if job is not None and job.status != 'done':
+            return jsonify({'message': 'Calendar is being deleted', 'pending': True, 'job': job.to_dict()}), 202
         return jsonify({'message': 'Calendar deleted successfully'}), 200
     
     except Exception as e:
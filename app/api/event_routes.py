@@ -1,7 +1,12 @@
-from flask import request, jsonify
+from flask import request, jsonify, session
 from flask_socketio import emit
 from app import socketio
-from app.models import db, Event, Calendar, Reminder
+from app.models import db, Event, Calendar, CalendarVersion, Reminder, UserCalendar
+from app.db_pool import run_db
+from app.upcoming_window import upcoming_window
+from app.push import push_service
+from app.shards import shard_router
+from app.group_commit import group_commit
 from datetime import datetime, timedelta
 from . import api_bp
 
@@ -19,125 +24,280 @@ def create_event():
     if not calendar:
         return jsonify({'error': 'Calendar not found'}), 404
     
+    # The event, its reminder, change-log entry and version bump all go to the calendar's shard
+    shard = shard_router.route(calendar.id)
+    
     try:
-        # Parse datetime strings as Philippines local time
-        start_time = datetime.fromisoformat(data['start_time'])
-        end_time = datetime.fromisoformat(data['end_time'])
-        
-        event = Event(
-            title=data['title'],
-            description=data.get('description', ''),
-            start_time=start_time,
-            end_time=end_time,
-            all_day=data.get('all_day', False),
-            reminder_minutes=data.get('reminder_minutes', 15),
-            calendar_id=data['calendar_id']
-        )
-        
-        db.session.add(event)
-        db.session.commit()
-        
-        # Create reminder if specified
-        if event.reminder_minutes > 0:
-            reminder_time = start_time - timedelta(minutes=event.reminder_minutes)
-            reminder = Reminder(
-                event_id=event.id,
-                reminder_time=reminder_time
-            )
-            db.session.add(reminder)
-            db.session.commit()
-        
-        # Emit real-time update to connected clients
-        socketio.emit('event_created', event.to_dict(), room=f'calendar_{calendar.share_code}')
-        
-        return jsonify(event.to_dict()), 201
-        
+        event, version, conflicts = group_commit.run(_insert_event, data, session.get('user_id'), shard=shard)
     except ValueError as e:
         return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    upcoming_window.upsert(event)
+    
+    # Emit real-time update to connected clients
+    event_data = event.to_dict()
+    socketio.emit('event_created', {'event': event_data, 'calendar_id': event.calendar_id, 'version': version},
+                  room=f'calendar_{calendar.share_code}')
+    push_service.notify_event('added', event_data, calendar, exclude_user_id=session.get('user_id'))
+    
+    if conflicts is not None:
+        event_data = dict(event_data, conflicts=conflicts)
+    return jsonify(event_data), 201
+
+def _insert_event(data, user_id):
+    """Add an event and its reminder in one transaction; returns (event, version, conflicts)"""
+    # Parse datetime strings as Philippines local time
+    start_time = datetime.fromisoformat(data['start_time'])
+    end_time = datetime.fromisoformat(data['end_time'])
+    
+    event = Event(
+        title=data['title'],
+        description=data.get('description', ''),
+        start_time=start_time,
+        end_time=end_time,
+        all_day=data.get('all_day', False),
+        reminder_minutes=data.get('reminder_minutes', 15),
+        calendar_id=data['calendar_id']
+    )
+    
+    db.session.add(event)
+    db.session.flush()
+    
+    # Create reminder if specified
+    if event.reminder_minutes > 0:
+        reminder_time = start_time - timedelta(minutes=event.reminder_minutes)
+        db.session.add(Reminder(
+            event_id=event.id,
+            reminder_time=reminder_time
+        ))
+    
+    # Probe for overlaps in the same transaction, before the insert is committed
+    conflicts = None
+    conflict_calendar_ids = _conflict_scope(data, event.calendar_id, user_id)
+    if conflict_calendar_ids:
+        conflicts = _find_conflicts(conflict_calendar_ids, start_time, end_time, exclude_id=event.id)
+    
+    return event, _calendar_version(event.calendar_id), conflicts
 
 @api_bp.route('/events/<int:event_id>')
 def get_event(event_id):
     """Get event by ID"""
+    shard_router.route_event(event_id)
     event = Event.query.get_or_404(event_id)
     return jsonify(event.to_dict())
 
 @api_bp.route('/events/<int:event_id>', methods=['PUT'])
 def update_event(event_id):
     """Update an event"""
-    event = Event.query.get_or_404(event_id)
     data = request.get_json()
-    
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
+    shard = shard_router.route_event(event_id)
     try:
-        # Update fields if provided
-        if 'title' in data:
-            event.title = data['title']
-        if 'description' in data:
-            event.description = data['description']
-        if 'start_time' in data:
-            event.start_time = datetime.fromisoformat(data['start_time'])
-        if 'end_time' in data:
-            event.end_time = datetime.fromisoformat(data['end_time'])
-        if 'all_day' in data:
-            event.all_day = data['all_day']
-        if 'reminder_minutes' in data:
-            event.reminder_minutes = data['reminder_minutes']
-            
-            # Update reminder
-            existing_reminder = Reminder.query.filter_by(event_id=event.id).first()
-            if existing_reminder:
-                if event.reminder_minutes > 0:
-                    existing_reminder.reminder_time = event.start_time - timedelta(minutes=event.reminder_minutes)
-                else:
-                    db.session.delete(existing_reminder)
-            elif event.reminder_minutes > 0:
-                reminder = Reminder(
-                    event_id=event.id,
-                    reminder_time=event.start_time - timedelta(minutes=event.reminder_minutes)
-                )
-                db.session.add(reminder)
-        
-        event.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        # Emit real-time update
-        calendar = Calendar.query.get(event.calendar_id)
-        socketio.emit('event_updated', event.to_dict(), room=f'calendar_{calendar.share_code}')
-        
-        return jsonify(event.to_dict())
-        
+        event, before, version, conflicts = group_commit.run(_update_event, event_id, data, session.get('user_id'),
+                                                             shard=shard)
     except ValueError as e:
         return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    upcoming_window.upsert(event)
+    
+    # Emit only the fields that changed; a drag-and-drop move sends two timestamps, not the description
+    event_data = event.to_dict()
+    calendar = Calendar.query.get(event.calendar_id)
+    socketio.emit('event_updated', {
+        'id': event.id,
+        'calendar_id': event.calendar_id,
+        'version': version,
+        'changes': {field: value for field, value in event_data.items() if before.get(field) != value}
+    }, room=f'calendar_{calendar.share_code}')
+    push_service.notify_event('updated', event_data, calendar, exclude_user_id=session.get('user_id'))
+    
+    if conflicts is not None:
+        event_data['conflicts'] = conflicts
+    return jsonify(event_data)
+
+def _update_event(event_id, data, user_id):
+    """Apply the provided fields; returns (event, fields before, version, conflicts)"""
+    event = Event.query.get_or_404(event_id)
+    before = event.to_dict()
+    
+    # Update fields if provided
+    if 'title' in data:
+        event.title = data['title']
+    if 'description' in data:
+        event.description = data['description']
+    if 'start_time' in data:
+        event.start_time = datetime.fromisoformat(data['start_time'])
+    if 'end_time' in data:
+        event.end_time = datetime.fromisoformat(data['end_time'])
+    if 'all_day' in data:
+        event.all_day = data['all_day']
+    if 'reminder_minutes' in data:
+        event.reminder_minutes = data['reminder_minutes']
+        
+        # Update reminder
+        existing_reminder = Reminder.query.filter_by(event_id=event.id).first()
+        if existing_reminder:
+            if event.reminder_minutes > 0:
+                existing_reminder.reminder_time = event.start_time - timedelta(minutes=event.reminder_minutes)
+            else:
+                db.session.delete(existing_reminder)
+        elif event.reminder_minutes > 0:
+            reminder = Reminder(
+                event_id=event.id,
+                reminder_time=event.start_time - timedelta(minutes=event.reminder_minutes)
+            )
+            db.session.add(reminder)
+    
+    event.updated_at = datetime.utcnow()
+    
+    conflicts = None
+    conflict_calendar_ids = _conflict_scope(data, event.calendar_id, user_id)
+    if conflict_calendar_ids:
+        conflicts = _find_conflicts(conflict_calendar_ids, event.start_time, event.end_time, exclude_id=event.id)
+    
+    return event, before, _calendar_version(event.calendar_id), conflicts
 
 @api_bp.route('/events/<int:event_id>', methods=['DELETE'])
 def delete_event(event_id):
     """Delete an event"""
+    shard = shard_router.route_event(event_id)
+    event_data, version = group_commit.run(_delete_event, event_id, shard=shard)
+    upcoming_window.remove(event_id)
+    calendar = Calendar.query.get(event_data['calendar_id'])
+    
+    # Emit real-time update
+    socketio.emit('event_deleted', {'event_id': event_id, 'calendar_id': calendar.id, 'version': version},
+                  room=f'calendar_{calendar.share_code}')
+    push_service.notify_event('removed', event_data, calendar, exclude_user_id=session.get('user_id'))
+    
+    return jsonify({'message': 'Event deleted successfully'})
+
+def _delete_event(event_id):
+    """Delete an event and its reminders; returns (event fields, version)"""
     event = Event.query.get_or_404(event_id)
-    calendar = Calendar.query.get(event.calendar_id)
+    event_data = event.to_dict()
     
     # Delete associated reminders
     Reminder.query.filter_by(event_id=event_id).delete()
     
     db.session.delete(event)
-    db.session.commit()
+    return event_data, _calendar_version(event.calendar_id)
+
+def _calendar_version(calendar_id):
+    """The calendar's version after this transaction's event change, read before committing.
     
-    # Emit real-time update
-    socketio.emit('event_deleted', {'event_id': event_id}, room=f'calendar_{calendar.share_code}')
+    Flushing bumps calendar_version and takes the write lock, so no other change can
+    slip in between. Clients apply a broadcast only if its version follows the last one
+    they saw, and fetch the calendar again on a gap.
+    """
+    return db.session.execute(
+        db.select(CalendarVersion.version).where(CalendarVersion.calendar_id == calendar_id)
+    ).scalar() or 0
+
+def _conflict_scope(data, calendar_id, user_id):
+    """Calendars to check for overlaps, from the optional `check_conflicts` field.
     
-    return jsonify({'message': 'Event deleted successfully'})
+    `true` or "calendar" checks the event's own calendar, "user" checks every
+    calendar of user_id (the current user) as well. Anything falsy skips the check.
+    """
+    scope = data.get('check_conflicts')
+    if not scope:
+        return []
+    
+    calendar_ids = [calendar_id]
+    if scope == 'user' and user_id:
+        # Read from the core database directly: on a shard connection the read lock on the
+        # attached core would be held until the (group) commit
+        user_calendar_ids = db.session.execute(
+            db.select(UserCalendar.calendar_id).filter_by(user_id=user_id),
+            bind_arguments={'bind': db.engine}
+        ).scalars()
+        calendar_ids += [user_calendar_id for user_calendar_id in user_calendar_ids if user_calendar_id != calendar_id]
+    return calendar_ids
+
+# Events overlap [start, end) when they start before it ends and end after it starts.
+# The probe walks ix_event_calendar_end from `start` onwards, so events that ended
+# in the past are never visited and long histories don't slow the check down.
+_CONFLICT_SQL = """
+    SELECT id, title, start_time, end_time, all_day, calendar_id
+    FROM event {hint}
+    WHERE calendar_id = :calendar_id
+      AND end_time > :start
+      AND start_time < :end
+      AND id != :exclude_id
+    ORDER BY start_time, id
+    LIMIT :limit
+"""
+
+# engine (the main database or a shard) -> whether the SQLite INDEXED BY hint can be used
+# (it errors if the index is missing)
+_end_time_index_present = {}
+
+def _has_end_time_index():
+    engine = db.session.get_bind()
+    if engine.dialect.name != 'sqlite':
+        return False
+    if engine not in _end_time_index_present:
+        _end_time_index_present[engine] = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_event_calendar_end'"
+        )).first() is not None
+    return _end_time_index_present[engine]
+
+def _find_conflicts(calendar_ids, start, end, exclude_id=None, limit=20):
+    """Events in the given calendars overlapping [start, end), using the end-time index"""
+    if end <= start:
+        return []
+    
+    conflicts = []
+    for shard_calendar_ids in shard_router.each(calendar_ids):
+        hint = 'INDEXED BY ix_event_calendar_end' if _has_end_time_index() else ''
+        statement = db.text(_CONFLICT_SQL.format(hint=hint)).bindparams(
+            db.bindparam('start', type_=db.DateTime),
+            db.bindparam('end', type_=db.DateTime)
+        ).columns(start_time=db.DateTime, end_time=db.DateTime, all_day=db.Boolean)
+        
+        for calendar_id in shard_calendar_ids:
+            rows = db.session.execute(statement, {
+                'calendar_id': calendar_id,
+                'start': start,
+                'end': end,
+                'exclude_id': exclude_id or 0,
+                'limit': limit
+            })
+            conflicts.extend({
+                'id': row.id,
+                'title': row.title,
+                'start_time': row.start_time.isoformat(),
+                'end_time': row.end_time.isoformat(),
+                'all_day': row.all_day,
+                'calendar_id': row.calendar_id
+            } for row in rows)
+    
+    conflicts.sort(key=lambda conflict: (conflict['start_time'], conflict['id']))
+    return conflicts[:limit]
 
 @api_bp.route('/events/upcoming')
 def get_upcoming_events():
     """Get upcoming events across all calendars (for reminders)"""
+    upcoming_events = upcoming_window.upcoming(hours=24)
+    if upcoming_events is not None:
+        return jsonify(upcoming_events)
+    
+    return jsonify(run_db(_query_upcoming_events))
+
+def _query_upcoming_events():
     now = datetime.utcnow()
-    upcoming_events = Event.query.filter(
-        Event.start_time > now,
-        Event.start_time <= now + timedelta(hours=24)
-    ).order_by(Event.start_time).all()
+    upcoming_events = []
+    for _ in shard_router.each_shard():
+        upcoming_events += Event.query.filter(
+            Event.start_time > now,
+            Event.start_time <= now + timedelta(hours=24)
+        ).order_by(Event.start_time).all()
+    upcoming_events.sort(key=lambda event: event.start_time)
     
-    return jsonify([event.to_dict() for event in upcoming_events])
+    return [event.to_dict() for event in upcoming_events]
 
 # WebSocket events for real-time updates
 @socketio.on('join_calendar')
@@ -150,7 +310,10 @@ def handle_join_calendar(data):
         if calendar:
             from flask_socketio import join_room
             join_room(f'calendar_{share_code}')
-            emit('joined_calendar', {'calendar': calendar.to_dict()})
+            # The version to apply broadcasts on top of
+            with shard_router.calendar(calendar.id):
+                version = CalendarVersion.get(calendar.id)
+            emit('joined_calendar', {'calendar': calendar.to_dict(), 'version': version})
 
 @socketio.on('leave_calendar')
 def handle_leave_calendar(data):
@@ -0,0 +1,51 @@
+import os
+from flask import jsonify, session, send_file
+from app.models import db, Job
+from . import api_bp
+
+def _user_job(job_id):
+    """The current user's job, or None (other users' jobs are not visible)"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != session.get('user_id'):
+        return None
+    return job
+
+@api_bp.route('/jobs')
+def list_jobs():
+    """List the current user's recent background jobs, newest first"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+
+    jobs = Job.query.filter_by(user_id=user_id).order_by(Job.id.desc()).limit(50).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+@api_bp.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    """Get the status and result of a background job"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'User session required'}), 401
+
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<int:job_id>/download')
+def download_job_file(job_id):
+    """Download the file a finished job produced (export archives)"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'User session required'}), 401
+
+    job = _user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f'Job is {job.status}', 'job': job.to_dict()}), 409
+
+    path = (job.result_data() or {}).get('file')
+    if not path or not os.path.exists(path):
+        return jsonify({'error': 'Job has no file (or it has expired)'}), 404
+    # Files are named <random hex>.<extensions>; offer them under a readable name
+    extensions = os.path.basename(path).partition('.')[2]
+    return send_file(path, as_attachment=True, download_name=f"calindar-{job.kind.replace('.', '-')}-{job.id}.{extensions}")
@@ -0,0 +1,82 @@
+from flask import request, jsonify, session
+from app.models import db, PushSubscription, PushDelivery
+from app.push import push_service
+from . import api_bp
+
+@api_bp.route('/push/public-key')
+def get_push_public_key():
+    """Get the VAPID public key browsers need to subscribe"""
+    return jsonify({
+        'enabled': push_service.enabled,
+        'public_key': push_service.public_key
+    })
+
+@api_bp.route('/push/subscriptions', methods=['POST'])
+def save_push_subscription():
+    """Store (or move to the current user) a browser push subscription"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+
+    data = request.get_json()
+    keys = (data or {}).get('keys') or {}
+    if not data or not data.get('endpoint') or not keys.get('p256dh') or not keys.get('auth'):
+        return jsonify({'error': 'endpoint, keys.p256dh and keys.auth are required'}), 400
+
+    if not data['endpoint'].startswith('https://') and push_service.transport != 'plain':
+        return jsonify({'error': 'Push endpoint must use HTTPS'}), 400
+
+    subscription = PushSubscription.query.filter_by(endpoint=data['endpoint']).first()
+    created = subscription is None
+    if created:
+        subscription = PushSubscription(endpoint=data['endpoint'])
+        db.session.add(subscription)
+
+    # The same browser may be used by another family member after a re-login
+    subscription.user_id = user_id
+    subscription.p256dh = keys['p256dh']
+    subscription.auth = keys['auth']
+    subscription.failure_count = 0
+    db.session.commit()
+
+    return jsonify(subscription.to_dict()), 201 if created else 200
+
+@api_bp.route('/push/subscriptions', methods=['DELETE'])
+def delete_push_subscription():
+    """Remove one of the current user's push subscriptions"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('endpoint'):
+        return jsonify({'error': 'endpoint is required'}), 400
+
+    deleted = PushSubscription.query.filter_by(endpoint=data['endpoint'], user_id=user_id).first()
+    if not deleted:
+        return jsonify({'error': 'Subscription not found'}), 404
+
+    PushDelivery.query.filter_by(subscription_id=deleted.id).delete()
+    db.session.delete(deleted)
+    db.session.commit()
+
+    return jsonify({'message': 'Subscription removed'})
+
+@api_bp.route('/push/test', methods=['POST'])
+def send_test_push():
+    """Queue a test notification to all of the current user's devices"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User session required'}), 401
+
+    if not push_service.enabled:
+        return jsonify({'error': 'Push notifications are not configured on this server'}), 503
+
+    queued = push_service.enqueue_for_user(user_id, {
+        'title': '🔔 Calindar',
+        'body': 'Push notifications are working!',
+        'tag': 'calindar-test',
+        'url': '/'
+    })
+
+    return jsonify({'queued': queued}), 202
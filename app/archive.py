@@ -0,0 +1,296 @@
+"""
+Hot/cold split of events into a separate SQLite archive file.
+
+When ARCHIVE_ENABLED is set, every connection ATTACHes the archive database
+(ARCHIVE_DATABASE_PATH, by default `<main db>_archive.db`) as `archive`.
+`archive_events()` moves events that ended before the horizon, with their
+reminders, from the main tables into archive.event / archive.reminder in
+small batches, so the hot tables, their indexes, backups and VACUUM only grow
+with recent data.
+
+Reads that reach back past the archive cutoff (see `covers()`) add the
+archived rows: a calendar's event list, month summaries, agendas, free/busy,
+exports and change-log resets. Everything else never touches the archive
+file. Full-text search only covers live events: archived ones are not in
+the search index.
+"""
+
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import event as sa_event
+from app.models import db
+
+_ARCHIVE_SCHEMA = [
+    # `id` keeps the original event id. main.event is AUTOINCREMENT and its sequence
+    # starts past every archived id (see _reserve_archived_ids), so none is reused
+    """
+    CREATE TABLE IF NOT EXISTS archive.event (
+        id INTEGER NOT NULL,
+        title VARCHAR(200) NOT NULL,
+        description TEXT,
+        start_time DATETIME NOT NULL,
+        end_time DATETIME NOT NULL,
+        all_day BOOLEAN,
+        reminder_minutes INTEGER,
+        created_at DATETIME,
+        updated_at DATETIME,
+        calendar_id INTEGER NOT NULL,
+        archived_at DATETIME NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.ix_archive_event_calendar_start ON event (calendar_id, start_time)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS archive.ix_archive_event_id ON event (id)",
+    """
+    CREATE TABLE IF NOT EXISTS archive.reminder (
+        id INTEGER NOT NULL,
+        event_id INTEGER NOT NULL,
+        reminder_time DATETIME NOT NULL,
+        sent BOOLEAN,
+        created_at DATETIME
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.ix_archive_reminder_event ON reminder (event_id)",
+    # Single row: every archived event ended before `cutoff`
+    """
+    CREATE TABLE IF NOT EXISTS archive.archive_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        cutoff DATETIME NOT NULL
+    )
+    """,
+]
+
+
+def _sql(statement, *datetime_params):
+    """Text statement whose named parameters are bound as DateTime (stored format)"""
+    return db.text(statement).bindparams(*[db.bindparam(name, type_=db.DateTime) for name in datetime_params])
+
+
+_EVENT_COLUMNS = ('id, title, description, start_time, end_time, all_day, reminder_minutes, '
+                  'created_at, updated_at, calendar_id')
+
+
+class EventArchive:
+    """Attaches the archive database and moves old events into it"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.path = None
+        self.horizon_days = 365
+        self.batch_size = 500
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['event_archive'] = self
+        self.horizon_days = app.config.get('ARCHIVE_HORIZON_DAYS', 365)
+        self.batch_size = app.config.get('ARCHIVE_BATCH_SIZE', 500)
+        if not app.config.get('ARCHIVE_ENABLED', False):
+            return
+
+        with app.app_context():
+            engine = db.engine
+            main_path = engine.url.database
+            if engine.dialect.name != 'sqlite' or not main_path or main_path == ':memory:':
+                app.logger.warning("Event archive needs a file-based SQLite database; archiving disabled")
+                return
+            self.path = app.config.get('ARCHIVE_DATABASE_PATH') or os.path.splitext(main_path)[0] + '_archive.db'
+            self.enabled = True
+            sa_event.listen(engine, 'connect', self._attach)
+
+    def _attach(self, dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ? AS archive", (self.path,))
+        for statement in _ARCHIVE_SCHEMA:
+            dbapi_connection.execute(statement)
+
+    # Reads
+
+    def cutoff(self):
+        """Everything archived ended before this time (None if nothing is archived yet)"""
+        if not self.enabled:
+            return None
+        return db.session.execute(
+            db.text("SELECT cutoff FROM archive.archive_state WHERE id = 1").columns(cutoff=db.DateTime)
+        ).scalar()
+
+    def covers(self, start_dt):
+        """Whether a range starting at start_dt (None = unbounded) reaches into the archive"""
+        cutoff = self.cutoff()
+        return cutoff is not None and (start_dt is None or start_dt < cutoff)
+
+    def calendar_events(self, calendar_id, start_dt=None, end_dt=None):
+        """Archived events of a calendar as Event.to_dict()-shaped dicts, in start order"""
+        sql = f"SELECT {_EVENT_COLUMNS} FROM archive.event WHERE calendar_id = :calendar_id"
+        if start_dt:
+            sql += " AND end_time >= :start_dt"
+        if end_dt:
+            sql += " AND start_time <= :end_dt"
+        sql += " ORDER BY start_time, id"
+
+        params = {'calendar_id': calendar_id, 'start_dt': start_dt, 'end_dt': end_dt}
+        statement = _sql(sql, *[name for name in ('start_dt', 'end_dt') if params[name]]).columns(
+            start_time=db.DateTime, end_time=db.DateTime, created_at=db.DateTime,
+            updated_at=db.DateTime, all_day=db.Boolean
+        )
+        rows = db.session.execute(statement, params)
+
+        return [{
+            'id': row.id,
+            'title': row.title,
+            'description': row.description,
+            'start_time': row.start_time.isoformat(),
+            'end_time': row.end_time.isoformat(),
+            'all_day': row.all_day,
+            'reminder_minutes': row.reminder_minutes,
+            'created_at': row.created_at.isoformat(),
+            'updated_at': row.updated_at.isoformat(),
+            'calendar_id': row.calendar_id,
+            'archived': True
+        } for row in rows]
+
+    def intervals(self, calendar_ids, start_dt, end_dt):
+        """(start_time, end_time) of the calendars' archived events overlapping [start_dt, end_dt)"""
+        statement = _sql(
+            "SELECT start_time, end_time FROM archive.event "
+            "WHERE calendar_id IN :calendar_ids AND start_time < :end_dt AND end_time > :start_dt",
+            'start_dt', 'end_dt'
+        ).bindparams(db.bindparam('calendar_ids', expanding=True)).columns(start_time=db.DateTime, end_time=db.DateTime)
+        return [tuple(row) for row in db.session.execute(statement, {
+            'calendar_ids': list(calendar_ids), 'start_dt': start_dt, 'end_dt': end_dt
+        })]
+
+    # Writes
+
+    def archive_events(self, horizon_days=None, now=None):
+        """Move events that ended more than horizon_days ago into the archive.
+
+        Runs in batches of ARCHIVE_BATCH_SIZE, each in its own transaction, so the
+        write lock on the main database is only held briefly. Returns the number
+        of events moved.
+        """
+        if not self.enabled:
+            raise RuntimeError('Event archive is not enabled (set ARCHIVE_ENABLED=true)')
+
+        from app.models import CalendarVersion
+
+        self._reserve_archived_ids()
+        horizon_days = self.horizon_days if horizon_days is None else horizon_days
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=horizon_days)
+        params = {'cutoff': cutoff, 'archived_at': now, 'batch': self.batch_size}
+
+        # Record the cutoff first: a reader that sees it while a batch is still
+        # moving just queries an archive that doesn't hold those rows yet
+        db.session.execute(_sql(
+            "INSERT INTO archive.archive_state (id, cutoff) VALUES (1, :cutoff) "
+            "ON CONFLICT(id) DO UPDATE SET cutoff = max(cutoff, excluded.cutoff)",
+            'cutoff'
+        ), params)
+        db.session.commit()
+
+        moved = 0
+        while True:
+            # start_time < cutoff lets the ix_event_start_time index bound the scan
+            db.session.execute(db.text(
+                "CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)"
+            ))
+            db.session.execute(db.text("DELETE FROM temp.archive_batch"))
+            db.session.execute(_sql(
+                "INSERT INTO temp.archive_batch (id) "
+                "SELECT id FROM main.event WHERE start_time < :cutoff AND end_time < :cutoff LIMIT :batch",
+                'cutoff'
+            ), params)
+
+            calendar_ids = [row[0] for row in db.session.execute(db.text(
+                "SELECT DISTINCT calendar_id FROM main.event WHERE id IN (SELECT id FROM temp.archive_batch)"
+            ))]
+            if not calendar_ids:
+                db.session.rollback()
+                break
+
+            db.session.execute(_sql(
+                f"INSERT INTO archive.event ({_EVENT_COLUMNS}, archived_at) "
+                f"SELECT {_EVENT_COLUMNS}, :archived_at FROM main.event "
+                "WHERE id IN (SELECT id FROM temp.archive_batch)",
+                'archived_at'
+            ), params)
+            db.session.execute(db.text(
+                "INSERT INTO archive.reminder (id, event_id, reminder_time, sent, created_at) "
+                "SELECT id, event_id, reminder_time, sent, created_at FROM main.reminder "
+                "WHERE event_id IN (SELECT id FROM temp.archive_batch)"
+            ))
+            db.session.execute(db.text(
+                "DELETE FROM main.reminder WHERE event_id IN (SELECT id FROM temp.archive_batch)"
+            ))
+            result = db.session.execute(db.text(
+                "DELETE FROM main.event WHERE id IN (SELECT id FROM temp.archive_batch)"
+            ))
+            # Bulk deletes skip the ORM listeners, so bump the month-summary versions here
+            connection = db.session.connection()
+            for calendar_id in calendar_ids:
+                CalendarVersion.bump(connection, calendar_id)
+            db.session.commit()
+            moved += result.rowcount
+
+        return moved
+
+    def _reserve_archived_ids(self):
+        """Make sure main.event never hands out an id that is (or was) archived.
+
+        Without AUTOINCREMENT SQLite assigns max(id) + 1, so once the newest events are
+        archived their ids come back for new ones. Databases created before the model
+        asked for AUTOINCREMENT get their event table rebuilt once, with its indexes
+        and search triggers, and the sequence is moved past every archived id.
+        """
+        from sqlalchemy.schema import CreateIndex, CreateTable
+        from app.models import Event
+        from app.search import _SCHEMA as SEARCH_SCHEMA
+
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'event'")
+                if 'AUTOINCREMENT' not in cursor.fetchone()[0].upper():
+                    create = str(CreateTable(Event.__table__).compile(db.engine))
+                    cursor.execute(create.replace('CREATE TABLE event ', 'CREATE TABLE main.event_autoincrement ', 1))
+                    cursor.execute(f"INSERT INTO main.event_autoincrement ({_EVENT_COLUMNS}) "
+                                   f"SELECT {_EVENT_COLUMNS} FROM main.event")
+                    cursor.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'event_fts'")
+                    indexed = cursor.fetchone() is not None
+                    # Dropping the table drops its indexes and triggers too; its rows keep their ids,
+                    # so the external-content search index stays valid
+                    cursor.execute("DROP TABLE main.event")
+                    cursor.execute("ALTER TABLE main.event_autoincrement RENAME TO event")
+                    for index in Event.__table__.indexes:
+                        cursor.execute(str(CreateIndex(index).compile(db.engine)))
+                    if indexed:
+                        for statement in SEARCH_SCHEMA:
+                            cursor.execute(statement)
+
+                cursor.execute("SELECT max(coalesce((SELECT max(id) FROM archive.event), 0), "
+                               "coalesce((SELECT max(id) FROM main.event), 0))")
+                params = {'seq': cursor.fetchone()[0]}
+                cursor.execute("UPDATE main.sqlite_sequence SET seq = :seq WHERE name = 'event' AND seq < :seq", params)
+                cursor.execute("INSERT INTO main.sqlite_sequence (name, seq) SELECT 'event', :seq "
+                               "WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = 'event')", params)
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+        finally:
+            raw.close()
+
+    def delete_calendar(self, calendar_id):
+        """Drop a deleted calendar's archived events (call inside the deleting transaction)"""
+        if not self.enabled:
+            return
+        params = {'calendar_id': calendar_id}
+        db.session.execute(db.text(
+            "DELETE FROM archive.reminder WHERE event_id IN "
+            "(SELECT id FROM archive.event WHERE calendar_id = :calendar_id)"
+        ), params)
+        db.session.execute(db.text("DELETE FROM archive.event WHERE calendar_id = :calendar_id"), params)
+
+
+event_archive = EventArchive()
@@ -0,0 +1,204 @@
+"""
+Content-hashed static asset build.
+
+`flask --app app build-assets` copies every file in static/ to
+ASSETS_BUILD_DIR under a name containing a hash of its content
+(css/style.css -> css/style.3f9a1c2b7d4e.css), writes gzip and brotli
+variants of the text files next to it, and records the mapping in
+manifest.json. It also renders the service worker with its precache list
+and cache name taken from the same hashes, so a deploy only invalidates
+the files that actually changed.
+
+When the manifest is present (and ASSETS_ENABLED), the `cache_bust` template
+filter rewrites /static/... URLs to /assets/<hashed name>, which are served
+with the precompressed variant the browser accepts and a one-year immutable
+Cache-Control.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, abort
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+SERVICE_WORKER = 'sw.js'
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt', '.html', '.map'}
+PRECACHE = {'.css', '.js', '.png', '.svg'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _write_compressed(path, data):
+    """Write .gz/.br siblings when they are actually smaller than the file"""
+    written = []
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        written.append('gzip')
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+            written.append('br')
+    return written
+
+
+def _previous_encodings(build_dir):
+    """The `encodings` of the manifest already in build_dir (empty without one)"""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f).get('encodings', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def build_assets(static_folder, build_dir, url_path='/assets', clean=False):
+    """Fingerprint and precompress static/, returning the manifest"""
+    if clean and os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir, exist_ok=True)
+
+    files = {}
+    # Old builds are left in place so pages rendered before a deploy keep loading;
+    # carry their entries over so they are still served after a restart
+    encodings = {
+        hashed: available for hashed, available in _previous_encodings(build_dir).items()
+        if os.path.exists(os.path.join(build_dir, hashed.replace('/', os.sep)))
+    }
+    for directory, _, filenames in os.walk(static_folder):
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            if logical == SERVICE_WORKER:
+                continue  # must keep a stable URL, rendered below
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(logical, hashlib.sha256(data).hexdigest()[:12])
+            target = os.path.join(build_dir, hashed.replace('/', os.sep))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                with open(target, 'wb') as f:
+                    f.write(data)
+            files[logical] = hashed
+            encodings[hashed] = (
+                _write_compressed(target, data) if os.path.splitext(logical)[1] in COMPRESSIBLE else []
+            )
+
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:12]
+    manifest = {'version': version, 'url_path': url_path, 'files': files, 'encodings': encodings}
+
+    service_worker = os.path.join(static_folder, SERVICE_WORKER)
+    if os.path.exists(service_worker):
+        with open(service_worker, encoding='utf-8') as f:
+            script = render_service_worker(f.read(), manifest)
+        with open(os.path.join(build_dir, SERVICE_WORKER), 'w', encoding='utf-8') as f:
+            f.write(script)
+
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def render_service_worker(script, manifest):
+    """Point the service worker's cache name, precache list and imports at the hashed files"""
+    url_path = manifest['url_path']
+    precache = ['/'] + [
+        f"{url_path}/{hashed}" for logical, hashed in sorted(manifest['files'].items())
+        if os.path.splitext(logical)[1] in PRECACHE
+    ]
+
+    script = re.sub(r"const CACHE_NAME = '[^']*';",
+                    f"const CACHE_NAME = 'calindar-{manifest['version']}';", script, count=1)
+    script = re.sub(r"const urlsToCache = \[.*?\];",
+                    'const urlsToCache = ' + json.dumps(precache, indent=4).replace('"', "'") + ';',
+                    script, count=1, flags=re.S)
+    return re.sub(r"'/static/([^']+)'",
+                  lambda m: f"'{url_path}/{manifest['files'][m.group(1)]}'" if m.group(1) in manifest['files'] else m.group(0),
+                  script)
+
+
+class AssetPipeline:
+    def __init__(self, app=None):
+        self.manifest = None
+        self.build_dir = None
+        self.url_path = '/assets'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.build_dir = app.config.get('ASSETS_BUILD_DIR') or os.path.join(
+            os.path.dirname(app.root_path), 'build', 'static'
+        )
+        self.url_path = app.config.get('ASSETS_URL_PATH', '/assets')
+        self.manifest = self.load_manifest() if app.config.get('ASSETS_ENABLED', True) else None
+
+        app.add_url_rule(f"{self.url_path}/<path:filename>", 'assets', self.send_asset)
+        app.add_url_rule('/sw.js', 'service_worker', self.send_service_worker)
+        app.extensions['asset_pipeline'] = self
+
+        if self.manifest:
+            app.logger.info(f"Serving {len(self.manifest['files'])} hashed assets from {self.build_dir}")
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def url_for(self, url):
+        """Hashed URL for a /static/... URL, or None when it is not in the build"""
+        if not self.manifest:
+            return None
+        prefix = current_app.static_url_path + '/'
+        hashed = self.manifest['files'].get(url[len(prefix):]) if url.startswith(prefix) else None
+        return f"{self.url_path}/{hashed}" if hashed else None
+
+    def send_asset(self, filename):
+        if not self.manifest or filename not in self.manifest['encodings']:
+            abort(404)
+
+        accepted = request.accept_encodings
+        available = self.manifest['encodings'][filename]
+        encoding = next((e for e in ('br', 'gzip') if e in available and accepted[e]), None)
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+
+        response = send_from_directory(
+            self.build_dir, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            max_age=31536000,
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    def send_service_worker(self):
+        # The worker script itself must always be revalidated so new builds are picked up
+        directory = self.build_dir if self.manifest else current_app.static_folder
+        response = send_from_directory(directory, SERVICE_WORKER, mimetype='application/javascript', max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Service-Worker-Allowed'] = '/'
+        return response
+
+
+asset_pipeline = AssetPipeline()
@@ -0,0 +1,252 @@
+"""
+Online backups of the SQLite database with the SQLite backup API.
+
+Copying calendar.db with cp can capture a half-written page and has to stop
+writers for a consistent copy. `DatabaseBackup.run()` instead copies the
+database page by page through the backup API, BACKUP_PAGES_PER_STEP pages at
+a time, sleeping between steps. Under gevent that sleep yields to the hub, so
+requests keep being served while a large database is copied. A snapshot that
+changes mid-copy is restarted by SQLite itself, so the result is always
+consistent.
+
+Each backup is checked with PRAGMA integrity_check, optionally gzipped,
+and older backups beyond BACKUP_KEEP are removed. With BACKUP_ENABLED a
+background task takes one every BACKUP_INTERVAL_HOURS; `flask backup-db`
+and `flask verify-backup` do the same by hand.
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+from flask import current_app
+from app.models import db
+
+try:
+    import gevent
+except ImportError:  # pragma: no cover - gevent is a hard dependency in production
+    gevent = None
+
+TIMESTAMP_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def _off_hub(fn, *args):
+    """Run a long, non-steppable job (integrity_check, gzip) on a native thread under gevent"""
+    if gevent is not None:
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def _sleep(seconds):
+    # The app runs gevent without monkey patching, so time.sleep would block the hub
+    if gevent is not None:
+        gevent.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def _gzip_file(source_path, target_path):
+    with open(source_path, 'rb') as plain, gzip.open(target_path, 'wb', compresslevel=6) as packed:
+        shutil.copyfileobj(plain, packed, 1024 * 1024)
+
+
+def verify_backup(path, restore_to=None):
+    """Restore a backup (plain or .gz) to a scratch file and run integrity_check on it.
+
+    Returns (ok, details). With restore_to the restored database is kept there.
+    """
+    if restore_to is None:
+        fd, target = tempfile.mkstemp(suffix='.db', prefix='calindar-verify-')
+        os.close(fd)
+    else:
+        target = restore_to
+    try:
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as source, open(target, 'wb') as restored:
+                shutil.copyfileobj(source, restored, 1024 * 1024)
+        elif os.path.abspath(path) != os.path.abspath(target):
+            shutil.copyfile(path, target)
+
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(target))}?mode=ro", uri=True)
+        try:
+            result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            tables = conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        finally:
+            conn.close()
+        return result == ['ok'], {'integrity_check': result[:10], 'tables': tables}
+    except (OSError, EOFError, sqlite3.Error) as e:
+        return False, {'error': str(e)}
+    finally:
+        if restore_to is None and os.path.exists(target):
+            os.remove(target)
+
+
+class DatabaseBackup:
+    """Takes, verifies and rotates online backups of the SQLite database files"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.interval_hours = 24
+        self.keep = 7
+        self.compress = True
+        self.pages_per_step = 256
+        self.step_sleep = 0.01
+        self.last = None
+        self._lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._worker_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['backup'] = self
+        self.directory = app.config.get('BACKUP_DIR') or os.path.join(app.instance_path, 'backups')
+        self.interval_hours = app.config.get('BACKUP_INTERVAL_HOURS', 24)
+        self.keep = app.config.get('BACKUP_KEEP', 7)
+        self.compress = app.config.get('BACKUP_COMPRESS', True)
+        self.pages_per_step = app.config.get('BACKUP_PAGES_PER_STEP', 256)
+        self.step_sleep = app.config.get('BACKUP_STEP_SLEEP_SECONDS', 0.01)
+        self.enabled = app.config.get('BACKUP_ENABLED', False)
+
+        if self.enabled:
+            @app.before_request
+            def start_backup_worker():
+                self._ensure_worker()
+
+    def sources(self):
+        """(name, path) of every database file to back up: the main one and, if enabled, the archive and shards"""
+        from app.archive import event_archive
+        from app.shards import shard_router
+
+        main_path = db.engine.url.database
+        if db.engine.dialect.name != 'sqlite' or not main_path or main_path == ':memory:':
+            return []
+        sources = [(os.path.splitext(os.path.basename(main_path))[0], main_path)]
+        if event_archive.enabled and os.path.exists(event_archive.path):
+            sources.append((os.path.splitext(os.path.basename(event_archive.path))[0], event_archive.path))
+        sources += [(os.path.splitext(os.path.basename(path))[0], path) for path in shard_router.paths if os.path.exists(path)]
+        return sources
+
+    def run(self, compress=None, verify=True):
+        """Back up every source, returning one result dict per file"""
+        compress = self.compress if compress is None else compress
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+
+        with self._lock:
+            results = [self._backup_file(name, path, stamp, compress, verify) for name, path in self.sources()]
+        self.last = {'finished_at': datetime.utcnow().isoformat(), 'files': results}
+        return results
+
+    def _backup_file(self, name, path, stamp, compress, verify):
+        started = time.perf_counter()
+        final = os.path.join(self.directory, f"{name}-{stamp}.db" + ('.gz' if compress else ''))
+        partial = os.path.join(self.directory, f".{name}-{stamp}.db.partial")
+        steps = 0
+
+        def pause(status, remaining, total):
+            nonlocal steps
+            steps += 1
+            # Yield to the hub: other greenlets run between steps
+            _sleep(self.step_sleep)
+
+        try:
+            source = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, timeout=30)
+            target = sqlite3.connect(partial)
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=pause)
+            finally:
+                target.close()
+                source.close()
+
+            details = None
+            if verify:
+                ok, details = _off_hub(verify_backup, partial)
+                if not ok:
+                    raise RuntimeError(f"integrity check failed: {details}")
+
+            if compress:
+                _off_hub(_gzip_file, partial, final + '.partial')
+                os.remove(partial)
+                os.replace(final + '.partial', final)
+            else:
+                os.replace(partial, final)
+        except Exception as e:
+            for leftover in (partial, final + '.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            current_app.logger.error(f"Backup of {path} failed: {e}")
+            return {'source': path, 'ok': False, 'error': str(e)}
+
+        removed = self.rotate(name)
+        return {
+            'source': path,
+            'ok': True,
+            'path': final,
+            'bytes': os.path.getsize(final),
+            'seconds': round(time.perf_counter() - started, 3),
+            'steps': steps,
+            'verified': details,
+            'rotated': removed,
+        }
+
+    def backups(self, name):
+        """Existing backups of one source, newest first (timestamps sort lexically)"""
+        pattern = os.path.join(self.directory, f"{glob.escape(name)}-*.db")
+        return sorted(glob.glob(pattern) + glob.glob(pattern + '.gz'), reverse=True)
+
+    def rotate(self, name):
+        """Delete all but the newest BACKUP_KEEP backups of one source"""
+        removed = []
+        for old in self.backups(name)[self.keep:]:
+            os.remove(old)
+            removed.append(os.path.basename(old))
+        return removed
+
+    # Scheduled backups
+
+    def _ensure_worker(self):
+        if self._worker_started:
+            return
+        with self._worker_lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        from app import socketio
+        socketio.start_background_task(self._run, current_app._get_current_object())
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    if self._due():
+                        self.run()
+                except Exception as e:
+                    app.logger.error(f"Scheduled backup failed: {e}")
+            _sleep(60)
+
+    def _due(self):
+        """Whether the newest backup of the main database is older than the interval"""
+        sources = self.sources()
+        if not sources:
+            return False
+        existing = self.backups(sources[0][0])
+        if not existing:
+            return True
+        stamp = os.path.basename(existing[0])[len(sources[0][0]) + 1:].split('.')[0]
+        taken = datetime.strptime(stamp, TIMESTAMP_FORMAT)
+        return (datetime.utcnow() - taken).total_seconds() >= self.interval_hours * 3600
+
+    def stats(self):
+        """Last backup outcome for health checks"""
+        return {'enabled': self.enabled, 'directory': self.directory, 'last': self.last}
+
+
+database_backup = DatabaseBackup()
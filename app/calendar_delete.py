@@ -0,0 +1,134 @@
+"""
+Set-based calendar deletion.
+
+Deleting a calendar through the ORM loads every event, reminder and
+membership into the session and deletes them row by row. `CalendarDeleter`
+issues plain DELETE statements instead: small calendars (up to
+CALENDAR_DELETE_INLINE_EVENTS events) go in one transaction inside the
+request. Larger ones are first hidden in a short transaction (memberships
+dropped, share code replaced by a `~` tombstone so nobody can join or open
+it) and a 'calendar.purge' job is queued in the same transaction. The job
+deletes their events with their reminders, and their change-log entries, in
+batches of CALENDAR_DELETE_BATCH_SIZE, one transaction each, so the write
+lock is only ever held briefly. The calendar row goes last, keeping its id
+from being handed out again while events still point at it. Being a
+durable job (see app/jobs.py), a purge interrupted by a restart is resumed
+by the next process. With calendar shards (see app/shards.py) both run on a
+connection to the calendar's shard, so its core rows (memberships, the
+calendar) are deleted in the same transaction as its events.
+"""
+
+import secrets
+from app.db_pool import run_db
+from app.jobs import job_queue
+from app.models import db, Calendar, CalendarShard, CalendarVersion, Event, EventChange, Reminder, UserCalendar
+from app.shards import shard_router
+
+TOMBSTONE_PREFIX = '~'
+
+
+def _delete(model, *criteria):
+    # synchronize_session=False: nothing deleted here is loaded in the session
+    return db.session.execute(db.delete(model).where(*criteria).execution_options(synchronize_session=False))
+
+
+def _tombstone_code():
+    # share codes are upper-case letters and digits, so this can never be typed in to join
+    return TOMBSTONE_PREFIX + secrets.token_hex(8)
+
+
+class CalendarDeleter:
+    """Deletes calendars with set-based statements, large ones in background batches"""
+
+    def __init__(self, app=None):
+        self.inline_events = 1000
+        self.batch_size = 500
+        self.pause = 0.05
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['calendar_deleter'] = self
+        self.inline_events = app.config.get('CALENDAR_DELETE_INLINE_EVENTS', 1000)
+        self.batch_size = app.config.get('CALENDAR_DELETE_BATCH_SIZE', 500)
+        self.pause = app.config.get('CALENDAR_DELETE_PAUSE_SECONDS', 0.05)
+
+    def delete(self, calendar_id, user_id=None):
+        """Delete a calendar and everything in it; returns None when done, else the queued purge job"""
+        from app.archive import event_archive
+
+        with shard_router.calendar(calendar_id):
+            count = db.session.execute(
+                db.select(db.func.count()).select_from(Event).where(Event.calendar_id == calendar_id)
+            ).scalar()
+            if count <= self.inline_events:
+                self._delete_rows(calendar_id)
+                event_archive.delete_calendar(calendar_id)
+                db.session.commit()
+                return None
+
+            _delete(UserCalendar, UserCalendar.calendar_id == calendar_id)
+            db.session.execute(
+                db.update(Calendar).where(Calendar.id == calendar_id).values(share_code=_tombstone_code())
+            )
+            # Queued in the same transaction, so a hidden calendar always has a purge on its way
+            job = job_queue.enqueue('calendar.purge', {'calendar_id': calendar_id}, user_id=user_id, commit=False)
+            db.session.commit()
+        job_queue.dispatch(job)
+        return job
+
+    def _delete_rows(self, calendar_id):
+        """Every row of one calendar in the main database, as a handful of DELETEs"""
+        calendar_events = db.select(Event.id).where(Event.calendar_id == calendar_id)
+        _delete(Reminder, Reminder.event_id.in_(calendar_events))
+        _delete(Event, Event.calendar_id == calendar_id)
+        _delete(EventChange, EventChange.calendar_id == calendar_id)
+        _delete(CalendarVersion, CalendarVersion.calendar_id == calendar_id)
+        _delete(UserCalendar, UserCalendar.calendar_id == calendar_id)
+        _delete(CalendarShard, CalendarShard.calendar_id == calendar_id)
+        _delete(Calendar, Calendar.id == calendar_id)
+
+    def purge(self, calendar_id):
+        """Delete a tombstoned calendar's rows in short batches, then the calendar itself"""
+        from app import socketio
+
+        # Each batch runs on the DB pool; the pause between them yields this greenlet,
+        # so requests get the write lock between batches
+        for model in (Event, EventChange):
+            while run_db(self._purge_batch, calendar_id, model):
+                socketio.sleep(self.pause)
+        run_db(self._purge_rest, calendar_id)
+
+    def _purge_batch(self, calendar_id, model):
+        """Delete one batch of a calendar's events (with reminders) or change-log rows; False once none are left"""
+        with shard_router.calendar(calendar_id):
+            # For events, ix_event_calendar_start finds the next batch without scanning deleted ground
+            ids = db.session.execute(
+                db.select(model.id).where(model.calendar_id == calendar_id).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return False
+            if model is Event:
+                _delete(Reminder, Reminder.event_id.in_(ids))
+            _delete(model, model.id.in_(ids))
+            db.session.commit()
+            return True
+
+    def _purge_rest(self, calendar_id):
+        """The calendar's remaining rows, its archived events and the calendar itself"""
+        from app.archive import event_archive
+
+        with shard_router.calendar(calendar_id):
+            self._delete_rows(calendar_id)
+            event_archive.delete_calendar(calendar_id)
+            db.session.commit()
+
+
+calendar_deleter = CalendarDeleter()
+
+
+@job_queue.handler('calendar.purge', lane='low', max_attempts=5)
+def purge_calendar_job(payload):
+    # Safe to run again after a crash or retry: every step deletes what is left
+    calendar_deleter.purge(payload['calendar_id'])
+    return {'calendar_id': payload['calendar_id']}
@@ -0,0 +1,202 @@
+"""
+Maintenance commands, run with `flask --app app <command>`
+"""
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Create the full-text search index if needed and re-index every event"""
+    from app.search import ensure_search_index, rebuild_search_index
+    from app.shards import shard_router
+
+    # Each shard has its own index over its own events
+    for _ in shard_router.each_shard():
+        if not ensure_search_index():
+            raise click.ClickException('This database does not support FTS5 full-text search')
+        rebuild_search_index()
+    click.echo('Search index rebuilt')
+
+
+@click.command('archive-events')
+@click.option('--days', type=int, default=None, help='Archive events that ended this many days ago (default ARCHIVE_HORIZON_DAYS)')
+@with_appcontext
+def archive_events_command(days):
+    """Move old events and their reminders into the archive database"""
+    from app.archive import event_archive
+    from app.models import db
+
+    if not event_archive.enabled:
+        raise click.ClickException('Event archive is not enabled (set ARCHIVE_ENABLED=true)')
+    # Archiving bumps calendar_version, which older databases may not have yet
+    db.create_all()
+    moved = event_archive.archive_events(horizon_days=days)
+    click.echo(f'Archived {moved} events into {event_archive.path}')
+
+
+@click.command('prune-event-changes')
+@click.option('--days', type=int, default=30, show_default=True, help='Keep change-log entries newer than this many days')
+@with_appcontext
+def prune_event_changes_command(days):
+    """Trim the event change log used by offline delta sync"""
+    from datetime import datetime, timedelta
+    from app.models import EventChange
+    from app.shards import shard_router
+
+    pruned = sum(EventChange.prune(datetime.utcnow() - timedelta(days=days)) for _ in shard_router.each_shard())
+    click.echo(f'Pruned {pruned} change-log entries; clients older than {days} days will do a full reload')
+
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True, help='Remove earlier builds instead of keeping their hashed files')
+@with_appcontext
+def build_assets_command(clean):
+    """Fingerprint and precompress static files and render the service worker"""
+    from flask import current_app
+    from app.assets import asset_pipeline, build_assets, brotli
+
+    manifest = build_assets(current_app.static_folder, asset_pipeline.build_dir,
+                            url_path=asset_pipeline.url_path, clean=clean)
+    encodings = 'gzip and brotli' if brotli is not None else 'gzip (install brotli for .br files)'
+    click.echo(f"Built {len(manifest['files'])} assets (version {manifest['version']}, {encodings}) "
+               f"into {asset_pipeline.build_dir}")
+
+
+@click.command('backup-db')
+@click.option('--compress/--no-compress', default=None, help='Gzip the backup (default BACKUP_COMPRESS)')
+@click.option('--verify/--no-verify', default=True, show_default=True, help='Run integrity_check on the copy')
+@with_appcontext
+def backup_db_command(compress, verify):
+    """Take an online backup of the database with the SQLite backup API"""
+    from app.backup import database_backup
+
+    results = database_backup.run(compress=compress, verify=verify)
+    if not results:
+        raise click.ClickException('Backups need a file-based SQLite database')
+    for result in results:
+        if not result['ok']:
+            raise click.ClickException(f"Backup of {result['source']} failed: {result['error']}")
+        click.echo(f"Backed up {result['source']} to {result['path']} ({result['bytes']} bytes, "
+                   f"{result['steps']} steps, {result['seconds']}s); removed {len(result['rotated'])} old backups")
+
+
+@click.command('verify-backup')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--restore-to', type=click.Path(dir_okay=False), help='Keep the restored database at this path')
+def verify_backup_command(path, restore_to):
+    """Restore a backup to a scratch file and run integrity_check on it"""
+    from app.backup import verify_backup
+
+    ok, details = verify_backup(path, restore_to=restore_to)
+    if not ok:
+        raise click.ClickException(f'{path} failed verification: {details}')
+    click.echo(f"{path} is intact ({details['tables']} tables)" + (f", restored to {restore_to}" if restore_to else ''))
+
+
+@click.command('export-user')
+@click.argument('username')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Archive file (default <username>.<format>[.gz])')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'msgpack']), default='ndjson', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the archive')
+@with_appcontext
+def export_user_command(username, output, fmt, compress):
+    """Export a user's calendars, memberships, events and reminders to an archive file"""
+    import gzip
+    from app.data_transfer import export_user, FORMATS
+    from app.models import User
+
+    if fmt not in FORMATS:
+        raise click.ClickException(f'{fmt} archives need the {fmt} package')
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    output = output or f"{username}.{fmt}" + ('.gz' if compress else '')
+
+    written = 0
+    with (gzip.open(output, 'wb', compresslevel=6) if compress else open(output, 'wb')) as f:
+        for chunk in export_user(user.id, fmt):
+            f.write(chunk)
+            written += len(chunk)
+    click.echo(f"Exported {username} to {output} ({written} bytes{' before compression' if compress else ''})")
+
+
+@click.command('import-user')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--as', 'username', required=True, help='Local user who becomes the archive owner')
+@with_appcontext
+def import_user_command(path, username):
+    """Import an archive written by export-user as new calendars of a local user"""
+    from app.data_transfer import import_user, read_records, ArchiveError
+    from app.models import User
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    try:
+        with open(path, 'rb') as f:
+            counts = import_user(read_records(f), user.id)
+    except ArchiveError as e:
+        raise click.ClickException(f'{path}: {e}')
+    click.echo('Imported ' + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+
+
+@click.command('rebalance-shards')
+@click.option('--calendar', 'calendar_id', type=int, help='Move only this calendar (with --to)')
+@click.option('--to', 'target', type=int, help='Shard to move --calendar to')
+@click.option('--tolerance', type=float, default=0.1, show_default=True,
+              help='Stop once every shard is within this fraction of the mean event count')
+@click.option('--grace', type=float, default=5.0, show_default=True,
+              help='Seconds to wait before moving rows written to old shards during the moves')
+@click.option('--dry-run', is_flag=True, help='Print the planned moves without moving anything')
+@with_appcontext
+def rebalance_shards_command(calendar_id, target, tolerance, grace, dry_run):
+    """Move events out of the main database into shards and even out shard sizes"""
+    from app.main.routes import init_db_if_needed
+    from app.shards import shard_router, plan_rebalance, CORE
+
+    if not shard_router.enabled:
+        raise click.ClickException('Sharding is not enabled (set SHARDING_ENABLED=true)')
+    if (calendar_id is None) != (target is None):
+        raise click.ClickException('--calendar and --to go together')
+    if target is not None and not 0 <= target < shard_router.count:
+        raise click.ClickException(f'--to must be a shard between 0 and {shard_router.count - 1}')
+    init_db_if_needed()
+
+    # Rows from before sharding was turned on go to their calendar's shard first
+    legacy = shard_router.legacy_calendars()
+    moves = [(legacy_id, CORE, shard_router.shard_for(legacy_id)) for legacy_id in legacy]
+    if calendar_id is not None and shard_router.shard_for(calendar_id) != target:
+        moves.append((calendar_id, shard_router.shard_for(calendar_id), target))
+    else:
+        sizes = shard_router.calendar_sizes()
+        for legacy_id, _, shard in moves:
+            sizes[shard][legacy_id] = sizes[shard].get(legacy_id, 0) + legacy[legacy_id]
+        moves += plan_rebalance(sizes, tolerance)
+
+    for moved_id, source, shard in moves:
+        click.echo(f"Calendar {moved_id}: {'main database' if source == CORE else f'shard {source}'} -> shard {shard}")
+        if not dry_run:
+            events = shard_router.move_calendar(moved_id, shard, source=source)
+            click.echo(f"  moved {events} events")
+    if dry_run or not moves:
+        click.echo('Nothing moved' if not moves else f'{len(moves)} moves planned')
+        return
+
+    swept = shard_router.sweep([(moved_id, source) for moved_id, source, _ in moves], grace)
+    click.echo(f"Moved {len(moves)} calendars; {swept} events written during the moves followed them")
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(archive_events_command)
+    app.cli.add_command(prune_event_changes_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(backup_db_command)
+    app.cli.add_command(verify_backup_command)
+    app.cli.add_command(export_user_command)
+    app.cli.add_command(import_user_command)
+    app.cli.add_command(rebalance_shards_command)
@@ -0,0 +1,163 @@
+"""
+Response compression for JSON API payloads.
+
+Compresses /api responses with the best encoding the client accepts (brotli
+and zstd when their packages are installed, gzip always). Bodies smaller
+than COMPRESS_MIN_SIZE are left alone since the framing overhead outweighs
+the savings. Streamed responses are compressed chunk by chunk with a sync
+flush after each one, so clients still receive rows as they are produced.
+"""
+
+import time
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+stats = {'responses': 0, 'skipped_small': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0}
+
+
+def available_encodings():
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.insert(0, 'br')
+    if zstandard is not None:
+        encodings.insert(0, 'zstd')
+    return encodings
+
+
+class _Compressor:
+    """Incremental compressor with the same interface for every encoding"""
+
+    def __init__(self, encoding, config):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=config.get('COMPRESS_BROTLI_QUALITY', 4))
+        elif encoding == 'zstd':
+            self._zstd = zstandard.ZstdCompressor(level=config.get('COMPRESS_ZSTD_LEVEL', 3)).compressobj()
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(config.get('COMPRESS_GZIP_LEVEL', 6), zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=True):
+        """Compress a chunk; flush=True makes it decodable on arrival (for streaming)"""
+        if self.encoding == 'br':
+            return self._brotli.process(data) + (self._brotli.flush() if flush else b'')
+        if self.encoding == 'zstd':
+            return self._zstd.compress(data) + (self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else b'')
+        return self._zlib.compress(data) + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b'')
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        if self.encoding == 'zstd':
+            return self._zstd.flush()
+        return self._zlib.flush()
+
+
+def compress_bytes(data, encoding, config=None):
+    """Compress a whole body in one go (also used by the benchmark)"""
+    compressor = _Compressor(encoding, config or {})
+    return compressor.compress(data, flush=False) + compressor.finish()
+
+
+def choose_encoding(accept_encodings, offered):
+    """Pick the client's highest-q encoding, preferring the server's order on ties"""
+    best, best_q = None, 0
+    for encoding in offered:
+        q = accept_encodings[encoding]
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            started = time.process_time()
+            data = compressor.compress(chunk)
+            stats['cpu_ms'] += (time.process_time() - started) * 1000
+            stats['bytes_in'] += len(chunk)
+            stats['bytes_out'] += len(data)
+            if data:
+                yield data
+    tail = compressor.finish()
+    stats['bytes_out'] += len(tail)
+    if tail:
+        yield tail
+
+
+def init_app(app):
+    """Register the compression hook for API responses"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    prefixes = tuple(app.config.get('COMPRESS_PATH_PREFIXES', ('/api/',)))
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    offered = [
+        encoding for encoding in app.config.get('COMPRESS_ALGORITHMS', ('zstd', 'br', 'gzip'))
+        if encoding in available_encodings()
+    ]
+
+    @app.after_request
+    def compress_response(response):
+        if not request.path.startswith(prefixes) or not _compressible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings, offered)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, _Compressor(encoding, app.config))
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < min_size:
+                stats['skipped_small'] += 1
+                return response
+            started = time.process_time()
+            compressed = compress_bytes(body, encoding, app.config)
+            stats['cpu_ms'] += (time.process_time() - started) * 1000
+            stats['bytes_in'] += len(body)
+            stats['bytes_out'] += len(compressed)
+            response.set_data(compressed)
+
+        stats['responses'] += 1
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag describes the uncompressed bytes
+        if response.headers.get('ETag', '').startswith('"'):
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
+
+
+def get_stats():
+    saved = stats['bytes_in'] - stats['bytes_out']
+    return {
+        **stats,
+        'cpu_ms': round(stats['cpu_ms'], 1),
+        'saved_ratio': round(saved / stats['bytes_in'], 3) if stats['bytes_in'] else None,
+        'encodings': available_encodings(),
+    }
@@ -0,0 +1,449 @@
+"""
+Per-user data export and import.
+
+`export_user(user_id)` streams everything needed to move a user's calendars
+to another instance: the calendars they belong to, every member's username
+and membership, the events (archived ones included) and their reminders.
+Rows are read in keyset pages of BATCH_SIZE, each on the DB pool (see
+app/db_pool.py), so memory stays flat however many years of history a
+calendar holds and a long export never blocks the gevent hub. The archive is
+a sequence of records, parents before children, written as NDJSON lines or
+as a stream of msgpack maps:
+
+    {"type": "header", "version": 1, "user": 7, "exported_at": "..."}
+    {"type": "user", "id": 7, "username": "alice"}
+    {"type": "calendar", "id": 3, "name": "Team", "share_code": "...", ...}
+    {"type": "membership", "user_id": 7, "calendar_id": 3, ...}
+    {"type": "event", "id": 41, "calendar_id": 3, ..., "archived": false}
+    {"type": "reminder", "event_id": 41, "archived": false, ...}
+    {"type": "footer", "counts": {...}}
+
+`import_user(records, user_id)` reads an archive back record by record and
+writes it with chunked executemany inserts, remapping every id: the
+exporting user becomes `user_id`, calendars get new ids, and a new share
+code when theirs is taken. Other members are left out: an archive is
+untrusted input, so its usernames never bind to local accounts, and the
+importer's copies start with the importer as their only member and owner.
+The inserts are Core statements, so they skip the Event mapper listeners:
+imported calendars start without change-log entries, like any new calendar.
+With calendar shards (see app/shards.py) events and reminders are read from
+and written to the shard of their calendar, with ids reserved from the
+shard-wide sequences.
+
+Both also run as 'user.export' / 'user.import' jobs (see app/jobs.py), which
+is how the API serves them to clients.
+"""
+
+import gzip
+import io
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from app.db_pool import run_db
+from app.jobs import job_queue, PermanentJobError
+from app.models import db, Calendar, Event, Reminder, User, UserCalendar
+from app.shards import shard_router
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_VERSION = 1
+FORMATS = ('ndjson', 'msgpack') if msgpack is not None else ('ndjson',)
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'msgpack': 'application/x-msgpack'}
+BATCH_SIZE = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_DATETIME_FIELDS = {
+    'user': (),
+    'calendar': ('created_at',),
+    'membership': ('joined_at',),
+    'event': ('start_time', 'end_time', 'created_at', 'updated_at'),
+    'reminder': ('reminder_time', 'created_at'),
+}
+_ORDER = ('user', 'calendar', 'membership', 'event', 'reminder')
+
+_ARCHIVED_EVENTS = (
+    "SELECT id AS _key, id, title, description, start_time, end_time, all_day, reminder_minutes, "
+    "created_at, updated_at, calendar_id FROM archive.event "
+    "WHERE calendar_id IN (SELECT calendar_id FROM main.user_calendar WHERE user_id = :user_id) "
+    "AND id > :after ORDER BY id LIMIT :limit"
+)
+_ARCHIVED_REMINDERS = (
+    "SELECT r.id AS _key, r.event_id, r.reminder_time, r.sent, r.created_at "
+    "FROM archive.reminder r JOIN archive.event e ON e.id = r.event_id "
+    "WHERE e.calendar_id IN (SELECT calendar_id FROM main.user_calendar WHERE user_id = :user_id) "
+    "AND r.id > :after ORDER BY r.id LIMIT :limit"
+)
+
+
+class ArchiveError(ValueError):
+    """The uploaded archive is not a calindar export this version can read"""
+
+
+# Export
+
+def _member_calendars(user_id):
+    return db.select(UserCalendar.calendar_id).where(UserCalendar.user_id == user_id)
+
+
+def _keyset(statement, key):
+    """Page a select on a unique, positive `key` column: rows past :after, :limit at a time"""
+    return statement.add_columns(key.label('_key')).where(key > db.bindparam('after')) \
+        .order_by(key).limit(db.bindparam('limit'))
+
+
+def _page(statement, shard, params):
+    with shard_router.shard(shard):
+        return [dict(row) for row in db.session.execute(statement, {**params, 'limit': BATCH_SIZE}).mappings()]
+
+
+def _rows(statement, shard=None, params=None):
+    """Stream result rows as dicts, one page of BATCH_SIZE per run_db call.
+
+    Statements select and order by a unique `_key` (see _keyset), so every page
+    runs on the DB pool in its own session instead of holding a cursor open on
+    the caller's greenlet for the whole stream.
+    """
+    after = 0
+    while True:
+        rows = run_db(_page, statement, shard, {**(params or {}), 'after': after})
+        for row in rows:
+            after = row.pop('_key')
+            yield row
+        if len(rows) < BATCH_SIZE:
+            return
+
+
+def iter_records(user_id):
+    """Archive records for every calendar the user belongs to, parents first"""
+    from app.archive import event_archive
+
+    calendar_ids = _member_calendars(user_id)
+    counts = dict.fromkeys(_ORDER, 0)
+
+    def emit(kind, rows, **extra):
+        for row in rows:
+            counts[kind] += 1
+            yield {'type': kind, **row, **extra}
+
+    yield {'type': 'header', 'version': FORMAT_VERSION, 'user': user_id,
+           'exported_at': datetime.utcnow().isoformat()}
+
+    member_ids = db.select(UserCalendar.user_id).where(UserCalendar.calendar_id.in_(calendar_ids))
+    yield from emit('user', _rows(_keyset(
+        db.select(User.id, User.username).where(User.id.in_(member_ids)), User.id
+    )))
+    yield from emit('calendar', _rows(_keyset(
+        db.select(Calendar.id, Calendar.name, Calendar.share_code, Calendar.created_at)
+        .where(Calendar.id.in_(calendar_ids)), Calendar.id
+    )))
+    yield from emit('membership', _rows(_keyset(
+        db.select(UserCalendar.user_id, UserCalendar.calendar_id, UserCalendar.joined_at, UserCalendar.is_owner)
+        .where(UserCalendar.calendar_id.in_(calendar_ids)), UserCalendar.id
+    )))
+
+    # Events of every shard before any reminders: the importer expects parents first
+    shards = defaultdict(list)
+    for calendar_id, index in run_db(_placement, calendar_ids).items():
+        shards[index].append(calendar_id)
+    for index, ids in shards.items():
+        yield from emit('event', _rows(_keyset(
+            db.select(Event.id, Event.title, Event.description, Event.start_time, Event.end_time, Event.all_day,
+                      Event.reminder_minutes, Event.created_at, Event.updated_at, Event.calendar_id)
+            .where(Event.calendar_id.in_(ids)), Event.id
+        ), index), archived=False)
+    if event_archive.enabled:
+        # Records carry which table they came from; the importer maps both kinds to new ids
+        yield from emit('event', _rows(db.text(_ARCHIVED_EVENTS).columns(
+            start_time=db.DateTime, end_time=db.DateTime, created_at=db.DateTime,
+            updated_at=db.DateTime, all_day=db.Boolean
+        ), params={'user_id': user_id}), archived=True)
+
+    for index, ids in shards.items():
+        yield from emit('reminder', _rows(_keyset(
+            db.select(Reminder.event_id, Reminder.reminder_time, Reminder.sent, Reminder.created_at)
+            .join(Event, Event.id == Reminder.event_id)
+            .where(Event.calendar_id.in_(ids)), Reminder.id
+        ), index), archived=False)
+    if event_archive.enabled:
+        yield from emit('reminder', _rows(db.text(_ARCHIVED_REMINDERS).columns(
+            reminder_time=db.DateTime, created_at=db.DateTime, sent=db.Boolean
+        ), params={'user_id': user_id}), archived=True)
+
+    yield {'type': 'footer', 'counts': counts}
+
+
+def _placement(calendar_ids):
+    """{calendar_id: shard index} of the calendars a select returns"""
+    return shard_router.placement(db.session.execute(calendar_ids).scalars().all())
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def encode_records(records, format='ndjson'):
+    """Serialise records into byte chunks of roughly STREAM_CHUNK_BYTES"""
+    if format == 'msgpack':
+        if msgpack is None:
+            raise ArchiveError('msgpack archives need the msgpack package')
+        pack = msgpack.Packer(default=_default).pack
+    else:
+        def pack(record):
+            return (json.dumps(record, default=_default, separators=(',', ':')) + '\n').encode('utf-8')
+
+    buffer = bytearray()
+    for record in records:
+        buffer += pack(record)
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def export_user(user_id, format='ndjson'):
+    """Stream a user's archive as bytes in the given format"""
+    return encode_records(iter_records(user_id), format)
+
+
+# Import
+
+def read_records(stream):
+    """Records of an archive file object: NDJSON or msgpack, either optionally gzipped"""
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    first = stream.peek(1)[:1]
+    if not first:
+        raise ArchiveError('Archive is empty')
+    if first == b'{':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ArchiveError(f'Invalid NDJSON record: {e}')
+    elif msgpack is None:
+        raise ArchiveError('msgpack archives need the msgpack package')
+    else:
+        try:
+            yield from msgpack.Unpacker(stream, raw=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise ArchiveError(f'Invalid msgpack record: {e}')
+
+
+class _Importer:
+    """Buffers records per type and inserts them in chunks, remapping ids"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.owner = None
+        self.finished = False
+        self.kind = None
+        self.pending = []
+        self.users = {}
+        self.calendars = {}
+        self.events = {}
+        self.event_calendars = {}
+        self.memberships = set()
+        self.skipped_users = set()
+        self.counts = dict.fromkeys(_ORDER, 0)
+        self.counts['members_skipped'] = 0
+        self.counts['share_codes_changed'] = 0
+
+    def add(self, record):
+        if not isinstance(record, dict):
+            raise ArchiveError('Archive records must be objects')
+        kind = record.get('type')
+        if kind == 'header':
+            if record.get('version') != FORMAT_VERSION:
+                raise ArchiveError(f"Unsupported archive version {record.get('version')}")
+            self.owner = record.get('user')
+            return
+        if self.owner is None:
+            raise ArchiveError('Archive does not start with a header')
+        if kind == 'footer':
+            self.flush()
+            self.finished = True
+            return
+        if kind not in _ORDER:
+            raise ArchiveError(f'Unknown record type {kind!r}')
+
+        if kind != self.kind:
+            self.flush()
+            if self.kind and _ORDER.index(kind) < _ORDER.index(self.kind):
+                raise ArchiveError(f'{kind} records must come before {self.kind} records')
+            self.kind = kind
+        try:
+            for field in _DATETIME_FIELDS[kind]:
+                if record.get(field):
+                    record[field] = datetime.fromisoformat(record[field])
+        except (TypeError, ValueError) as e:
+            raise ArchiveError(f'Invalid {kind} record: {e}')
+        self.pending.append(record)
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        try:
+            getattr(self, f'_insert_{self.kind}s')(rows)
+        except KeyError as e:
+            raise ArchiveError(f'{self.kind} record refers to unknown id {e}')
+        self.counts[self.kind] += len(rows)
+
+    def _insert_users(self, rows):
+        # Only the exporting user is carried over; matching other members by username would
+        # let an edited archive add any local account to the importer's calendars
+        for row in rows:
+            if row['id'] == self.owner:
+                self.users[row['id']] = self.user_id
+            else:
+                self.skipped_users.add(row['id'])
+
+    def _insert_calendars(self, rows):
+        codes = {row['share_code'] for row in rows}
+        taken = set(db.session.execute(
+            db.select(Calendar.share_code).where(Calendar.share_code.in_(codes))
+        ).scalars())
+        for row in rows:
+            if row['share_code'] in taken:
+                code = Calendar.generate_share_code()
+                while code in codes:
+                    code = Calendar.generate_share_code()
+                codes.add(code)
+                row['share_code'] = code
+                self.counts['share_codes_changed'] += 1
+
+        inserted = dict(db.session.execute(
+            Calendar.__table__.insert().returning(Calendar.__table__.c.share_code, Calendar.__table__.c.id),
+            [{'name': row['name'], 'share_code': row['share_code'],
+              'created_at': row.get('created_at') or datetime.utcnow()} for row in rows]
+        ).all())
+        self.calendars.update((row['id'], inserted[row['share_code']]) for row in rows)
+
+    def _insert_memberships(self, rows):
+        values = []
+        for row in rows:
+            if row['user_id'] in self.skipped_users:
+                self.counts['members_skipped'] += 1
+                continue
+            key = (self.users[row['user_id']], self.calendars[row['calendar_id']])
+            if key in self.memberships:
+                continue
+            self.memberships.add(key)
+            # The importer is the copy's only member, so they own it whatever the archive says
+            values.append({'user_id': key[0], 'calendar_id': key[1], 'is_owner': True,
+                           'joined_at': row.get('joined_at') or datetime.utcnow()})
+        if values:
+            db.session.execute(UserCalendar.__table__.insert(), values)
+
+    def _insert_events(self, rows):
+        # Events have no unique column to match RETURNING rows against, and SQLite can only
+        # return them in order one row per statement. The calendar inserts already hold the
+        # database write lock, so ids are handed out here and inserted in one executemany.
+        if shard_router.enabled:
+            first_id = shard_router.reserve_ids('event', len(rows))
+        else:
+            # Past the AUTOINCREMENT sequence too: it covers ids that moved to the event archive
+            first_id = db.session.execute(db.text(
+                "SELECT max(coalesce((SELECT max(id) FROM event), 0), "
+                "coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'event'), 0)) + 1"
+            )).scalar()
+        values = [{
+            'id': first_id + offset,
+            'title': row['title'],
+            'description': row.get('description'),
+            'start_time': row['start_time'],
+            'end_time': row['end_time'],
+            'all_day': bool(row.get('all_day')),
+            'reminder_minutes': row.get('reminder_minutes'),
+            'created_at': row.get('created_at') or datetime.utcnow(),
+            'updated_at': row.get('updated_at') or datetime.utcnow(),
+            'calendar_id': self.calendars[row['calendar_id']],
+        } for offset, row in enumerate(rows)]
+        self._insert_sharded(Event.__table__, values, [value['calendar_id'] for value in values])
+        self.events.update(((bool(row.get('archived')), row['id']), value['id']) for row, value in zip(rows, values))
+        self.event_calendars.update((value['id'], value['calendar_id']) for value in values)
+
+    def _insert_reminders(self, rows):
+        values = [{
+            'event_id': self.events[(bool(row.get('archived')), row['event_id'])],
+            'reminder_time': row['reminder_time'],
+            'sent': bool(row.get('sent')),
+            'created_at': row.get('created_at') or datetime.utcnow(),
+        } for row in rows]
+        if shard_router.enabled:
+            first_id = shard_router.reserve_ids('reminder', len(values))
+            for offset, value in enumerate(values):
+                value['id'] = first_id + offset
+        self._insert_sharded(Reminder.__table__, values, [self.event_calendars[value['event_id']] for value in values])
+
+    def _insert_sharded(self, table, values, calendar_ids):
+        """Insert each row into the shard of its calendar (all at once without sharding)"""
+        placement = shard_router.placement(calendar_ids)
+        groups = defaultdict(list)
+        for value, calendar_id in zip(values, calendar_ids):
+            groups[placement[calendar_id]].append(value)
+        for index, group in groups.items():
+            with shard_router.shard(index):
+                db.session.execute(table.insert(), group)
+
+
+def import_user(records, user_id):
+    """Import archive records as new calendars of user_id in one transaction, returning counts"""
+    importer = _Importer(user_id)
+    try:
+        for record in records:
+            importer.add(record)
+        if not importer.finished:
+            raise ArchiveError('Archive is truncated (no footer record)')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return importer.counts
+
+
+# Background jobs (see app/jobs.py)
+
+@job_queue.handler('user.export')
+def export_user_job(payload):
+    fmt = payload.get('format', 'ndjson')
+    path = job_queue.file_path(f'.{fmt}.gz')
+    written = 0
+    # export_user reads each page on the DB pool
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        for chunk in export_user(payload['user_id'], fmt):
+            f.write(chunk)
+            written += len(chunk)
+    return {'file': path, 'format': fmt, 'bytes': written, 'gzip_bytes': os.path.getsize(path)}
+
+
+@job_queue.handler('user.import')
+def import_user_job(payload):
+    from app.upcoming_window import upcoming_window
+
+    try:
+        counts = run_db(_import_file, payload['file'], payload['user_id'])
+    except ArchiveError as e:
+        raise PermanentJobError(str(e))
+    os.remove(payload['file'])
+    upcoming_window.invalidate()
+    return counts
+
+
+def _import_file(path, user_id):
+    with open(path, 'rb') as f:
+        return import_user(read_records(f), user_id)
@@ -0,0 +1,138 @@
+"""
+Run blocking database work on a bounded pool of native threads.
+
+The sqlite3 driver blocks the whole gevent hub while a statement runs, so a
+slow read stalls every websocket handled by the worker. Routes wrap their
+database work in `run_db(fn, *args)`: the call is executed on a native thread
+inside its own app context (and therefore its own SQLAlchemy session, which is
+removed when the context ends) while the calling greenlet yields to the hub.
+
+Functions passed to `run_db` must not touch the Flask request or session and
+should return plain data (dicts/lists) rather than ORM instances, since the
+worker's session is closed once the call returns.
+"""
+
+import collections
+import threading
+import time
+from flask import current_app, g
+
+try:
+    from gevent.threadpool import ThreadPool
+except ImportError:  # pragma: no cover - gevent is a hard dependency in production
+    ThreadPool = None
+
+
+class DBPool:
+    """Bounded thread pool for database calls, with queue-time metrics"""
+
+    def __init__(self, app=None):
+        self.pool = None
+        self.size = 0
+        self._lock = threading.Lock()
+        self._queue_ms = collections.deque(maxlen=1000)
+        self._run_ms = collections.deque(maxlen=1000)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['db_pool'] = self
+        self.size = app.config.get('DB_POOL_SIZE', 4)
+
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+        in_memory = uri in ('sqlite://', 'sqlite:///:memory:') or ':memory:' in uri
+        if app.config.get('DB_OFFLOAD_ENABLED', True) and ThreadPool is not None and not in_memory:
+            # In-memory SQLite shares one connection across threads, so it always runs inline
+            self.pool = ThreadPool(self.size)
+
+        @app.after_request
+        def add_queue_timing(response):
+            queue_ms = g.get('_db_queue_ms')
+            if queue_ms is not None and (app.debug or app.config.get('QUERY_STATS_HEADERS')):
+                response.headers.add('Server-Timing', f'dbqueue;dur={queue_ms:.2f};desc="DB pool wait"')
+            return response
+
+    @property
+    def enabled(self):
+        return self.pool is not None
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and wait cooperatively for the result"""
+        if self.pool is None:
+            return fn(*args, **kwargs)
+
+        app = current_app._get_current_object()
+        # Carry request-scoped values (query accounting etc.) over to the worker context
+        carried = dict(g.__dict__)
+        enqueued = time.perf_counter()
+
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def task():
+            started = time.perf_counter()
+            queue_ms = (started - enqueued) * 1000
+            try:
+                with app.app_context():
+                    g.__dict__.update(carried)
+                    return queue_ms, fn(*args, **kwargs), None
+            except Exception as e:
+                # Handed back to the caller (e.g. a 404 from get_or_404) instead of
+                # being reported as a crashed pool task
+                return queue_ms, None, e
+            finally:
+                with self._lock:
+                    self._queue_ms.append(queue_ms)
+                    self._run_ms.append((time.perf_counter() - started) * 1000)
+
+        queue_ms, result, error = self.pool.spawn(task).get()
+        if error is not None:
+            with self._lock:
+                self.failed += 1
+                self.in_flight -= 1
+            raise error
+
+        with self._lock:
+            self.completed += 1
+            self.in_flight -= 1
+        g._db_queue_ms = g.get('_db_queue_ms', 0.0) + queue_ms
+        return result
+
+    def stats(self):
+        """Snapshot of pool metrics for health checks"""
+        with self._lock:
+            queue_ms = sorted(self._queue_ms)
+            run_ms = sorted(self._run_ms)
+            snapshot = {
+                'enabled': self.enabled,
+                'size': self.size,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+            }
+
+        def pct(values, p):
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(len(values) * p))], 3)
+
+        snapshot['queue_ms'] = {'p50': pct(queue_ms, 0.5), 'p95': pct(queue_ms, 0.95), 'max': pct(queue_ms, 1.0)}
+        snapshot['run_ms'] = {'p50': pct(run_ms, 0.5), 'p95': pct(run_ms, 0.95), 'max': pct(run_ms, 1.0)}
+        return snapshot
+
+
+db_pool = DBPool()
+
+
+def run_db(fn, *args, **kwargs):
+    """Run a database function on the pool (inline when offloading is disabled)"""
+    return db_pool.run(fn, *args, **kwargs)
@@ -0,0 +1,88 @@
+"""
+Free/busy computation over the events of several calendars.
+
+Busy time is the union of all event intervals: intervals are sorted by start
+and swept once, extending the current block while the next interval starts
+before (or exactly when) the block ends. Free slots are the gaps between busy
+blocks inside the requested window that are at least `duration` long.
+
+Large windows (thousands of intervals) use a vectorized NumPy sweep when NumPy
+is installed; the result is identical to the pure Python sweep.
+"""
+
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Below this many intervals the pure Python sweep is faster than converting to arrays
+NUMPY_THRESHOLD = 2000
+
+
+def merge_intervals(intervals):
+    """Merge (start, end) intervals into sorted, non-overlapping busy blocks"""
+    intervals = [(start, end) for start, end in intervals if end > start]
+    if not intervals:
+        return []
+    if np is not None and len(intervals) >= NUMPY_THRESHOLD:
+        return _merge_numpy(intervals)
+
+    intervals.sort()
+    merged = [list(intervals[0])]
+    for start, end in intervals[1:]:
+        current = merged[-1]
+        if start <= current[1]:
+            if end > current[1]:
+                current[1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _merge_numpy(intervals):
+    starts = np.array([start for start, _ in intervals], dtype='datetime64[us]')
+    ends = np.array([end for _, end in intervals], dtype='datetime64[us]')
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+
+    # Furthest end reached by any interval so far; a new block begins wherever
+    # an interval starts after everything before it has ended
+    reach = np.maximum.accumulate(ends.astype('int64'))
+    block_starts = np.flatnonzero(starts[1:].astype('int64') > reach[:-1]) + 1
+    first = np.concatenate(([0], block_starts))
+    last = np.concatenate((block_starts - 1, [len(starts) - 1]))
+
+    return list(zip(starts[first].astype(object), reach[last].astype('datetime64[us]').astype(object)))
+
+
+def clip(blocks, window_start, window_end):
+    """Restrict merged blocks to [window_start, window_end)"""
+    clipped = []
+    for start, end in blocks:
+        start = max(start, window_start)
+        end = min(end, window_end)
+        if end > start:
+            clipped.append((start, end))
+    return clipped
+
+
+def free_slots(busy, window_start, window_end, duration=timedelta(0)):
+    """Gaps of at least `duration` between clipped busy blocks in the window"""
+    slots = []
+    cursor = window_start
+    for start, end in busy:
+        if start - cursor >= duration and start > cursor:
+            slots.append((cursor, start))
+        cursor = max(cursor, end)
+    if window_end - cursor >= duration and window_end > cursor:
+        slots.append((cursor, window_end))
+    return slots
+
+
+def freebusy(intervals, window_start, window_end, duration=timedelta(0)):
+    """Busy blocks and free slots of at least `duration` within the window"""
+    busy = clip(merge_intervals(intervals), window_start, window_end)
+    return busy, free_slots(busy, window_start, window_end, duration)
@@ -0,0 +1,193 @@
+"""
+Group commit of small concurrent write transactions.
+
+Every event write used to be its own transaction, and SQLite syncs the
+journal to disk on each commit, so a burst of tiny writes pays one fsync
+per request. With GROUP_COMMIT_ENABLED, routes hand their database work to
+`group_commit.run(fn, *args, shard=...)` instead of committing themselves.
+A writer greenlet per database (the main one, or each calendar shard)
+gathers the units queued within GROUP_COMMIT_WINDOW_MS, up to
+GROUP_COMMIT_MAX_BATCH of them, and runs them on the DB pool in a single
+transaction with a single commit, then wakes every caller with its own
+result.
+
+Each unit runs inside a SAVEPOINT: one that raises (a 404, a bad datetime,
+a constraint violation) is rolled back on its own and its exception is
+re-raised in its caller, while the rest of the batch still commits. Only a
+failing COMMIT fails the whole batch. Units must follow the `run_db` rules:
+no Flask request or session access, arguments passed in explicitly. They
+may return ORM instances, which keep their loaded attributes after the
+commit (the writer's session does not expire them) but are detached. On a
+calendar shard, read core tables (calendars, memberships) before or after
+the unit, or through `db.engine`: reads of the attached core database keep
+a lock on it until the batch commits, which stalls the core writes other
+shards make to reserve event ids.
+
+With GROUP_COMMIT_ENABLED=false, `run` calls the unit in the request's own
+session and commits it straight away, so routes have one code path either
+way.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from flask import current_app
+from app.models import db
+from app.db_pool import run_db
+from app.shards import shard_router
+
+
+class _Unit:
+    """One caller's write, waiting for the batch it lands in to commit"""
+
+    __slots__ = ('fn', 'args', 'done', 'result', 'error', 'queued')
+
+    def __init__(self, fn, args, done):
+        self.fn = fn
+        self.args = args
+        self.done = done
+        self.result = None
+        self.error = None
+        self.queued = time.perf_counter()
+
+
+class GroupCommitter:
+    """Batches concurrent write units into one transaction per database"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.window = 0.002
+        self.max_batch = 64
+        self.counters = defaultdict(int)
+        self.largest_batch = 0
+        self._queues = defaultdict(deque)
+        self._wakeup = {}
+        self._wait_ms = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['group_commit'] = self
+        self.window = app.config.get('GROUP_COMMIT_WINDOW_MS', 2) / 1000
+        self.max_batch = max(1, app.config.get('GROUP_COMMIT_MAX_BATCH', 64))
+        self.enabled = app.config.get('GROUP_COMMIT_ENABLED', False)
+
+    def run(self, fn, *args, shard=None):
+        """Run fn(*args) in a committed transaction and return its result.
+
+        `shard` is the shard index the unit writes to (from shard_router.route), None for the main database.
+        """
+        if not self.enabled:
+            try:
+                result = fn(*args)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return result
+
+        from app import socketio
+        # End the request's read transaction first: connections it holds while waiting
+        # could otherwise drain the (thread-blocking) connection pool
+        db.session.commit()
+        unit = _Unit(fn, args, socketio.server.eio.create_event())
+        self._ensure_writer(shard)
+        self._queues[shard].append(unit)
+        self._wakeup[shard].set()
+        unit.done.wait()
+        if unit.error is not None:
+            raise unit.error
+        return unit.result
+
+    # Writers
+
+    def _ensure_writer(self, key):
+        if key in self._wakeup:
+            return
+        with self._lock:
+            if key in self._wakeup:
+                return
+            from app import socketio
+            # Set last: callers only queue once the event exists
+            wakeup = socketio.server.eio.create_event()
+            socketio.start_background_task(self._write_loop, current_app._get_current_object(), key, wakeup)
+            self._wakeup[key] = wakeup
+
+    def _write_loop(self, app, key, wakeup):
+        from app import socketio
+        queue = self._queues[key]
+        while True:
+            wakeup.wait()
+            wakeup.clear()
+            # Give concurrent requests a moment to join the batch, unless it is already full
+            if len(queue) < self.max_batch:
+                socketio.sleep(self.window)
+            while queue:
+                batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+                try:
+                    with app.app_context():
+                        run_db(self._apply, key, batch)
+                except Exception as e:
+                    app.logger.error(f"Group commit of {len(batch)} writes failed: {e}")
+                    for unit in batch:
+                        unit.error = unit.error or e
+                        unit.result = None
+                self._record(batch)
+                for unit in batch:
+                    unit.done.set()
+
+    def _apply(self, key, batch):
+        """Run a batch's units in one transaction, each inside its own savepoint"""
+        session = db.session()
+        session.expire_on_commit = False
+        with shard_router.shard(key):
+            # pysqlite opens transactions lazily and a SAVEPOINT outside one commits on
+            # RELEASE, so open the batch's transaction explicitly, and take the write lock
+            # straight away: a first write that follows a read (FTS5 reads its config
+            # table) gets SQLITE_BUSY at once instead of waiting for other writers.
+            # BEGIN IMMEDIATE would lock a shard's attached core database as well, so
+            # write to `main` only (every event write bumps calendar_version anyway)
+            connection = session.connection()
+            connection.exec_driver_sql('BEGIN')
+            connection.exec_driver_sql('UPDATE main.calendar_version SET version = version WHERE 0')
+            for unit in batch:
+                try:
+                    with session.begin_nested():
+                        unit.result = unit.fn(*unit.args)
+                except Exception as e:
+                    unit.error = e
+            try:
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        with self._lock:
+            self.counters['batches'] += 1
+            self.counters['units'] += len(batch)
+            self.counters['failed'] += sum(1 for unit in batch if unit.error is not None)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self._wait_ms.extend((now - unit.queued) * 1000 for unit in batch)
+
+    def stats(self):
+        """Batch sizes, failures and caller wait times, for health checks"""
+        with self._lock:
+            counters = dict(self.counters)
+            wait_ms = sorted(self._wait_ms)
+        batches = counters.get('batches', 0)
+        return {
+            'enabled': self.enabled,
+            'window_ms': round(self.window * 1000, 3),
+            'max_batch': self.max_batch,
+            **counters,
+            'mean_batch': round(counters.get('units', 0) / batches, 2) if batches else None,
+            'largest_batch': self.largest_batch,
+            'wait_ms_p50': round(wait_ms[len(wait_ms) // 2], 3) if wait_ms else None,
+            'wait_ms_p95': round(wait_ms[min(len(wait_ms) - 1, int(len(wait_ms) * 0.95))], 3) if wait_ms else None,
+        }
+
+
+group_commit = GroupCommitter()
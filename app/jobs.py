@@ -0,0 +1,284 @@
+"""
+Durable background jobs stored in SQLite.
+
+Heavy operations (calendar purges, imports, exports, push fan-out) are
+queued as rows of the job table instead of running inside the request.
+Workers in the app process claim due jobs, run the handler registered for
+the job's kind and store its result, so the request only pays for one
+INSERT and clients poll GET /api/jobs/<id> for the outcome.
+
+Each job belongs to a lane ('high', 'default' or 'low') served by its own
+JOBS_LANE_WORKERS greenlets, so a burst of slow bulk work can never starve
+short interactive jobs. A failing job is retried with exponential backoff
+until its max_attempts, then marked failed. A claimed job holds a lease of
+JOBS_LEASE_SECONDS: if the process dies mid-job, the job becomes due again
+once the lease runs out, so queued work survives restarts. With
+JOBS_ENABLED=false there are no workers and `enqueue` runs the job straight
+away in the caller, without retries.
+
+Handlers register with `@job_queue.handler(kind, lane=...)` in their own
+modules, listed in HANDLER_MODULES so workers can find them, and take the
+job's JSON payload, returning a JSON-serialisable result. Files a job reads
+or writes (uploads, export archives) live under JOBS_FILES_DIR and are named
+in the payload or result as 'file'; they are deleted with the job after
+JOBS_KEEP_HOURS.
+"""
+
+import importlib
+import json
+import os
+import random
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from app.models import db, Job
+
+LANES = ('high', 'default', 'low')
+HANDLER_MODULES = ('app.calendar_delete', 'app.data_transfer', 'app.push')
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures no retry can fix (bad input); fails the job at once"""
+
+
+def parse_lane_workers(value):
+    """'high:2,default:2,low:1' -> {'high': 2, 'default': 2, 'low': 1}"""
+    workers = {}
+    for item in value.split(','):
+        lane, _, count = item.partition(':')
+        if lane.strip() in LANES:
+            workers[lane.strip()] = int(count or 1)
+    return workers
+
+
+class JobQueue:
+    """Queues jobs in the database and runs them on per-lane worker greenlets"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.lane_workers = {'high': 2, 'default': 2, 'low': 1}
+        self.lease = timedelta(seconds=900)
+        self.retry_base_seconds = 10
+        self.poll_seconds = 5
+        self.keep_hours = 24
+        self.files_dir = None
+        self.handlers = {}
+        self.counters = defaultdict(int)
+        self._wakeup = {}
+        self._worker_lock = threading.Lock()
+        self._workers_started = False
+        self._last_prune = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['jobs'] = self
+        self.lane_workers = parse_lane_workers(app.config.get('JOBS_LANE_WORKERS', 'high:2,default:2,low:1'))
+        self.lease = timedelta(seconds=app.config.get('JOBS_LEASE_SECONDS', 900))
+        self.retry_base_seconds = app.config.get('JOBS_RETRY_BASE_SECONDS', 10)
+        self.poll_seconds = app.config.get('JOBS_POLL_SECONDS', 5)
+        self.keep_hours = app.config.get('JOBS_KEEP_HOURS', 24)
+        self.files_dir = app.config.get('JOBS_FILES_DIR') or os.path.join(app.instance_path, 'job-files')
+        self.enabled = app.config.get('JOBS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_job_workers():
+            self._ensure_workers()
+
+    # Registration and enqueueing
+
+    def handler(self, kind, lane='default', max_attempts=3):
+        """Register fn(payload) -> result as the handler for a job kind"""
+        def decorator(fn):
+            self.handlers[kind] = (fn, lane, max_attempts)
+            return fn
+        return decorator
+
+    def _load_handlers(self):
+        for module in HANDLER_MODULES:
+            importlib.import_module(module)
+
+    def enqueue(self, kind, payload=None, user_id=None, lane=None, delay_seconds=0, commit=True):
+        """Queue a job and return its row.
+
+        With commit=False the job joins the caller's transaction; call dispatch(job) after committing.
+        """
+        self._load_handlers()
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        _, default_lane, max_attempts = self.handlers[kind]
+        lane = lane or default_lane
+
+        job = Job(
+            kind=kind,
+            lane=lane,
+            payload=json.dumps(payload or {}, separators=(',', ':')),
+            max_attempts=max_attempts,
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=delay_seconds),
+            user_id=user_id,
+        )
+        db.session.add(job)
+        self.counters['enqueued'] += 1
+        if commit:
+            db.session.commit()
+            self.dispatch(job)
+        return job
+
+    def dispatch(self, job):
+        """Hand a committed job to its lane's workers (after enqueue with commit=False)"""
+        if self.enabled:
+            if job.lane in self._wakeup:
+                self._wakeup[job.lane].set()
+        else:
+            # Without workers (JOBS_ENABLED=false) the job runs right away, in the caller,
+            # unless it is not due yet or already claimed
+            claimed = self.claim(job.lane, job_id=job.id)
+            if claimed is not None:
+                self._execute(claimed)
+            db.session.refresh(job)
+
+    def file_path(self, suffix):
+        """A new path for a file owned by a job (an upload or a result); removed when the job is pruned"""
+        os.makedirs(self.files_dir, exist_ok=True)
+        return os.path.join(self.files_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    def wake(self, lane=None):
+        for name in ([lane] if lane else LANES):
+            if name in self._wakeup:
+                self._wakeup[name].set()
+
+    # Workers
+
+    def _ensure_workers(self):
+        if self._workers_started:
+            return
+        with self._worker_lock:
+            if self._workers_started:
+                return
+            self._workers_started = True
+        self._load_handlers()
+        from app import socketio
+        app = current_app._get_current_object()
+        # Events of the async mode (gevent), so idle workers wait without blocking the hub
+        self._wakeup = {lane: socketio.server.eio.create_event() for lane in LANES}
+        for lane, count in self.lane_workers.items():
+            for _ in range(count):
+                socketio.start_background_task(self._run, app, lane)
+
+    def _run(self, app, lane):
+        while True:
+            try:
+                with app.app_context():
+                    while self.run_next(lane):
+                        pass
+                    self._prune()
+            except Exception as e:
+                app.logger.error(f"Job worker ({lane}) failed: {e}")
+            self._wakeup[lane].wait(self.poll_seconds)
+            self._wakeup[lane].clear()
+
+    def claim(self, lane, job_id=None, now=None):
+        """Atomically mark the oldest due job of a lane (or job_id) as running.
+
+        Returns (id, kind, payload, attempts, max_attempts), or None when nothing is due.
+        """
+        now = now or datetime.utcnow()
+        due = db.select(Job.id).where(
+            Job.lane == lane,
+            Job.status.in_(('pending', 'running')),
+            Job.next_attempt_at <= now
+        ).order_by(Job.next_attempt_at, Job.id).limit(1)
+        if job_id is not None:
+            due = due.where(Job.id == job_id)
+        claimed = db.session.execute(
+            db.update(Job).where(Job.id == due.scalar_subquery()).values(
+                status='running', attempts=Job.attempts + 1, started_at=now, next_attempt_at=now + self.lease
+            ).returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        return claimed
+
+    def run_next(self, lane):
+        """Claim and run one job of a lane; returns False when none was due"""
+        claimed = self.claim(lane)
+        if claimed is None:
+            return False
+        self._execute(claimed)
+        return True
+
+    def _execute(self, claimed):
+        job_id, kind, payload, attempts, max_attempts = claimed
+
+        self._load_handlers()
+        try:
+            if kind not in self.handlers:
+                raise LookupError(f"No handler registered for job kind {kind!r}")
+            result = self.handlers[kind][0](json.loads(payload))
+        except Exception as e:
+            db.session.rollback()
+            self._failed(job_id, max_attempts if isinstance(e, PermanentJobError) else attempts, max_attempts, e)
+            return
+
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(
+            status='done', result=json.dumps(result, separators=(',', ':')) if result is not None else None,
+            last_error=None, finished_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+        self.counters['done'] += 1
+
+    def _failed(self, job_id, attempts, max_attempts, error):
+        now = datetime.utcnow()
+        message = str(error) if isinstance(error, PermanentJobError) else f"{type(error).__name__}: {error}"
+        values = {'last_error': message[:200]}
+        if attempts >= max_attempts or not self.enabled:
+            values.update(status='failed', finished_at=now)
+            self.counters['failed'] += 1
+            current_app.logger.error(f"Job {job_id} failed: {error}")
+        else:
+            delay = self.retry_base_seconds * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            values.update(status='pending', next_attempt_at=now + timedelta(seconds=delay))
+            self.counters['retried'] += 1
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(**values)
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+
+    def _prune(self):
+        """Drop finished jobs older than JOBS_KEEP_HOURS, at most once a minute"""
+        now = datetime.utcnow()
+        if self._last_prune and now - self._last_prune < timedelta(minutes=1):
+            return
+        self._last_prune = now
+        expired = db.session.execute(db.delete(Job).where(
+            Job.status.in_(('done', 'failed')),
+            Job.finished_at < now - timedelta(hours=self.keep_hours)
+        ).returning(Job.payload, Job.result).execution_options(synchronize_session=False)).all()
+        db.session.commit()
+        # Files a job owns are named in its payload or result under 'file'
+        for payload, result in expired:
+            for data in (payload, result):
+                path = json.loads(data).get('file') if data else None
+                if isinstance(path, str) and path.startswith(self.files_dir) and os.path.exists(path):
+                    os.remove(path)
+
+    def stats(self):
+        """Queue depth per lane and status, plus counters, for health checks"""
+        try:
+            rows = db.session.execute(
+                db.select(Job.lane, Job.status, db.func.count()).group_by(Job.lane, Job.status)
+            ).all()
+        except OperationalError:
+            db.session.rollback()
+            rows = []  # job table not created yet
+        depth = defaultdict(dict)
+        for lane, status, count in rows:
+            depth[lane][status] = count
+        return {'enabled': self.enabled, 'workers': self.lane_workers, 'lanes': dict(depth), **dict(self.counters)}
+
+
+job_queue = JobQueue()
@@ -1,6 +1,8 @@
 from flask import render_template, jsonify, request, redirect, url_for, current_app
 from . import main_bp
-from app.models import db
+from app.models import db, ensure_indexes
+from app.search import ensure_search_index
+from app.shards import shard_router
 from datetime import datetime, timedelta
 import json
 
@@ -9,6 +11,9 @@ def init_db_if_needed():
     try:
         # Try to create tables if they don't exist
         db.create_all()
+        ensure_indexes()
+        ensure_search_index()
+        shard_router.create_all()
         return True
     except Exception as e:
         current_app.logger.error(f"Database initialization failed: {e}")
@@ -64,9 +69,25 @@ def health_check():
     except Exception as e:
         db_status = f"disconnected: {str(e)[:100]}"
     
+    from app.db_pool import db_pool
+    from app.push import push_service
+    from app import compression
+    from app.backup import database_backup
+    from app.jobs import job_queue
+    from app.socket_serializer import socket_serializer
+    from app.group_commit import group_commit
+    
     return jsonify({
         "status": "healthy",
         "database": db_status,
+        "db_pool": db_pool.stats(),
+        "push": push_service.stats(),
+        "compression": compression.get_stats(),
+        "backup": database_backup.stats(),
+        "jobs": job_queue.stats(),
+        "socketio": socket_serializer.stats(),
+        "shards": shard_router.stats(),
+        "group_commit": group_commit.stats(),
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0",
         "message": "Application is running, database may be initializing"
@@ -86,6 +107,9 @@ def init_database():
     """Initialize database tables - for production deployment"""
     try:
         db.create_all()
+        ensure_indexes()
+        ensure_search_index()
+        shard_router.create_all()
         return jsonify({
             "status": "success",
             "message": "Database tables created successfully",
@@ -1,11 +1,21 @@
 from datetime import datetime
+import json
 import uuid
 import secrets
 import string
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+class RoutingSession(Session):
+    """Session whose statements go to `info['bind']` when set (a calendar shard, see app/shards.py)"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('bind') is not None:
+            return self.info['bind']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 
 # This will be initialized by the app factory
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -73,6 +83,11 @@ class Calendar(db.Model):
                 return code
     
     def to_dict(self):
+        from app.shards import shard_router
+        with shard_router.calendar(self.id):
+            return self._to_dict()
+    
+    def _to_dict(self):
         # Get actual count from database to ensure accuracy
         from sqlalchemy import func
         events_count = db.session.query(func.count(Event.id)).filter_by(calendar_id=self.id).scalar() or 0
@@ -115,6 +130,17 @@ class Event(db.Model):
     # Relationships
     reminders = db.relationship('Reminder', backref='event', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Range scans over start_time (upcoming events window)
+        db.Index('ix_event_start_time', 'start_time'),
+        # Per-calendar scans in start order (agenda cursors, date range filters)
+        db.Index('ix_event_calendar_start', 'calendar_id', 'start_time'),
+        # Overlap probes that start from the end of an interval (month buckets)
+        db.Index('ix_event_calendar_end', 'calendar_id', 'end_time'),
+        # Ids of archived events (see app/archive.py) must never be handed out again
+        {'sqlite_autoincrement': True},
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -129,6 +155,80 @@ class Event(db.Model):
             'calendar_id': self.calendar_id
         }
 
+class CalendarVersion(db.Model):
+    """Per-calendar change counter, bumped whenever one of its events changes.
+    
+    Kept in its own table so existing databases pick it up through
+    db.create_all() without a column migration.
+    """
+    calendar_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def get(calendar_id):
+        row = db.session.get(CalendarVersion, calendar_id)
+        return row.version if row else 0
+    
+    @staticmethod
+    def bump(connection, calendar_id):
+        """Increment a calendar's version on the given connection (same transaction)"""
+        connection.execute(
+            db.text(
+                "INSERT INTO calendar_version (calendar_id, version) VALUES (:calendar_id, 1) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET version = version + 1"
+            ),
+            {'calendar_id': calendar_id}
+        )
+
+class EventChange(db.Model):
+    """Append-only log of event changes, the cursor for incremental client sync.
+    
+    AUTOINCREMENT keeps ids strictly increasing even after old entries are pruned,
+    so a client's cursor never points at a reused id.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.Integer, nullable=False)
+    event_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_event_change_calendar', 'calendar_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    @staticmethod
+    def record(connection, event, deleted=False):
+        """Log a change on the given connection (same transaction as the change itself)"""
+        connection.execute(EventChange.__table__.insert().values(
+            calendar_id=event.calendar_id,
+            event_id=event.id,
+            deleted=deleted,
+            changed_at=datetime.utcnow()
+        ))
+    
+    @staticmethod
+    def prune(older_than):
+        """Drop log entries older than a datetime; clients behind them get a full reload"""
+        deleted = EventChange.query.filter(EventChange.changed_at < older_than).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+@db.event.listens_for(Event, 'after_insert')
+@db.event.listens_for(Event, 'after_update')
+@db.event.listens_for(Event, 'after_delete')
+def _bump_calendar_version(mapper, connection, target):
+    CalendarVersion.bump(connection, target.calendar_id)
+
+@db.event.listens_for(Event, 'after_insert')
+@db.event.listens_for(Event, 'after_update')
+def _record_event_change(mapper, connection, target):
+    EventChange.record(connection, target)
+
+@db.event.listens_for(Event, 'after_delete')
+def _record_event_delete(mapper, connection, target):
+    EventChange.record(connection, target, deleted=True)
+
 class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
@@ -136,6 +236,13 @@ class Reminder(db.Model):
     sent = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # Due-reminder scan for push delivery (see app/push.py)
+        db.Index('ix_reminder_due', 'sent', 'reminder_time'),
+        # Reminders of a set of events (calendar deletes, archiving)
+        db.Index('ix_reminder_event', 'event_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -143,4 +250,109 @@ class Reminder(db.Model):
             'reminder_time': self.reminder_time.isoformat(),
             'sent': self.sent,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+class PushSubscription(db.Model):
+    """A browser Web Push subscription belonging to a user"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    endpoint = db.Column(db.String(1000), nullable=False, unique=True)
+    p256dh = db.Column(db.String(200), nullable=False)
+    auth = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_success_at = db.Column(db.DateTime)
+    failure_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'endpoint': self.endpoint,
+            'created_at': self.created_at.isoformat(),
+            'last_success_at': self.last_success_at.isoformat() if self.last_success_at else None
+        }
+
+class PushDelivery(db.Model):
+    """One queued notification for one subscription"""
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('push_subscription.id', ondelete='CASCADE'), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent | failed; sending rows whose lease expired are picked up again
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_push_delivery_due', 'status', 'next_attempt_at'),
+        db.Index('ix_push_delivery_subscription', 'subscription_id'),
+    )
+
+class Job(db.Model):
+    """A unit of background work queued in the database (see app/jobs.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    lane = db.Column(db.String(10), nullable=False, default='default')
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # pending -> running -> done | failed; running jobs whose lease expired are picked up again
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    result = db.Column(db.Text)
+    last_error = db.Column(db.String(200))
+    user_id = db.Column(db.Integer, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_job_due', 'lane', 'status', 'next_attempt_at'),
+    )
+    
+    def result_data(self):
+        return json.loads(self.result) if self.result else None
+    
+    def public_result(self):
+        """The result without server file paths; a produced file is offered as a download URL instead"""
+        result = self.result_data()
+        if isinstance(result, dict) and 'file' in result:
+            result = {key: value for key, value in result.items() if key != 'file'}
+            result['download_url'] = f"/api/jobs/{self.id}/download"
+        return result
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'lane': self.lane,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.public_result(),
+            'error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class CalendarShard(db.Model):
+    """Shard of a calendar moved off its default `calendar_id % SHARD_COUNT` (see app/shards.py)"""
+    calendar_id = db.Column(db.Integer, primary_key=True)
+    shard = db.Column(db.Integer, nullable=False)
+
+class ShardSequence(db.Model):
+    """Next free id of a sharded table, handed out in blocks so ids stay unique across shards"""
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+def ensure_indexes(engine=None, tables=None):
+    """Create any model indexes missing from an existing database.
+    
+    db.create_all() only creates indexes together with their table, so
+    databases created before an index was added to a model need this.
+    """
+    for table in tables or db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine or db.engine, checkfirst=True)
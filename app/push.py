@@ -0,0 +1,401 @@
+"""
+Server-side Web Push delivery.
+
+Notifications are queued in the push_delivery table (one row per
+subscription) by event mutations (through a 'push.fan_out' job, see
+app/jobs.py) and by due reminders, so they survive restarts and reach users
+without an open tab. A background worker claims due rows in batches, groups
+them by push service origin and sends each group over a shared keep-alive
+`requests.Session`, on a small pool of native threads (the app runs gevent
+without monkey patching, so blocking sockets must stay off the hub).
+
+Outcomes per row:
+- 2xx: delivered, the row is removed
+- 404/410: the subscription is gone, it is pruned together with its queue
+- 429/5xx/network errors: retried with exponential backoff (honouring
+  Retry-After) until PUSH_MAX_ATTEMPTS, then marked failed
+- other 4xx: marked failed
+
+PUSH_TRANSPORT=webpush (default) encrypts payloads and signs VAPID headers
+with pywebpush. PUSH_TRANSPORT=plain POSTs the JSON payload unencrypted and
+is only meant for local stub endpoints (see benchmarks/push_delivery.py).
+"""
+
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from flask import current_app
+from app.jobs import job_queue
+from app.models import db, PushSubscription, PushDelivery, Reminder, Event, UserCalendar
+
+try:
+    from gevent.threadpool import ThreadPool
+except ImportError:  # pragma: no cover - gevent is a hard dependency in production
+    from concurrent.futures import ThreadPoolExecutor as ThreadPool
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # pragma: no cover - installed with pywebpush
+    requests = None
+
+try:
+    from pywebpush import WebPusher
+    from py_vapid import Vapid
+except ImportError:  # pragma: no cover - optional, push is disabled without it
+    WebPusher = None
+    Vapid = None
+
+# Browsers reject payloads above 4 KB once encrypted
+MAX_BODY_LENGTH = 240
+# A claimed row is handed out again if its worker hasn't reported back by then
+CLAIM_LEASE = timedelta(minutes=5)
+# Rows sent over one connection by one worker task
+CHUNK_SIZE = 50
+
+
+class PushService:
+    """Queues Web Push notifications and delivers them from a background worker"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.transport = 'webpush'
+        self.public_key = None
+        self._private_key = None
+        self._subject = None
+        self.workers = 4
+        self.batch_size = 200
+        self.max_attempts = 6
+        self.retry_base_seconds = 30
+        self.poll_seconds = 15
+        self.ttl = 3600
+        self._executor = None
+        self._sessions = {}
+        self._vapid_headers = {}
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._worker_started = False
+        self.counters = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['push'] = self
+        self.transport = app.config.get('PUSH_TRANSPORT', 'webpush')
+        self.public_key = app.config.get('VAPID_PUBLIC_KEY')
+        self._private_key = app.config.get('VAPID_PRIVATE_KEY')
+        self._subject = app.config.get('VAPID_SUBJECT', 'mailto:admin@example.com')
+        self.workers = app.config.get('PUSH_WORKERS', 4)
+        self.batch_size = app.config.get('PUSH_BATCH_SIZE', 200)
+        self.max_attempts = app.config.get('PUSH_MAX_ATTEMPTS', 6)
+        self.retry_base_seconds = app.config.get('PUSH_RETRY_BASE_SECONDS', 30)
+        self.poll_seconds = app.config.get('PUSH_POLL_SECONDS', 15)
+        self.ttl = app.config.get('PUSH_TTL_SECONDS', 3600)
+
+        self.enabled = False
+        if not app.config.get('PUSH_ENABLED', False):
+            return
+        if requests is None:
+            app.logger.warning("Web Push disabled: the requests package is not installed")
+            return
+        if self.transport == 'webpush' and (WebPusher is None or not self._private_key):
+            app.logger.warning("Web Push disabled: needs pywebpush and VAPID_PRIVATE_KEY")
+            return
+        self.enabled = True
+        self._executor = ThreadPool(self.workers)
+
+        @app.before_request
+        def start_push_worker():
+            self._ensure_worker()
+
+    # Enqueueing
+
+    def enqueue_for_calendar(self, calendar_id, payload, exclude_user_id=None):
+        """Queue a notification for every subscription of the calendar's members"""
+        if not self.enabled:
+            return 0
+        query = _delivery_rows(payload).join(UserCalendar, UserCalendar.user_id == PushSubscription.user_id).where(
+            UserCalendar.calendar_id == calendar_id
+        )
+        if exclude_user_id:
+            query = query.where(PushSubscription.user_id != exclude_user_id)
+        return self._enqueue(query)
+
+    def enqueue_for_user(self, user_id, payload):
+        """Queue a notification for all of one user's subscriptions"""
+        if not self.enabled:
+            return 0
+        query = _delivery_rows(payload).where(PushSubscription.user_id == user_id)
+        return self._enqueue(query)
+
+    def _enqueue(self, query):
+        # Set-based INSERT ... SELECT: one statement however many subscribers there are
+        result = db.session.execute(db.insert(PushDelivery).from_select(
+            ['subscription_id', 'payload', 'status', 'attempts', 'next_attempt_at', 'created_at'], query
+        ))
+        db.session.commit()
+        if result.rowcount and self._wakeup is not None:
+            self._wakeup.set()
+        return result.rowcount
+
+    def notify_event(self, action, event_data, calendar, exclude_user_id=None):
+        """Queue a push for an event created/updated/deleted in a calendar, via a fan-out job"""
+        if not self.enabled:
+            return None
+        title = event_data.get('title') or 'An event'
+        payload = {
+            'title': f"{calendar.name}: event {action}",
+            'body': _truncate(f"{title} ({event_data['start_time'][:16].replace('T', ' ')})"
+                              if event_data.get('start_time') else title),
+            'tag': f"event-{event_data.get('id')}",
+            'url': f"/calendar?code={calendar.share_code}",
+        }
+        # The fan-out to every member's subscriptions runs as a job, off the request
+        return job_queue.enqueue('push.fan_out', {
+            'calendar_id': calendar.id, 'payload': payload, 'exclude_user_id': exclude_user_id
+        })
+
+    def enqueue_due_reminders(self, now=None, limit=500):
+        """Turn reminders whose time has come into queued pushes and mark them sent"""
+        from app.shards import shard_router
+
+        if not self.enabled:
+            return 0
+        now = now or datetime.utcnow()
+        # Each shard in its own transactions: the pushes it queues are written through its connection
+        return sum(self._enqueue_due_reminders(now, limit) for _ in shard_router.each_shard())
+
+    def _enqueue_due_reminders(self, now, limit):
+        due = db.session.query(Reminder.id, Event.title, Event.start_time, Event.calendar_id, Event.id).join(
+            Event, Event.id == Reminder.event_id
+        ).filter(
+            Reminder.sent == False,
+            Reminder.reminder_time <= now,
+            # Reminders for events that already started are stale, not worth a push
+            Event.start_time >= now
+        ).limit(limit).all()
+
+        for reminder_id, title, start_time, calendar_id, event_id in due:
+            minutes = max(0, int((start_time - now).total_seconds() // 60))
+            self.enqueue_for_calendar(calendar_id, {
+                'title': f"🔔 {title}",
+                'body': _truncate(f"Starts in {minutes} minutes" if minutes else "Starting now"),
+                'tag': f"reminder-{event_id}",
+                'url': '/',
+            })
+
+        # Also closes out reminders that were skipped because their event already started
+        stale = db.session.query(Reminder.id).join(Event, Event.id == Reminder.event_id).filter(
+            Reminder.sent == False, Reminder.reminder_time <= now, Event.start_time < now
+        ).limit(limit).all()
+        reminder_ids = [row[0] for row in due] + [row[0] for row in stale]
+        if reminder_ids:
+            Reminder.query.filter(Reminder.id.in_(reminder_ids)).update({'sent': True}, synchronize_session=False)
+            db.session.commit()
+        return len(due)
+
+    # Worker
+
+    def _ensure_worker(self):
+        if self._worker_started:
+            return
+        self._worker_started = True
+        from app import socketio
+        # An event of the async mode (gevent), so the idle worker waits without blocking the hub
+        self._wakeup = socketio.server.eio.create_event()
+        socketio.start_background_task(self._run, current_app._get_current_object())
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self.enqueue_due_reminders()
+                    while self.process_batch():
+                        pass
+            except Exception as e:
+                app.logger.error(f"Push delivery failed: {e}")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def process_batch(self, now=None):
+        """Claim and send one batch of due deliveries; returns how many were claimed"""
+        now = now or datetime.utcnow()
+        due = db.select(PushDelivery.id).where(
+            PushDelivery.status.in_(('pending', 'sending')),
+            PushDelivery.next_attempt_at <= now
+        ).order_by(PushDelivery.next_attempt_at).limit(self.batch_size)
+        claimed = db.session.execute(
+            db.update(PushDelivery).where(PushDelivery.id.in_(due.scalar_subquery())).values(
+                status='sending', next_attempt_at=now + CLAIM_LEASE
+            ).returning(PushDelivery.id).execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+        if not claimed:
+            return 0
+
+        rows = db.session.query(
+            PushDelivery.id, PushDelivery.attempts, PushDelivery.payload,
+            PushSubscription.id, PushSubscription.endpoint, PushSubscription.p256dh, PushSubscription.auth
+        ).join(PushSubscription, PushSubscription.id == PushDelivery.subscription_id).filter(
+            PushDelivery.id.in_(claimed)
+        ).all()
+
+        # Rows whose subscription was removed meanwhile have nowhere to go
+        orphaned = set(claimed) - {row[0] for row in rows}
+        if orphaned:
+            PushDelivery.query.filter(PushDelivery.id.in_(orphaned)).delete(synchronize_session=False)
+            db.session.commit()
+
+        # Group by push service so each group reuses one keep-alive connection pool
+        by_origin = defaultdict(list)
+        for row in rows:
+            by_origin[_origin(row[4])].append(row)
+        tasks = [
+            (origin, items[i:i + CHUNK_SIZE])
+            for origin, items in by_origin.items()
+            for i in range(0, len(items), CHUNK_SIZE)
+        ]
+        results = []
+        for chunk_results in self._executor.map(lambda task: self._send_chunk(*task), tasks):
+            results.extend(chunk_results)
+
+        self._apply_results(results, now)
+        return len(claimed)
+
+    def _send_chunk(self, origin, items):
+        session = self._session(origin)
+        results = []
+        for delivery_id, attempts, payload, subscription_id, endpoint, p256dh, auth in items:
+            try:
+                status, retry_after = self._deliver(session, origin, endpoint, p256dh, auth, payload)
+                error = None if 200 <= status < 300 else f"HTTP {status}"
+            except Exception as e:
+                status, retry_after, error = None, None, str(e)[:200]
+            results.append((delivery_id, attempts, subscription_id, status, retry_after, error))
+        return results
+
+    def _deliver(self, session, origin, endpoint, p256dh, auth, payload):
+        if self.transport == 'plain':
+            response = session.post(endpoint, data=payload, timeout=10, headers={
+                'TTL': str(self.ttl), 'Content-Type': 'application/json'
+            })
+        else:
+            subscription_info = {'endpoint': endpoint, 'keys': {'p256dh': p256dh, 'auth': auth}}
+            response = WebPusher(subscription_info, requests_session=session).send(
+                payload, headers=dict(self._vapid_for(origin)), ttl=self.ttl,
+                content_encoding='aes128gcm', timeout=10
+            )
+        return response.status_code, response.headers.get('Retry-After')
+
+    def _session(self, origin):
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount(origin, adapter)
+                self._sessions[origin] = session
+            return session
+
+    def _vapid_for(self, origin):
+        """VAPID Authorization headers for a push service, re-signed before they expire"""
+        with self._lock:
+            cached = self._vapid_headers.get(origin)
+            if cached and cached[0] > time.time() + 3600:
+                return cached[1]
+            expires = int(time.time()) + 12 * 3600
+            headers = Vapid.from_string(private_key=self._private_key).sign(
+                {'sub': self._subject, 'aud': origin, 'exp': expires}
+            )
+            self._vapid_headers[origin] = (expires, headers)
+            return headers
+
+    def _apply_results(self, results, now):
+        sent, gone = [], set()
+        for delivery_id, attempts, subscription_id, status, retry_after, error in results:
+            if status is not None and 200 <= status < 300:
+                sent.append(delivery_id)
+                PushSubscription.query.filter_by(id=subscription_id).update(
+                    {'last_success_at': now, 'failure_count': 0}, synchronize_session=False
+                )
+            elif status in (404, 410):
+                gone.add(subscription_id)
+            elif status is None or status == 429 or status >= 500:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    values = {'status': 'failed', 'attempts': attempts, 'last_error': error}
+                    self.counters['failed'] += 1
+                else:
+                    values = {
+                        'status': 'pending',
+                        'attempts': attempts,
+                        'last_error': error,
+                        'next_attempt_at': now + self._backoff(attempts, retry_after),
+                    }
+                    self.counters['retried'] += 1
+                PushDelivery.query.filter_by(id=delivery_id).update(values, synchronize_session=False)
+                PushSubscription.query.filter_by(id=subscription_id).update(
+                    {'failure_count': PushSubscription.failure_count + 1}, synchronize_session=False
+                )
+            else:
+                PushDelivery.query.filter_by(id=delivery_id).update(
+                    {'status': 'failed', 'attempts': attempts + 1, 'last_error': error}, synchronize_session=False
+                )
+                self.counters['failed'] += 1
+
+        if sent:
+            PushDelivery.query.filter(PushDelivery.id.in_(sent)).delete(synchronize_session=False)
+            self.counters['sent'] += len(sent)
+        if gone:
+            PushDelivery.query.filter(PushDelivery.subscription_id.in_(gone)).delete(synchronize_session=False)
+            PushSubscription.query.filter(PushSubscription.id.in_(gone)).delete(synchronize_session=False)
+            self.counters['pruned'] += len(gone)
+        db.session.commit()
+
+    def _backoff(self, attempts, retry_after=None):
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), 3600)
+        delay *= random.uniform(0.8, 1.2)
+        if retry_after and str(retry_after).isdigit():
+            delay = max(delay, int(retry_after))
+        return timedelta(seconds=delay)
+
+    def stats(self):
+        """Delivery counters for health checks"""
+        return {'enabled': self.enabled, 'transport': self.transport, **dict(self.counters)}
+
+
+def _delivery_rows(payload):
+    """SELECT of new push_delivery rows (one per subscription) for an INSERT ... SELECT"""
+    now = datetime.utcnow()
+    return db.select(
+        PushSubscription.id,
+        db.literal(json.dumps(payload, separators=(',', ':'))),
+        db.literal('pending'),
+        db.literal(0),
+        db.literal(now, db.DateTime),
+        db.literal(now, db.DateTime)
+    )
+
+
+def _truncate(text):
+    return text if len(text) <= MAX_BODY_LENGTH else text[:MAX_BODY_LENGTH - 1] + '…'
+
+
+def _origin(endpoint):
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+push_service = PushService()
+
+
+@job_queue.handler('push.fan_out', lane='high')
+def fan_out_job(payload):
+    queued = push_service.enqueue_for_calendar(
+        payload['calendar_id'], payload['payload'], exclude_user_id=payload.get('exclude_user_id')
+    )
+    return {'queued': queued}
@@ -0,0 +1,161 @@
+"""
+Per-request SQL query accounting.
+
+Counts and times every statement executed while a request is being handled,
+logs slow statements together with their EXPLAIN QUERY PLAN, flags repeated
+statements of the same shape as N+1 suspects and, in debug mode, exposes the
+totals through X-Query-Count / Server-Timing response headers.
+"""
+
+import re
+import time
+from flask import g, request, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_listeners_installed = False
+
+# Collapse literals and IN-lists so "same query, different ids" share a shape
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def query_shape(statement):
+    """Normalize a SQL statement so that queries differing only in parameters compare equal"""
+    shape = _STRING_RE.sub('?', statement)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('(?)', shape)
+    return _WHITESPACE_RE.sub(' ', shape).strip()
+
+
+class RequestQueryStats:
+    """Query counters for a single request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = {}
+        self.slow = []
+
+    def record(self, statement, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        shape = query_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def n_plus_one_suspects(self, threshold):
+        """Return (shape, count) pairs executed at least `threshold` times"""
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count >= threshold),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+
+def get_request_stats():
+    """Get the query stats for the current request (None outside a request)"""
+    if not has_app_context():
+        return None
+    return g.get('_query_stats')
+
+
+def _explain_query_plan(conn, statement, parameters):
+    """Run EXPLAIN QUERY PLAN for a statement on the raw DBAPI connection"""
+    if conn.dialect.name != 'sqlite':
+        return None
+    if not statement.lstrip().lower().startswith(('select', 'with')):
+        return None
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f"unavailable: {e}"]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+
+    stats = get_request_stats()
+    if stats is None:
+        return
+    stats.record(statement, duration_ms)
+
+    threshold_ms = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 100)
+    if duration_ms >= threshold_ms:
+        plan = None if executemany else _explain_query_plan(conn, statement, parameters)
+        stats.slow.append((statement, duration_ms))
+        current_app.logger.warning(
+            "Slow query (%.1f ms) during %s %s:\n%s\nQuery plan: %s",
+            duration_ms, g.get('_query_method'), g.get('_query_path'),
+            statement, ' | '.join(plan) if plan else 'n/a'
+        )
+
+
+def _handle_error(exception_context):
+    # A statement that raises never reaches after_cursor_execute; drop its start time
+    # so the next statement on this connection does not pop it instead of its own
+    conn = exception_context.connection
+    if conn is None or exception_context.execution_context is None:
+        return
+    starts = conn.info.get('_query_start')
+    if starts:
+        starts.pop()
+
+
+def _install_listeners():
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _listeners_installed = True
+
+
+def init_app(app):
+    """Register query accounting hooks on the app"""
+    if not app.config.get('QUERY_STATS_ENABLED', True):
+        return
+
+    _install_listeners()
+
+    @app.before_request
+    def start_query_stats():
+        g._query_stats = RequestQueryStats()
+        g._query_method = request.method
+        g._query_path = request.path
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = get_request_stats()
+        if stats is None:
+            return response
+
+        threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+        suspects = stats.n_plus_one_suspects(threshold)
+        for shape, count in suspects:
+            app.logger.warning(
+                "Possible N+1 during %s %s: query executed %d times: %s",
+                g.get('_query_method'), g.get('_query_path'), count, shape
+            )
+
+        if app.debug or app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(stats.count)
+            timing = f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries"'
+            if suspects:
+                timing += f', n1;desc="{len(suspects)} N+1 suspects"'
+            response.headers.add('Server-Timing', timing)
+        return response
@@ -0,0 +1,169 @@
+"""
+Full-text event search backed by an SQLite FTS5 index.
+
+`event_fts` is an external-content FTS5 table over event.title and
+event.description (rowid = event.id), so the text is stored only once.
+Triggers on the event table keep it in sync on insert, delete and on updates
+that touch the indexed columns. Existing databases are indexed once by
+`ensure_search_index()` or with `flask --app app rebuild-search-index`.
+
+Databases without FTS5 (or not SQLite at all) fall back to a LIKE scan.
+With calendar shards (see app/shards.py) every shard has its own index over
+its own events; a search runs on each shard holding one of the calendars and
+the results are merged.
+"""
+
+import re
+from flask import current_app
+from app.models import db, Event
+
+_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5(
+        title, description,
+        content='event', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_fts_ai AFTER INSERT ON event BEGIN
+        INSERT INTO event_fts(rowid, title, description)
+        VALUES (new.id, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_fts_ad AFTER DELETE ON event BEGIN
+        INSERT INTO event_fts(event_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_fts_au AFTER UPDATE OF title, description ON event BEGIN
+        INSERT INTO event_fts(event_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''));
+        INSERT INTO event_fts(rowid, title, description)
+        VALUES (new.id, new.title, coalesce(new.description, ''));
+    END
+    """,
+]
+
+# Title matches count ten times as much as description matches
+_RANK = 'bm25(event_fts, 10.0, 1.0)'
+
+# engine (the main database or a shard) -> whether event_fts is usable
+_fts_available = {}
+
+
+def ensure_search_index():
+    """Create the FTS table and triggers if missing, indexing existing events once.
+
+    Returns False when the database has no FTS5 support.
+    """
+    engine = db.session.get_bind()
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    existed = db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_fts'"
+    )).first() is not None
+    try:
+        for statement in _SCHEMA:
+            db.session.execute(db.text(statement))
+        if not existed:
+            rebuild_search_index(commit=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Full-text search unavailable: {e}")
+        _fts_available[engine] = False
+        return False
+
+    _fts_available[engine] = True
+    return True
+
+
+def rebuild_search_index(commit=True):
+    """Re-index every event from the event table"""
+    db.session.execute(db.text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
+    if commit:
+        db.session.commit()
+
+
+def fts_query(text):
+    """Turn user input into an FTS5 query: every word must match, the last one as a prefix.
+
+    Words are quoted so FTS5 operators and punctuation in the input are taken literally.
+    """
+    words = re.findall(r'\w+', text, flags=re.UNICODE)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_events(calendar_ids, text, limit=20, offset=0):
+    """Events in the given calendars matching `text`, best match first.
+
+    Returns (event dicts, has_more).
+    """
+    from app.shards import shard_router
+
+    if not calendar_ids:
+        return [], False
+
+    # Across shards each one returns its first offset + limit rows and the page is cut after merging
+    skip = offset if shard_router.enabled else 0
+    results = []
+    for shard_calendar_ids in shard_router.each(calendar_ids):
+        results.extend(_search_shard(shard_calendar_ids, text, limit + skip + 1, offset - skip))
+    if shard_router.enabled:
+        results.sort(key=lambda event_dict: event_dict['start_time'], reverse=True)
+        results.sort(key=lambda event_dict: event_dict.get('rank', 0))
+    return results[skip:skip + limit], len(results) > skip + limit
+
+
+def _search_shard(calendar_ids, text, limit, offset):
+    """Up to `limit` matches in the calendars of the database the session points at"""
+    available = _fts_available.get(db.session.get_bind())
+    if available is None:
+        available = ensure_search_index()
+
+    if available:
+        match = fts_query(text)
+        if match is None:
+            return []
+        rows = db.session.execute(
+            db.text(f"""
+                SELECT event.id, {_RANK} AS rank
+                FROM event_fts
+                JOIN event ON event.id = event_fts.rowid
+                WHERE event_fts MATCH :match
+                  AND event.calendar_id IN :calendar_ids
+                ORDER BY rank, event.start_time DESC
+                LIMIT :limit OFFSET :offset
+            """).bindparams(db.bindparam('calendar_ids', expanding=True)),
+            {'match': match, 'calendar_ids': list(calendar_ids), 'limit': limit, 'offset': offset}
+        ).all()
+        ranks = {row.id: row.rank for row in rows}
+        position = {event_id: index for index, event_id in enumerate(ranks)}
+        events = Event.query.filter(Event.id.in_(ranks)).all() if ranks else []
+        events.sort(key=lambda event: position[event.id])
+    else:
+        # Match the text literally: % and _ in it are not wildcards
+        escaped = text.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"%{escaped}%"
+        events = Event.query.filter(
+            Event.calendar_id.in_(calendar_ids),
+            db.or_(Event.title.ilike(pattern, escape='\\'), Event.description.ilike(pattern, escape='\\'))
+        ).order_by(Event.start_time.desc()).limit(limit).offset(offset).all()
+        ranks = {}
+
+    results = []
+    for event in events:
+        event_dict = event.to_dict()
+        if event.id in ranks:
+            event_dict['rank'] = ranks[event.id]
+        results.append(event_dict)
+    return results
@@ -0,0 +1,402 @@
+"""
+Calendar-sharded event storage across several SQLite files.
+
+SQLite lets one connection write at a time, so with every family in one
+calendar.db a busy calendar's writes queue behind everyone else's. With
+SHARDING_ENABLED the per-calendar tables (events, reminders, the change
+log and calendar versions, plus the search index over them) move into
+SHARD_COUNT files, `<main db>_shard<k>.db`, and a calendar's rows all live
+in one of them. Writes to calendars on different shards take different
+locks and commit in parallel. Users, calendars, memberships, jobs and push
+queues stay in the main ("core") database.
+
+Every shard connection ATTACHes the core database as `core`. SQLite looks
+unqualified table names up in `main` first, so on a shard connection
+`event` is the shard's table and `calendar` or `user_calendar` are core's:
+joins across the two keep working unchanged.
+
+`ShardRouter` picks the shard of a calendar (a `calendar_shard` placement
+row if the calendar was moved, else `calendar_id % SHARD_COUNT`) and points
+the session at it:
+
+    shard_router.route(calendar_id)        # rest of the request (routes, run_db functions)
+    with shard_router.calendar(calendar_id):  # a block of library code
+        ...
+    for ids in shard_router.each(calendar_ids):  # per-user views, one shard at a time
+        ...
+
+Route before the first statement of a transaction that writes: core rows
+written on a shard connection (memberships of a deleted calendar, queued
+pushes) then commit in the same SQLite transaction as the shard's rows.
+Event and reminder ids stay unique across shards: they are handed out in
+blocks of SHARD_ID_BLOCK_SIZE from `shard_sequence` in the core database.
+
+Without SHARDING_ENABLED every helper is a no-op and `each` yields all ids
+at once, so the app behaves as with a single database. `flask
+rebalance-shards` moves existing events out of the main database when
+sharding is turned on, and moves calendars between shards to even out
+their sizes.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event as sa_event
+from app.models import db, ensure_indexes, CalendarShard, CalendarVersion, Event, EventChange, Reminder
+
+CORE = 'core'
+SHARDED_TABLES = (Event.__table__, Reminder.__table__, EventChange.__table__, CalendarVersion.__table__)
+_SEQUENCES = ('event', 'reminder')
+
+_EVENT_COLUMNS = ('id, title, description, start_time, end_time, all_day, reminder_minutes, '
+                  'created_at, updated_at, calendar_id')
+_REMINDER_COLUMNS = 'id, event_id, reminder_time, sent, created_at'
+
+
+class ShardRouter:
+    """Places calendars on shard databases and routes the session to them"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.count = 1
+        self.paths = []
+        self.engines = []
+        self.core_path = None
+        self.block_size = 100
+        self.counters = defaultdict(int)
+        self._blocks = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['shard_router'] = self
+        self.block_size = app.config.get('SHARD_ID_BLOCK_SIZE', 100)
+        if not app.config.get('SHARDING_ENABLED', False):
+            return
+
+        with app.app_context():
+            engine = db.engine
+            main_path = engine.url.database
+            if engine.dialect.name != 'sqlite' or not main_path or main_path == ':memory:':
+                app.logger.warning("Sharding needs a file-based SQLite database; sharding disabled")
+                return
+            if app.config.get('ARCHIVE_ENABLED', False):
+                app.logger.warning("The event archive does not support shards; sharding disabled")
+                return
+            self.core_path = main_path
+            directory = app.config.get('SHARD_DIR') or os.path.dirname(main_path)
+            base = os.path.splitext(os.path.basename(main_path))[0]
+            self.count = max(1, app.config.get('SHARD_COUNT', 4))
+            self.paths = [os.path.join(directory, f"{base}_shard{index}.db") for index in range(self.count)]
+            self.engines = [self._create_engine(path) for path in self.paths]
+            self.enabled = True
+
+    def _create_engine(self, path):
+        engine = create_engine(f"sqlite:///{path}")
+
+        def attach_core(dbapi_connection, connection_record):
+            dbapi_connection.execute("ATTACH DATABASE ? AS core", (self.core_path,))
+
+        sa_event.listen(engine, 'connect', attach_core)
+        return engine
+
+    # Placement
+
+    def shard_for(self, calendar_id):
+        """Index of the shard holding a calendar (None without sharding)"""
+        return self.placement([calendar_id])[calendar_id]
+
+    def placement(self, calendar_ids):
+        """{calendar_id: shard index} for a set of calendars, in one core query"""
+        calendar_ids = set(calendar_ids)
+        if not self.enabled:
+            return dict.fromkeys(calendar_ids)
+        placed = dict(db.session.execute(
+            db.select(CalendarShard.calendar_id, CalendarShard.shard).where(CalendarShard.calendar_id.in_(calendar_ids)),
+            bind_arguments={'bind': db.engine}
+        ).all()) if calendar_ids else {}
+        return {calendar_id: placed.get(calendar_id, calendar_id % self.count) for calendar_id in calendar_ids}
+
+    def locate_event(self, event_id):
+        """Index of the shard holding an event, probing each one by primary key (None if nowhere)"""
+        if not self.enabled:
+            return None
+        for index, engine in enumerate(self.engines):
+            found = db.session.execute(db.select(Event.calendar_id).where(Event.id == event_id),
+                                       bind_arguments={'bind': engine}).first()
+            if found is not None:
+                return index
+        return None
+
+    # Routing
+
+    def route(self, calendar_id):
+        """Send the session's statements to a calendar's shard for the rest of the request.
+
+        Returns the shard index (None without sharding).
+        """
+        if not self.enabled:
+            return None
+        index = self.shard_for(calendar_id)
+        db.session.info['bind'] = self.engines[index]
+        return index
+
+    def route_event(self, event_id):
+        """Send the session's statements to the shard holding an event, if it exists; returns its index"""
+        index = self.locate_event(event_id)
+        if index is not None:
+            db.session.info['bind'] = self.engines[index]
+        return index
+
+    @contextmanager
+    def shard(self, index):
+        """Route the session to one shard inside the block (no-op for None or without sharding)"""
+        if not self.enabled or index is None:
+            yield
+            return
+        previous = db.session.info.get('bind')
+        db.session.info['bind'] = self.engines[index]
+        try:
+            yield
+        finally:
+            db.session.info['bind'] = previous
+
+    @contextmanager
+    def calendar(self, calendar_id):
+        """Route the session to a calendar's shard inside the block"""
+        with self.shard(self.shard_for(calendar_id) if self.enabled else None):
+            yield
+
+    def each(self, calendar_ids):
+        """Yield the calendar ids one shard at a time, with the session routed to that shard"""
+        calendar_ids = list(calendar_ids)
+        if not self.enabled:
+            yield calendar_ids
+            return
+        groups = defaultdict(list)
+        for calendar_id, index in self.placement(calendar_ids).items():
+            groups[index].append(calendar_id)
+        for index in sorted(groups):
+            with self.shard(index):
+                yield groups[index]
+
+    def each_shard(self):
+        """Route the session to every shard in turn (yields once, unrouted, without sharding)"""
+        if not self.enabled:
+            yield None
+            return
+        for index in range(self.count):
+            with self.shard(index):
+                yield index
+
+    # Ids unique across shards
+
+    def next_id(self, name):
+        """Next id for table `name`, from a block reserved in the core database"""
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                # Its own connection and transaction: the block stays reserved whatever the caller does
+                with db.engine.begin() as connection:
+                    start = self._reserve(connection, name, self.block_size)
+                block = self._blocks[name] = [start, start + self.block_size]
+                self.counters['id_blocks'] += 1
+            block[0] += 1
+            return block[0] - 1
+
+    def reserve_ids(self, name, count):
+        """First of `count` consecutive ids for table `name`, in the session's core transaction"""
+        return self._reserve(db.session.connection(bind_arguments={'bind': db.engine}), name, count)
+
+    def _reserve(self, connection, name, count):
+        reserve = db.text(
+            "UPDATE shard_sequence SET next_id = next_id + :count WHERE name = :name RETURNING next_id - :count"
+        )
+        start = connection.execute(reserve, {'name': name, 'count': count}).scalar()
+        if start is None:
+            # No row yet when the tables came from plain db.create_all() rather than create_all() below
+            connection.execute(db.text(
+                "INSERT INTO shard_sequence (name, next_id) VALUES (:name, :next_id) ON CONFLICT(name) DO NOTHING"
+            ), {'name': name, 'next_id': self._largest_id(name) + 1})
+            start = connection.execute(reserve, {'name': name, 'count': count}).scalar()
+        return start
+
+    def _largest_id(self, name):
+        """Largest id of table `name` in the main database and every shard"""
+        largest = 0
+        for engine in [db.engine, *self.engines]:
+            with engine.connect() as connection:
+                largest = max(largest, connection.execute(db.text(f"SELECT max(id) FROM {name}")).scalar() or 0)
+        return largest
+
+    # Schema
+
+    def create_all(self):
+        """Create the sharded tables, their indexes and search index in every shard"""
+        from app.search import ensure_search_index
+
+        if not self.enabled:
+            return
+        for engine in self.engines:
+            db.metadata.create_all(bind=engine, tables=SHARDED_TABLES)
+            ensure_indexes(engine, SHARDED_TABLES)
+        for _ in self.each_shard():
+            ensure_search_index()
+
+        # Start every id sequence past the largest id in use anywhere
+        for name in _SEQUENCES:
+            largest = self._largest_id(name)
+            db.session.execute(db.text(
+                "INSERT INTO shard_sequence (name, next_id) VALUES (:name, :next_id) "
+                "ON CONFLICT(name) DO UPDATE SET next_id = max(next_id, excluded.next_id)"
+            ), {'name': name, 'next_id': largest + 1}, bind_arguments={'bind': db.engine})
+        db.session.commit()
+
+    # Moving calendars
+
+    def move_calendar(self, calendar_id, target, source=None):
+        """Move a calendar's rows from its shard (or CORE) to shard `target`; returns the events moved.
+
+        One SQLite transaction across both files and the core placement row. The source's
+        write lock is taken first, so no write can land between the copy and the delete.
+        """
+        source = self.shard_for(calendar_id) if source is None else source
+        if source == target:
+            return 0
+
+        raw = self.engines[target].raw_connection()
+        try:
+            cursor = raw.cursor()
+            schema = CORE if source == CORE else 'source'
+            if source != CORE:
+                cursor.execute("ATTACH DATABASE ? AS source", (self.paths[source],))
+            try:
+                moved = self._copy_calendar(cursor, schema, calendar_id, target)
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                if source != CORE:
+                    cursor.execute("DETACH DATABASE source")
+        finally:
+            raw.close()
+        self.counters['calendars_moved'] += 1
+        self.counters['events_moved'] += moved
+        return moved
+
+    @staticmethod
+    def _copy_calendar(cursor, schema, calendar_id, target):
+        params = {'calendar_id': calendar_id, 'target': target}
+        cursor.execute(f"UPDATE {schema}.calendar_version SET version = version + 1 "
+                       f"WHERE calendar_id = :calendar_id", params)
+        cursor.execute(f"INSERT INTO main.event ({_EVENT_COLUMNS}) SELECT {_EVENT_COLUMNS} "
+                       f"FROM {schema}.event WHERE calendar_id = :calendar_id", params)
+        moved = cursor.rowcount
+        cursor.execute(f"INSERT INTO main.reminder ({_REMINDER_COLUMNS}) SELECT {_REMINDER_COLUMNS} "
+                       f"FROM {schema}.reminder WHERE event_id IN "
+                       f"(SELECT id FROM {schema}.event WHERE calendar_id = :calendar_id)", params)
+
+        # Change-log ids are per database. Numbering the moved entries after every id the source
+        # handed out means each client cursor from the source replays them, so nothing is missed.
+        cursor.execute(f"SELECT max(coalesce((SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'event_change'), 0), "
+                       f"coalesce((SELECT max(id) FROM {schema}.event_change), 0))")
+        params['seq'] = cursor.fetchone()[0]
+        cursor.execute("UPDATE main.sqlite_sequence SET seq = :seq WHERE name = 'event_change' AND seq < :seq", params)
+        cursor.execute("INSERT INTO main.sqlite_sequence (name, seq) SELECT 'event_change', :seq "
+                       "WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = 'event_change')", params)
+        cursor.execute(f"INSERT INTO main.event_change (calendar_id, event_id, deleted, changed_at) "
+                       f"SELECT calendar_id, event_id, deleted, changed_at FROM {schema}.event_change "
+                       f"WHERE calendar_id = :calendar_id ORDER BY id", params)
+        cursor.execute(f"INSERT INTO main.calendar_version (calendar_id, version) "
+                       f"SELECT calendar_id, version FROM {schema}.calendar_version WHERE calendar_id = :calendar_id "
+                       f"ON CONFLICT(calendar_id) DO UPDATE SET version = max(version, excluded.version) + 1", params)
+
+        cursor.execute(f"DELETE FROM {schema}.reminder WHERE event_id IN "
+                       f"(SELECT id FROM {schema}.event WHERE calendar_id = :calendar_id)", params)
+        for table in ('event', 'event_change', 'calendar_version'):
+            cursor.execute(f"DELETE FROM {schema}.{table} WHERE calendar_id = :calendar_id", params)
+        cursor.execute("INSERT INTO core.calendar_shard (calendar_id, shard) VALUES (:calendar_id, :target) "
+                       "ON CONFLICT(calendar_id) DO UPDATE SET shard = excluded.shard", params)
+        return moved
+
+    def sweep(self, moves, grace_seconds):
+        """Move rows written to a calendar's old shard by requests that placed it before its move.
+
+        Such a write waited on the move's lock and committed after it, so it is done once
+        in-flight requests have finished; `moves` is [(calendar_id, source)].
+        """
+        time.sleep(grace_seconds)
+        return sum(self.move_calendar(calendar_id, self.shard_for(calendar_id), source=source)
+                   for calendar_id, source in moves)
+
+    def calendar_sizes(self):
+        """{shard index: {calendar_id: event count}} as stored now"""
+        sizes = {}
+        for index, engine in enumerate(self.engines):
+            sizes[index] = dict(db.session.execute(
+                db.select(Event.calendar_id, db.func.count()).group_by(Event.calendar_id),
+                bind_arguments={'bind': engine}
+            ).all())
+        return sizes
+
+    def legacy_calendars(self):
+        """{calendar_id: event count} of calendars that still have rows in the main database's event tables"""
+        return dict(db.session.execute(db.text(
+            "SELECT calendar_id, count(id) FROM (SELECT calendar_id, id FROM event "
+            "UNION ALL SELECT calendar_id, NULL FROM event_change "
+            "UNION ALL SELECT calendar_id, NULL FROM calendar_version) GROUP BY calendar_id ORDER BY calendar_id"
+        ), bind_arguments={'bind': db.engine}).all())
+
+    def stats(self):
+        """Shard files and their sizes, plus id block and move counters, for health checks"""
+        if not self.enabled:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'count': self.count,
+            'shards': [{'path': path, 'bytes': os.path.getsize(path) if os.path.exists(path) else 0}
+                       for path in self.paths],
+            **dict(self.counters)
+        }
+
+
+def plan_rebalance(sizes, tolerance=0.1):
+    """Calendar moves [(calendar_id, source, target)] that even out shard event counts.
+
+    Greedy: move the largest calendar of the fullest shard that fits in half the gap
+    to the emptiest one, until every shard is within `tolerance` of the mean.
+    """
+    sizes = {index: dict(calendars) for index, calendars in sizes.items()}
+    totals = {index: sum(calendars.values()) for index, calendars in sizes.items()}
+    slack = tolerance * sum(totals.values()) / max(len(totals), 1)
+    moves = []
+    while True:
+        fullest = max(totals, key=totals.get)
+        emptiest = min(totals, key=totals.get)
+        gap = totals[fullest] - totals[emptiest]
+        if gap <= slack:
+            return moves
+        fitting = [(count, calendar_id) for calendar_id, count in sizes[fullest].items() if 0 < count <= gap / 2]
+        if not fitting:
+            return moves
+        count, calendar_id = max(fitting)
+        del sizes[fullest][calendar_id]
+        sizes[emptiest][calendar_id] = count
+        totals[fullest] -= count
+        totals[emptiest] += count
+        moves.append((calendar_id, fullest, emptiest))
+
+
+shard_router = ShardRouter()
+
+
+@db.event.listens_for(Event, 'before_insert')
+@db.event.listens_for(Reminder, 'before_insert')
+def _assign_shard_id(mapper, connection, target):
+    # Autoincrement would hand out the same id on two shards
+    if shard_router.enabled and target.id is None:
+        target.id = shard_router.next_id(mapper.local_table.name)
@@ -0,0 +1,117 @@
+"""
+Per-client msgpack serialization of Socket.IO traffic.
+
+Socket.IO packets are JSON text by default. A client that connects with
+`?serializer=msgpack` (socket.io-msgpack-parser in the browser,
+`socketio.Client(serializer='msgpack')` in Python) exchanges msgpack frames
+instead: binary, with no quoting or escaping, and cheaper to decode for the
+bulk payloads. Everyone else keeps JSON, so both kinds of client share the
+same calendar rooms.
+
+python-socketio uses one packet class per server, so `NegotiatedPacket`
+decodes both formats (binary frames are msgpack, text frames JSON) and
+`SocketSerializer` sends each outgoing packet in the format its recipient
+chose when the Engine.IO connection was opened. Needs the msgpack package
+and the python-socketio server internals it hooks (`_send_packet` and the
+Engine.IO connect/disconnect handlers); without them, or with
+SOCKETIO_MSGPACK_ENABLED=false, every client gets JSON and a warning is
+logged.
+"""
+
+from collections import defaultdict
+from urllib.parse import parse_qs
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class NegotiatedPacket(packet.Packet):
+    """A Socket.IO packet that decodes JSON text and msgpack binary frames alike"""
+
+    def encode_msgpack(self):
+        # Same layout as socketio.msgpack_packet and socket.io-msgpack-parser; msgpack
+        # carries bytes inline, so there are no separate binary attachment packets
+        encoded = self._to_dict()
+        encoded['type'] = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}.get(
+            self.packet_type, self.packet_type)
+        return msgpack.dumps(encoded)
+
+    def decode(self, encoded_packet):
+        if not isinstance(encoded_packet, bytes):
+            return super().decode(encoded_packet)
+        decoded = msgpack.loads(encoded_packet)
+        self.packet_type = decoded['type']
+        self.data = decoded.get('data')
+        self.id = decoded.get('id')
+        self.namespace = decoded['nsp']
+        return 0
+
+
+class SocketSerializer:
+    """Lets each Socket.IO client pick JSON or msgpack frames"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.msgpack_sids = set()
+        self.counters = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['socket_serializer'] = self
+        self.enabled = False
+        if not app.config.get('SOCKETIO_MSGPACK_ENABLED', True):
+            return
+        if msgpack is None:
+            app.logger.warning("SOCKETIO_MSGPACK_ENABLED is set but msgpack is not installed; "
+                               "Socket.IO clients get JSON only")
+            return
+
+        from app import socketio
+        server = socketio.server
+        # Hooks into python-socketio internals; a version without them keeps plain JSON
+        missing = [name for name in ('_send_packet', '_handle_eio_connect', '_handle_eio_disconnect')
+                   if not hasattr(server, name)]
+        if missing:
+            app.logger.warning(f"Socket.IO msgpack frames disabled: this python-socketio has no "
+                               f"{', '.join(missing)}; clients get JSON only")
+            return
+        self.enabled = True
+        server.packet_class = NegotiatedPacket
+        handle_connect = server._handle_eio_connect
+        handle_disconnect = server._handle_eio_disconnect
+        send_json = server._send_packet
+
+        def on_connect(eio_sid, environ):
+            query = parse_qs(environ.get('QUERY_STRING', ''))
+            if query.get('serializer') == ['msgpack']:
+                self.msgpack_sids.add(eio_sid)
+            return handle_connect(eio_sid, environ)
+
+        def on_disconnect(eio_sid):
+            self.msgpack_sids.discard(eio_sid)
+            return handle_disconnect(eio_sid)
+
+        def send_packet(eio_sid, pkt):
+            if eio_sid in self.msgpack_sids:
+                self.counters['msgpack_frames'] += 1
+                server.eio.send(eio_sid, pkt.encode_msgpack())
+            else:
+                self.counters['json_frames'] += 1
+                send_json(eio_sid, pkt)
+
+        # Engine.IO hands the handshake environ to its connect handler; every
+        # emit, ack and connect reply goes out through _send_packet
+        server.eio.on('connect', on_connect)
+        server.eio.on('disconnect', on_disconnect)
+        server._send_packet = send_packet
+
+    def stats(self):
+        """Connected msgpack clients and frames sent per format, for health checks"""
+        return {'enabled': self.enabled, 'msgpack_clients': len(self.msgpack_sids), **dict(self.counters)}
+
+
+socket_serializer = SocketSerializer()
@@ -0,0 +1,202 @@
+"""
+In-memory rolling window of upcoming events.
+
+Keeps every event starting within the next UPCOMING_WINDOW_HOURS (plus a
+margin) in sorted (start_time, id) lists, globally and per calendar, so
+`/api/events/upcoming` and `/api/calendars/<id>/upcoming-events` are answered
+with a couple of bisects instead of a table scan.
+
+The window is reloaded with one indexed range query every
+UPCOMING_WINDOW_REFRESH_SECONDS by a background task, which also picks up
+writes made by other worker processes. Mutations handled by this process
+update it immediately through upsert()/remove().
+"""
+
+import bisect
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+
+
+class UpcomingWindow:
+    """Sorted in-memory index of events starting soon"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.hours = 24
+        self.refresh_seconds = 60
+        self._lock = threading.Lock()
+        self._keys = []          # sorted [(start_time, event_id)]
+        self._by_calendar = {}   # calendar_id -> sorted [(start_time, event_id)]
+        self._events = {}        # event_id -> (start_time, calendar_id, event dict)
+        self.loaded_at = None
+        self.loaded_until = None
+        self._timer_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['upcoming_window'] = self
+        self.enabled = app.config.get('UPCOMING_WINDOW_ENABLED', True)
+        self.hours = app.config.get('UPCOMING_WINDOW_HOURS', 24)
+        self.refresh_seconds = app.config.get('UPCOMING_WINDOW_REFRESH_SECONDS', 60)
+
+    # Loading
+
+    def reload(self, now=None):
+        """Replace the window contents with one indexed range query"""
+        from app.db_pool import run_db
+
+        now = now or datetime.utcnow()
+        # Margin so the window still covers now + hours until the next refresh
+        until = now + timedelta(hours=self.hours, seconds=self.refresh_seconds * 2)
+        rows = run_db(_load_window_rows, now, until)
+
+        keys = []
+        by_calendar = {}
+        events = {}
+        for start_time, calendar_id, event_dict in rows:
+            key = (start_time, event_dict['id'])
+            keys.append(key)
+            by_calendar.setdefault(calendar_id, []).append(key)
+            events[event_dict['id']] = (start_time, calendar_id, event_dict)
+
+        with self._lock:
+            self._keys = keys
+            self._by_calendar = by_calendar
+            self._events = events
+            self.loaded_at = now
+            self.loaded_until = until
+
+    def _ensure_fresh(self, now):
+        self._ensure_timer()
+        stale = (
+            self.loaded_at is None
+            or now > self.loaded_at + timedelta(seconds=self.refresh_seconds * 2)
+            or now + timedelta(hours=self.hours) > self.loaded_until
+        )
+        if stale:
+            self.reload(now)
+
+    def _ensure_timer(self):
+        """Start the periodic refresh the first time the window is used"""
+        if self._timer_started:
+            return
+        self._timer_started = True
+        from app import socketio
+        socketio.start_background_task(self._refresh_loop, current_app._get_current_object())
+
+    def _refresh_loop(self, app):
+        from app import socketio
+        while True:
+            socketio.sleep(self.refresh_seconds)
+            try:
+                with app.app_context():
+                    self.reload()
+            except Exception as e:
+                app.logger.error(f"Upcoming events window refresh failed: {e}")
+
+    # Mutations
+
+    def upsert(self, event):
+        """Add or move an event after it was created or updated"""
+        if not self.enabled or self.loaded_at is None:
+            return
+        with self._lock:
+            self._remove_locked(event.id)
+            if self.loaded_at <= event.start_time <= self.loaded_until:
+                key = (event.start_time, event.id)
+                bisect.insort(self._keys, key)
+                bisect.insort(self._by_calendar.setdefault(event.calendar_id, []), key)
+                self._events[event.id] = (event.start_time, event.calendar_id, event.to_dict())
+
+    def remove(self, event_id):
+        """Drop an event after it was deleted"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remove_locked(event_id)
+
+    def remove_calendar(self, calendar_id):
+        """Drop every event of a deleted calendar"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for _, event_id in self._by_calendar.pop(calendar_id, []):
+                start_time, _, _ = self._events.pop(event_id)
+                self._discard(self._keys, (start_time, event_id))
+
+    def invalidate(self):
+        """Reload on the next read, after bulk writes that bypass upsert (imports)"""
+        with self._lock:
+            self.loaded_at = None
+
+    def _remove_locked(self, event_id):
+        existing = self._events.pop(event_id, None)
+        if existing is None:
+            return
+        start_time, calendar_id, _ = existing
+        key = (start_time, event_id)
+        self._discard(self._keys, key)
+        slice_ = self._by_calendar.get(calendar_id)
+        if slice_ is not None:
+            self._discard(slice_, key)
+            if not slice_:
+                del self._by_calendar[calendar_id]
+
+    @staticmethod
+    def _discard(keys, key):
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+
+    # Queries
+
+    def upcoming(self, now=None, hours=None):
+        """Events starting in (now, now + hours], or None if the window can't answer"""
+        if not self.enabled:
+            return None
+        hours = self.hours if hours is None else hours
+        if hours > self.hours:
+            return None
+        now = now or datetime.utcnow()
+        self._ensure_fresh(now)
+        with self._lock:
+            # (now, id=inf) sorts after every key with start_time == now, excluding them
+            lo = bisect.bisect_right(self._keys, (now, float('inf')))
+            hi = bisect.bisect_right(self._keys, (now + timedelta(hours=hours), float('inf')))
+            return [self._events[event_id][2] for _, event_id in self._keys[lo:hi]]
+
+    def calendar_upcoming(self, calendar_id, limit=5, now=None):
+        """Next `limit` events of one calendar, or None if the window holds fewer.
+
+        Events beyond the window may exist, so a short slice can't be trusted
+        and the caller falls back to the database.
+        """
+        if not self.enabled:
+            return None
+        now = now or datetime.utcnow()
+        self._ensure_fresh(now)
+        with self._lock:
+            keys = self._by_calendar.get(calendar_id, [])
+            lo = bisect.bisect_left(keys, (now, -1))
+            selected = keys[lo:lo + limit]
+            if len(selected) < limit:
+                return None
+            return [self._events[event_id][2] for _, event_id in selected]
+
+
+def _load_window_rows(start, until):
+    from app.models import Event
+    from app.shards import shard_router
+    events = []
+    for _ in shard_router.each_shard():
+        events += Event.query.filter(
+            Event.start_time >= start,
+            Event.start_time <= until
+        ).order_by(Event.start_time, Event.id).all()
+    events.sort(key=lambda event: (event.start_time, event.id))
+    return [(event.start_time, event.calendar_id, event.to_dict()) for event in events]
+
+
+upcoming_window = UpcomingWindow()
@@ -0,0 +1,8 @@
+"""
+Calindar benchmark suite.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.seed --db /tmp/bench.db --users 500
+    python -m benchmarks.api --db /tmp/bench.db --output results.json
+"""
@@ -0,0 +1,438 @@
+"""
+API load benchmark.
+
+Drives every /api route against a seeded database, first through the Flask
+test client (no network, measures the app itself) and then through a real
+gevent server with concurrent keep-alive clients. Reports p50/p95/p99
+latency, throughput and SQL query counts per endpoint as JSON.
+
+    python -m benchmarks.seed --db /tmp/bench.db
+    python -m benchmarks.api --db /tmp/bench.db --requests 200 --output before.json
+"""
+
+import argparse
+import http.client
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.common import create_bench_app, start_server, summarize, write_results
+
+
+class TestClientDriver:
+    """Issues requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        # bytes bodies are sent as-is (archive uploads), everything else as JSON
+        payload = {'data': body} if isinstance(body, bytes) else {'json': body}
+        response = self.client.open(path, method=method, **payload)
+        return response.status_code, response.headers, response.get_data()
+
+    def fresh(self):
+        return TestClientDriver(self.app)
+
+
+class HttpDriver:
+    """Issues requests over a keep-alive HTTP connection, tracking the session cookie"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {}
+        payload = None
+        if isinstance(body, bytes):
+            payload = body
+            headers['Content-Type'] = 'application/octet-stream'
+        elif body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Reconnect once if the server closed the keep-alive connection
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status, dict(response.getheaders()), data
+
+    def fresh(self):
+        return HttpDriver(self.host, self.port)
+
+
+def load_fixture(db_path):
+    """Pick representative ids from the seeded database"""
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        # The busiest calendar and its owner stress the heavy paths
+        calendar_id, = conn.execute(
+            "SELECT calendar_id FROM event GROUP BY calendar_id ORDER BY count(*) DESC LIMIT 1"
+        ).fetchone()
+        share_code, = conn.execute("SELECT share_code FROM calendar WHERE id = ?", (calendar_id,)).fetchone()
+        owner, = conn.execute(
+            "SELECT u.username FROM user u JOIN user_calendar uc ON uc.user_id = u.id "
+            "WHERE uc.calendar_id = ? AND uc.is_owner = 1", (calendar_id,)
+        ).fetchone()
+        other, = conn.execute(
+            "SELECT username FROM user WHERE username != ? ORDER BY id LIMIT 1", (owner,)
+        ).fetchone()
+        event_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM event WHERE calendar_id = ? ORDER BY id", (calendar_id,)
+        )]
+        return {
+            'calendar_id': calendar_id,
+            'share_code': share_code,
+            'username': owner,
+            'other_username': other,
+            'event_ids': event_ids,
+        }
+    finally:
+        conn.close()
+
+
+class Context:
+    """Per-worker state shared by endpoint specs"""
+
+    def __init__(self, driver, fixture, worker_id):
+        self.driver = driver
+        self.fixture = fixture
+        self.rng = random.Random(worker_id)
+        self.worker_id = worker_id
+        self.counter = 0
+        self.other = None
+        self.archive = None
+        self.importer = None
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.worker_id}x{self.counter}"
+
+    def login(self, driver, username):
+        status, _, _ = driver.request('POST', '/api/user/login', {'username': username})
+        if status != 200:
+            raise RuntimeError(f"Login as {username} failed with {status}")
+
+    def other_driver(self):
+        if self.other is None:
+            self.other = self.driver.fresh()
+            self.login(self.other, self.fixture['other_username'])
+        return self.other
+
+    def create_calendar(self, driver=None):
+        _, _, body = (driver or self.driver).request('POST', '/api/calendars', {'name': self.unique('bench')})
+        return json.loads(body)
+
+    def create_event(self):
+        start = datetime.utcnow() + timedelta(days=self.rng.randint(1, 60))
+        _, _, body = self.driver.request('POST', '/api/events', {
+            'title': self.unique('Bench event '),
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+            'calendar_id': self.fixture['calendar_id'],
+        })
+        return json.loads(body)
+
+    def random_event_id(self):
+        return self.rng.choice(self.fixture['event_ids'])
+
+
+def _new_event_body(ctx):
+    start = datetime.utcnow() + timedelta(days=ctx.rng.randint(1, 60), hours=ctx.rng.randint(0, 12))
+    return {
+        'title': ctx.unique('Bench event '),
+        'description': 'Created by benchmarks.api',
+        'start_time': start.isoformat(),
+        'end_time': (start + timedelta(hours=1)).isoformat(),
+        'calendar_id': ctx.fixture['calendar_id'],
+        'reminder_minutes': 15,
+    }
+
+
+def _register(ctx):
+    driver = ctx.driver.fresh()
+    return driver, 'POST', '/api/user/register', {'username': ctx.unique('r')}
+
+
+def _logout(ctx):
+    driver = ctx.driver.fresh()
+    ctx.login(driver, ctx.fixture['username'])
+    return driver, 'POST', '/api/user/logout', None
+
+
+def _join(ctx):
+    calendar = ctx.create_calendar(ctx.other_driver())
+    return ctx.driver, 'POST', '/api/calendars/join', {'share_code': calendar['share_code']}
+
+
+def _leave(ctx):
+    calendar = ctx.create_calendar()
+    return ctx.driver, 'DELETE', f"/api/calendars/{calendar['id']}/leave", None
+
+
+def _delete_calendar(ctx):
+    calendar = ctx.create_calendar()
+    return ctx.driver, 'DELETE', f"/api/calendars/{calendar['id']}", None
+
+
+def _calendar_with_member(ctx):
+    calendar = ctx.create_calendar()
+    other = ctx.other_driver()
+    other.request('POST', '/api/calendars/join', {'share_code': calendar['share_code']})
+    _, _, body = other.request('GET', '/api/user/current')
+    return calendar, json.loads(body)['id']
+
+
+def _remove_member(ctx):
+    calendar, member_id = _calendar_with_member(ctx)
+    return ctx.driver, 'DELETE', f"/api/calendars/{calendar['id']}/members/{member_id}", None
+
+
+def _transfer_ownership(ctx):
+    calendar, member_id = _calendar_with_member(ctx)
+    return ctx.driver, 'POST', f"/api/calendars/{calendar['id']}/transfer-ownership", {'new_owner_id': member_id}
+
+
+def _push_subscription(ctx):
+    return {'endpoint': f"https://push.example.com/{ctx.unique('s')}", 'keys': {'p256dh': 'bench', 'auth': 'bench'}}
+
+
+def _delete_push_subscription(ctx):
+    subscription = _push_subscription(ctx)
+    ctx.driver.request('POST', '/api/push/subscriptions', subscription)
+    return ctx.driver, 'DELETE', '/api/push/subscriptions', {'endpoint': subscription['endpoint']}
+
+
+def _delete_event(ctx):
+    event = ctx.create_event()
+    return ctx.driver, 'DELETE', f"/api/events/{event['id']}", None
+
+
+def _import_archive(ctx):
+    # Import the fixture user's export into a throwaway user, so the fixture's calendars don't multiply
+    if ctx.archive is None:
+        _, _, ctx.archive = ctx.driver.request('GET', '/api/users/export')
+        ctx.importer = ctx.driver.fresh()
+        ctx.importer.request('POST', '/api/user/register', {'username': ctx.unique('imp')})
+    return ctx.importer, 'POST', '/api/users/import', ctx.archive
+
+
+def _export_job(ctx):
+    # Untimed: queue an export; the timed request only reads the job row
+    _, _, body = ctx.driver.request('POST', '/api/users/export', {})
+    return json.loads(body)['job']
+
+
+# Each spec maps a route rule to a builder returning (driver, method, path, json body).
+# Builders may perform untimed setup requests first.
+ENDPOINTS = {
+    'POST /api/users': lambda ctx: (ctx.driver.fresh(), 'POST', '/api/users', {'username': ctx.unique('u')}),
+    'GET /api/users/current': lambda ctx: (ctx.driver, 'GET', '/api/users/current', None),
+    'GET /api/users/calendars': lambda ctx: (ctx.driver, 'GET', '/api/users/calendars', None),
+    'GET /api/users/agenda': lambda ctx: (ctx.driver, 'GET', '/api/users/agenda?limit=20', None),
+    'GET /api/users/export': lambda ctx: (ctx.driver, 'GET', '/api/users/export', None),
+    'POST /api/users/import': _import_archive,
+    'POST /api/users/export': lambda ctx: (ctx.driver, 'POST', '/api/users/export', {}),
+    'GET /api/jobs': lambda ctx: (ctx.driver, 'GET', '/api/jobs', None),
+    'GET /api/jobs/<int:job_id>': lambda ctx: (ctx.driver, 'GET', f"/api/jobs/{_export_job(ctx)['id']}", None),
+    # Answers 409 while the export is still queued, the archive once it is done
+    'GET /api/jobs/<int:job_id>/download':
+        lambda ctx: (ctx.driver, 'GET', f"/api/jobs/{_export_job(ctx)['id']}/download", None),
+    'POST /api/calendars': lambda ctx: (ctx.driver, 'POST', '/api/calendars', {'name': ctx.unique('bench')}),
+    'GET /api/calendars': lambda ctx: (ctx.driver, 'GET', '/api/calendars', None),
+    'POST /api/calendars/join': _join,
+    'DELETE /api/calendars/<int:calendar_id>/leave': _leave,
+    'GET /api/calendars/<int:calendar_id>/members':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/members", None),
+    'GET /api/calendars/<int:calendar_id>/upcoming-events':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/upcoming-events", None),
+    'GET /api/calendars/<share_code>':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['share_code']}", None),
+    'GET /api/calendars/<int:calendar_id>':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}", None),
+    'GET /api/calendars/<int:calendar_id>/events':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/events", None),
+    'GET /api/calendars/<int:calendar_id>/month/<month>/summary':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/month/"
+                                        f"{datetime.utcnow():%Y-%m}/summary", None),
+    'GET /api/calendars/<int:calendar_id>/freebusy':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/freebusy?"
+                                        f"start={datetime.utcnow():%Y-%m-%dT00:00:00}&"
+                                        f"end={datetime.utcnow() + timedelta(days=7):%Y-%m-%dT00:00:00}&duration=60", None),
+    'GET /api/calendars/<int:calendar_id>/search':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/search?q=dentist", None),
+    'GET /api/users/search':
+        lambda ctx: (ctx.driver, 'GET', '/api/users/search?q=dentist', None),
+    'GET /api/calendars/<share_code>/events':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['share_code']}/events", None),
+    'GET /api/calendars/<int:calendar_id>/events/changes':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['calendar_id']}/events/changes", None),
+    'GET /api/calendars/<share_code>/events/changes':
+        lambda ctx: (ctx.driver, 'GET', f"/api/calendars/{ctx.fixture['share_code']}/events/changes?since=0", None),
+    'DELETE /api/calendars/<int:calendar_id>': _delete_calendar,
+    'DELETE /api/calendars/<int:calendar_id>/members/<int:member_id>': _remove_member,
+    'POST /api/calendars/<int:calendar_id>/transfer-ownership': _transfer_ownership,
+    'POST /api/events': lambda ctx: (ctx.driver, 'POST', '/api/events', _new_event_body(ctx)),
+    'GET /api/events/<int:event_id>':
+        lambda ctx: (ctx.driver, 'GET', f"/api/events/{ctx.random_event_id()}", None),
+    'PUT /api/events/<int:event_id>':
+        lambda ctx: (ctx.driver, 'PUT', f"/api/events/{ctx.random_event_id()}", {'title': ctx.unique('Renamed ')}),
+    'DELETE /api/events/<int:event_id>': _delete_event,
+    'GET /api/events/upcoming': lambda ctx: (ctx.driver, 'GET', '/api/events/upcoming', None),
+    'GET /api/push/public-key': lambda ctx: (ctx.driver, 'GET', '/api/push/public-key', None),
+    'POST /api/push/subscriptions':
+        lambda ctx: (ctx.driver, 'POST', '/api/push/subscriptions', _push_subscription(ctx)),
+    'DELETE /api/push/subscriptions': _delete_push_subscription,
+    'POST /api/push/test': lambda ctx: (ctx.driver, 'POST', '/api/push/test', None),
+    'GET /api/user/check-username':
+        lambda ctx: (ctx.driver, 'GET', f"/api/user/check-username?username={ctx.unique('c')}", None),
+    'POST /api/user/register': _register,
+    'POST /api/user/login':
+        lambda ctx: (ctx.driver.fresh(), 'POST', '/api/user/login', {'username': ctx.fixture['username']}),
+    'GET /api/user/current': lambda ctx: (ctx.driver, 'GET', '/api/user/current', None),
+    'POST /api/user/logout': _logout,
+}
+
+
+def api_routes(app):
+    """All 'METHOD rule' pairs registered under /api"""
+    routes = set()
+    for rule in app.url_map.iter_rules():
+        if not rule.rule.startswith('/api'):
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            routes.add(f"{method} {rule.rule}")
+    return routes
+
+
+def run_endpoint(name, contexts, total_requests):
+    """Run one endpoint spec across worker contexts and collect measurements"""
+    builder = ENDPOINTS[name]
+    per_worker = max(1, total_requests // len(contexts))
+    latencies = []
+    query_counts = []
+    statuses = {}
+    sizes = []
+    lock = threading.Lock()
+
+    def worker(ctx):
+        for _ in range(per_worker):
+            driver, method, path, body = builder(ctx)
+            started = time.perf_counter()
+            status, headers, data = driver.request(method, path, body)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                sizes.append(len(data))
+                if headers.get('X-Query-Count') is not None:
+                    query_counts.append(int(headers['X-Query-Count']))
+
+    started = time.perf_counter()
+    if len(contexts) == 1:
+        worker(contexts[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(contexts)) as pool:
+            list(pool.map(worker, contexts))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed)
+    result['statuses'] = statuses
+    result['mean_response_bytes'] = round(statistics.mean(sizes)) if sizes else 0
+    result['queries_per_request'] = statistics.median(query_counts) if query_counts else None
+    return result
+
+
+def run_suite(contexts, total_requests, only=None):
+    results = {}
+    for name in sorted(ENDPOINTS):
+        if only and only not in name:
+            continue
+        results[name] = run_endpoint(name, contexts, total_requests)
+        r = results[name]
+        print(f"   {name:<70} p50={r['p50_ms']:>8}ms p99={r['p99_ms']:>8}ms "
+              f"rps={r['throughput_rps']:>8} queries={r['queries_per_request']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every /api route')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients in server mode')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+    parser.add_argument('--only', help='Only run endpoints whose name contains this text')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    # Work on a copy so runs are repeatable against the same seed database
+    workdir = tempfile.mkdtemp(prefix='calindar-bench-')
+    db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+    fixture = load_fixture(db_copy)
+
+    app = create_bench_app(db_copy)
+    # Bring older seed databases up to the current schema, as the app does on first page load
+    with app.app_context():
+        from app.main.routes import init_db_if_needed
+        init_db_if_needed()
+    uncovered = sorted(api_routes(app) - set(ENDPOINTS))
+    if uncovered:
+        print("⚠️  Routes without a benchmark spec:")
+        for route in uncovered:
+            print(f"   {route}")
+
+    results = {}
+    if args.mode in ('client', 'both'):
+        print("🧪 Flask test client")
+        ctx = Context(TestClientDriver(app), fixture, 0)
+        ctx.login(ctx.driver, fixture['username'])
+        results['test_client'] = run_suite([ctx], args.requests, args.only)
+
+    if args.mode in ('server', 'both'):
+        print(f"🌐 gevent server, {args.concurrency} concurrent clients")
+        server = start_server(db_copy, args.port)
+        try:
+            contexts = []
+            for worker_id in range(args.concurrency):
+                ctx = Context(HttpDriver('127.0.0.1', args.port), fixture, worker_id)
+                ctx.login(ctx.driver, fixture['username'])
+                contexts.append(ctx)
+            results['gevent_server'] = run_suite(contexts, args.requests, args.only)
+        finally:
+            server.terminate()
+            server.wait()
+
+    params = {
+        'requests_per_endpoint': args.requests,
+        'concurrency': args.concurrency,
+        'events_in_calendar': len(fixture['event_ids']),
+        'uncovered_routes': uncovered,
+    }
+    write_results(args.output, 'api', params, results)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Make the app package importable when run as `python -m benchmarks.x` from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def create_bench_app(db_path, **overrides):
+    """Create an app instance bound to a benchmark database file"""
+    import config as config_module
+    from app import create_app
+
+    settings = {
+        'DEBUG': False,
+        'SECRET_KEY': 'benchmark-secret-key',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'QUERY_STATS_HEADERS': True,
+        # Slow query logging would distort the timings we are measuring
+        'SLOW_QUERY_THRESHOLD_MS': float('inf'),
+        'N_PLUS_ONE_THRESHOLD': 10 ** 9,
+    }
+    settings.update(overrides)
+    config_module.config['benchmark'] = type('BenchmarkConfig', (config_module.Config,), settings)
+    return create_app('benchmark')
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, elapsed_s=None):
+    """Summarize a list of latencies (milliseconds) into a JSON-friendly dict"""
+    values = sorted(latencies_ms)
+    summary = {
+        'count': len(values),
+        'p50_ms': _round(percentile(values, 50)),
+        'p95_ms': _round(percentile(values, 95)),
+        'p99_ms': _round(percentile(values, 99)),
+        'mean_ms': _round(sum(values) / len(values)) if values else None,
+        'max_ms': _round(values[-1]) if values else None,
+    }
+    if elapsed_s:
+        summary['throughput_rps'] = _round(len(values) / elapsed_s)
+    return summary
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def git_revision():
+    """Current git commit, so results can be diffed across commits"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def write_results(path, benchmark, params, results):
+    """Write benchmark results as stable, diff-friendly JSON"""
+    document = {
+        'benchmark': benchmark,
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'params': params,
+        'results': results,
+    }
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        print(f"📝 Results written to {path}")
+    else:
+        print(text)
+    return document
+
+
+def wait_for_port(host, port, timeout=30):
+    """Wait until a TCP port accepts connections"""
+    import socket
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on {host}:{port} did not start within {timeout}s")
+
+
+def start_server(db_path, port, host='127.0.0.1', extra_env=None):
+    """Start benchmarks.server (a real gevent server) in a subprocess"""
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.server', '--db', db_path, '--host', host, '--port', str(port)],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(host, port)
+    except Exception:
+        process.kill()
+        raise
+    return process
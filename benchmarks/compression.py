@@ -0,0 +1,113 @@
+"""
+CPU cost vs bytes saved for API response compression.
+
+Fetches real JSON payloads (event lists, month summary, agenda, search,
+delta-sync reload) for the busiest calendar of a seeded database, then
+compresses each one with every available encoding and level. For each
+combination it reports the compressed size, CPU time per response and the
+break-even bandwidth: on links slower than that, compressing saves more
+transfer time than it costs the server.
+
+    python -m benchmarks.compression --db /tmp/bench.db
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.api import load_fixture
+from benchmarks.common import create_bench_app, write_results
+
+LEVELS = {
+    'gzip': ('COMPRESS_GZIP_LEVEL', (1, 6, 9)),
+    'br': ('COMPRESS_BROTLI_QUALITY', (1, 4, 6, 11)),
+    'zstd': ('COMPRESS_ZSTD_LEVEL', (1, 3, 9)),
+}
+
+
+def fetch_payloads(app, fixture):
+    """Uncompressed response bodies of the heavy read endpoints"""
+    calendar_id = fixture['calendar_id']
+    paths = {
+        'calendar_events': f"/api/calendars/{calendar_id}/events",
+        'shared_events': f"/api/calendars/{fixture['share_code']}/events",
+        'event_changes_reload': f"/api/calendars/{calendar_id}/events/changes",
+        'month_summary': f"/api/calendars/{calendar_id}/month/{datetime.utcnow():%Y-%m}/summary",
+        'agenda': '/api/users/agenda?limit=200',
+        'search': f"/api/calendars/{calendar_id}/search?q=meeting&limit=100",
+    }
+    client = app.test_client()
+    client.post('/api/user/login', json={'username': fixture['username']})
+
+    payloads = {}
+    for name, path in paths.items():
+        response = client.get(path, headers={'Accept-Encoding': 'identity'})
+        if response.status_code == 200:
+            payloads[name] = response.get_data()
+        else:
+            print(f"   skipping {name}: {path} returned {response.status_code}")
+    return payloads
+
+
+def measure(body, encoding, setting, level, repeat):
+    from app.compression import compress_bytes
+
+    config = {setting: level}
+    compressed = compress_bytes(body, encoding, config)
+    started = time.process_time()
+    for _ in range(repeat):
+        compress_bytes(body, encoding, config)
+    cpu_ms = (time.process_time() - started) * 1000 / repeat
+
+    saved_bits = (len(body) - len(compressed)) * 8
+    return {
+        'bytes': len(compressed),
+        'ratio': round(len(compressed) / len(body), 4),
+        'cpu_ms': round(cpu_ms, 4),
+        'mb_per_s': round(len(body) / 1e6 / (cpu_ms / 1000), 1) if cpu_ms else None,
+        # Link speed at which the transfer time saved equals the CPU time spent
+        'break_even_mbit_s': round(saved_bits / 1e6 / (cpu_ms / 1000), 1) if cpu_ms else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compression of real API payloads')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--repeat', type=int, default=50, help='Compressions per payload and level')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='calindar-compress-')
+    try:
+        db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+        fixture = load_fixture(db_copy)
+        app = create_bench_app(db_copy, COMPRESS_ENABLED=False)
+        with app.app_context():
+            from app.main.routes import init_db_if_needed
+            init_db_if_needed()
+        payloads = fetch_payloads(app, fixture)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    from app.compression import available_encodings
+
+    results = {}
+    for name, body in payloads.items():
+        print(f"📦 {name}: {len(body):,} bytes")
+        results[name] = {'bytes': len(body), 'encodings': {}}
+        for encoding in available_encodings():
+            setting, levels = LEVELS[encoding]
+            for level in levels:
+                row = measure(body, encoding, setting, level, args.repeat)
+                results[name]['encodings'][f"{encoding}-{level}"] = row
+                print(f"   {encoding:>4} {level:>2}: {row['bytes']:>9,} bytes ({row['ratio']:.1%}) "
+                      f"{row['cpu_ms']:8.3f} ms  {row['mb_per_s']} MB/s  break-even {row['break_even_mbit_s']} Mbit/s")
+
+    params = {'repeat': args.repeat, 'calendar_id': fixture['calendar_id']}
+    write_results(args.output, 'compression', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Websocket latency under heavy database reads, with and without DB offloading.
+
+For each mode (DB_OFFLOAD_ENABLED=false/true) the app is started on a gevent
+server; a Socket.IO client measures `join_calendar` round-trips while idle
+and while several HTTP clients hammer the heaviest read endpoint. With the
+thread pool offload the loaded latency should stay close to the idle one.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.db_offload --db /tmp/bench.db --readers 16 --seconds 10
+"""
+
+import argparse
+import asyncio
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.common import start_server, summarize, write_results
+
+
+def busiest_calendar(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT c.id, c.share_code FROM calendar c JOIN event e ON e.calendar_id = c.id "
+            "GROUP BY c.id ORDER BY count(e.id) DESC LIMIT 1"
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+async def probe_websocket(url, share_code, seconds, interval):
+    """Measure join_calendar acknowledgement round-trips for `seconds`"""
+    import socketio
+
+    client = socketio.AsyncClient(reconnection=False)
+    await client.connect(url, transports=['websocket'])
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await client.call('join_calendar', {'share_code': share_code}, timeout=30)
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(interval)
+    finally:
+        await client.disconnect()
+    return latencies
+
+
+def hammer_reads(base_url, path, readers, stop):
+    """Issue back-to-back heavy reads from several threads until stopped"""
+    import requests
+
+    counts = [0] * readers
+
+    def reader(index):
+        session = requests.Session()
+        while not stop.is_set():
+            session.get(base_url + path).raise_for_status()
+            counts[index] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    return threads, counts
+
+
+def run_mode(db_path, port, offload, readers, seconds, interval):
+    calendar_id, share_code = busiest_calendar(db_path)
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(db_path, port, extra_env={'DB_OFFLOAD_ENABLED': 'true' if offload else 'false'})
+    try:
+        idle = asyncio.run(probe_websocket(base_url, share_code, min(seconds, 3), interval))
+
+        stop = threading.Event()
+        started = time.perf_counter()
+        threads, counts = hammer_reads(base_url, f"/api/calendars/{calendar_id}/events", readers, stop)
+        loaded = asyncio.run(probe_websocket(base_url, share_code, seconds, interval))
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        elapsed = time.perf_counter() - started
+
+        import requests
+        pool_stats = requests.get(f"{base_url}/health").json().get('db_pool')
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'websocket_idle': summarize(idle),
+        'websocket_under_load': summarize(loaded),
+        'heavy_reads': sum(counts),
+        'heavy_reads_per_second': round(sum(counts) / elapsed, 1),
+        'db_pool': pool_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Websocket latency during heavy reads, with/without DB offload')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--readers', type=int, default=16, help='Concurrent heavy-read clients')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Duration of the loaded phase')
+    parser.add_argument('--interval', type=float, default=0.02, help='Pause between websocket probes')
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='calindar-offload-')
+    db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+    results = {}
+    try:
+        for offload in (False, True):
+            mode = 'offload' if offload else 'inline'
+            results[mode] = run_mode(db_copy, args.port, offload, args.readers, args.seconds, args.interval)
+            ws = results[mode]['websocket_under_load']
+            print(f"   {mode:<8} websocket p50={ws['p50_ms']}ms p99={ws['p99_ms']}ms "
+                  f"(idle p99={results[mode]['websocket_idle']['p99_ms']}ms), "
+                  f"{results[mode]['heavy_reads_per_second']} heavy reads/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {'readers': args.readers, 'seconds': args.seconds, 'interval': args.interval}
+    write_results(args.output, 'db_offload', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Web Push delivery pipeline against a local stub push service.
+
+Starts a keep-alive HTTP stub that accepts pushes like a real push service,
+except that every 10th subscription answers 410 Gone and every 7th one fails
+with 503 on its first attempt. The app runs with PUSH_TRANSPORT=plain and no
+retry delay, so the run covers batching, connection reuse, retries and
+pruning in a few seconds:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.push_delivery --subscriptions 500 --notifications 20
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import create_bench_app, write_results
+
+
+class StubPushService(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, StubPushHandler)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.connections = set()
+        self.seen = set()
+
+
+class StubPushHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        subscription = int(self.path.rsplit('/', 1)[-1])
+        with server.lock:
+            server.connections.add(self.client_address)
+            first_attempt = self.path not in server.seen
+            server.seen.add(self.path)
+
+        if subscription % 10 == 0:
+            status = 410
+        elif subscription % 7 == 0 and first_attempt:
+            status = 503
+        else:
+            status = 201
+        with server.lock:
+            server.requests[status] += 1
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        if status == 503:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Web Push delivery queue against a stub push service')
+    parser.add_argument('--subscriptions', type=int, default=500)
+    parser.add_argument('--notifications', type=int, default=20, help='Notifications fanned out to every subscription')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    stub = StubPushService(('127.0.0.1', 0))
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix='calindar-push-')
+    try:
+        app = create_bench_app(
+            os.path.join(workdir, 'push.db'),
+            PUSH_ENABLED=True,
+            PUSH_TRANSPORT='plain',
+            PUSH_WORKERS=args.workers,
+            PUSH_BATCH_SIZE=args.batch_size,
+            PUSH_RETRY_BASE_SECONDS=0,
+        )
+        with app.app_context():
+            from app.models import db, Calendar, PushSubscription, User, UserCalendar
+            from app.push import push_service
+
+            db.create_all()
+            calendar = Calendar(name='Push benchmark')
+            db.session.add(calendar)
+            db.session.flush()
+            for index in range(1, args.subscriptions + 1):
+                user = User(username=f'push{index}', session_id=f'push-session-{index}')
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(UserCalendar(user_id=user.id, calendar_id=calendar.id))
+                db.session.add(PushSubscription(
+                    user_id=user.id, endpoint=f"{stub_url}/push/{index}", p256dh='stub', auth='stub'
+                ))
+            db.session.commit()
+
+            started = time.perf_counter()
+            queued = 0
+            for index in range(args.notifications):
+                queued += push_service.enqueue_for_calendar(calendar.id, {
+                    'title': f'Benchmark {index}', 'body': 'Stub delivery', 'tag': f'bench-{index}', 'url': '/'
+                })
+            enqueue_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batches = 0
+            while push_service.process_batch():
+                batches += 1
+            deliver_s = time.perf_counter() - started
+
+            remaining = PushSubscription.query.count()
+            counters = dict(push_service.counters)
+    finally:
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'queued': queued,
+        'enqueue_per_second': round(queued / enqueue_s, 1) if enqueue_s else None,
+        'batches': batches,
+        'delivery_seconds': round(deliver_s, 3),
+        'deliveries_per_second': round(counters.get('sent', 0) / deliver_s, 1) if deliver_s else None,
+        'stub_requests': {str(status): count for status, count in sorted(stub.requests.items())},
+        'stub_connections': len(stub.connections),
+        'subscriptions_remaining': remaining,
+        'counters': counters,
+    }
+    print(f"   queued {queued} in {enqueue_s:.3f}s, delivered {counters.get('sent', 0)} in {deliver_s:.2f}s "
+          f"({results['deliveries_per_second']}/s) over {len(stub.connections)} connections; "
+          f"retried {counters.get('retried', 0)}, pruned {counters.get('pruned', 0)} subscriptions")
+
+    params = {
+        'subscriptions': args.subscriptions,
+        'notifications': args.notifications,
+        'workers': args.workers,
+        'batch_size': args.batch_size,
+    }
+    write_results(args.output, 'push_delivery', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Synthetic data generator for benchmarks.
+
+Seeds a SQLite database with users, calendars, memberships, events and
+reminders. Distributions are skewed the way real family data is: most
+calendars have two to four members and a modest history, a few busy
+calendars hold most of the events.
+
+    python -m benchmarks.seed --db /tmp/bench.db --users 500 --seed 42
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import create_bench_app
+
+TITLES = [
+    'Dentist', 'School pickup', 'Soccer practice', 'Grocery run', 'Piano lesson',
+    'Family dinner', 'Doctor appointment', 'Parent-teacher meeting', 'Birthday party',
+    'Swimming', 'Work trip', 'Date night', 'Vet visit', 'Car service', 'Book club',
+    'Gym', 'Movie night', 'Grandma visit', 'Homework help', 'Dance recital',
+]
+DESCRIPTIONS = [
+    '', '', '', 'Bring the forms', 'Remember snacks for the team',
+    'Call ahead to confirm the time and bring insurance card',
+    'Pick up the cake on the way. Ask the neighbours if they can drive the kids back afterwards.',
+]
+REMINDER_CHOICES = [0, 5, 15, 15, 15, 30, 60, 1440]
+
+
+def members_per_calendar(rng):
+    """Family-sized calendars: mostly 2-4 members, occasionally larger"""
+    return min(12, max(1, int(rng.lognormvariate(0.9, 0.45))))
+
+
+def events_per_calendar(rng, mean_events):
+    """Pareto-distributed history length so a few calendars dominate"""
+    return min(int(mean_events * 40), max(1, int(rng.paretovariate(1.6) * mean_events * 0.4)))
+
+
+def random_event(rng, calendar_id, anchor, history_days, future_days):
+    """Generate one event row, biased towards the recent past and near future"""
+    if rng.random() < 0.7:
+        offset_days = rng.uniform(-history_days, 0)
+    else:
+        offset_days = rng.expovariate(1.0 / max(1, future_days / 4))
+        offset_days = min(offset_days, future_days)
+
+    all_day = rng.random() < 0.15
+    start = anchor + timedelta(days=offset_days)
+    if all_day:
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=rng.choice([1, 1, 1, 2, 3, 7])) - timedelta(seconds=1)
+    else:
+        start = start.replace(hour=rng.randint(7, 20), minute=rng.choice([0, 15, 30, 45]),
+                              second=0, microsecond=0)
+        end = start + timedelta(minutes=rng.choice([30, 45, 60, 60, 90, 120, 180]))
+
+    created = start - timedelta(days=rng.uniform(0, 30))
+    return {
+        'title': rng.choice(TITLES),
+        'description': rng.choice(DESCRIPTIONS),
+        'start_time': start,
+        'end_time': end,
+        'all_day': all_day,
+        'reminder_minutes': rng.choice(REMINDER_CHOICES),
+        'created_at': created,
+        'updated_at': created,
+        'calendar_id': calendar_id,
+    }
+
+
+def seed_database(db_path, users=200, calendars_per_user=0.6, mean_events=120,
+                  history_days=730, future_days=180, seed=42, anchor=None, batch_size=5000):
+    """Create and populate a benchmark database. Returns a summary dict."""
+    from app.models import db, User, Calendar, UserCalendar, Event, Reminder
+
+    rng = random.Random(seed)
+    anchor = anchor or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    app = create_bench_app(db_path)
+    started = time.perf_counter()
+
+    with app.app_context():
+        db.create_all()
+
+        # Users
+        user_rows = [
+            {'username': f'user{i:05d}', 'session_id': f'bench-session-{i:05d}',
+             'created_at': anchor, 'last_active': anchor}
+            for i in range(users)
+        ]
+        db.session.execute(db.insert(User), user_rows)
+
+        # Calendars
+        calendar_count = max(1, int(users * calendars_per_user))
+        calendar_rows = [
+            {'name': f'Family {i:05d}', 'share_code': f'B{i:07d}', 'created_at': anchor}
+            for i in range(calendar_count)
+        ]
+        db.session.execute(db.insert(Calendar), calendar_rows)
+
+        # Memberships: the owner plus a family-sized set of other users
+        membership_rows = []
+        for calendar_id in range(1, calendar_count + 1):
+            members = rng.sample(range(1, users + 1), min(users, members_per_calendar(rng)))
+            for position, user_id in enumerate(members):
+                membership_rows.append({
+                    'user_id': user_id,
+                    'calendar_id': calendar_id,
+                    'is_owner': position == 0,
+                    'joined_at': anchor - timedelta(days=rng.uniform(0, history_days)),
+                })
+        db.session.execute(db.insert(UserCalendar), membership_rows)
+        db.session.commit()
+
+        # Events and reminders, inserted in batches to keep memory flat
+        event_total = 0
+        reminder_total = 0
+        pending = []
+
+        def flush_events(rows):
+            nonlocal reminder_total
+            if not rows:
+                return
+            first_id = (db.session.query(db.func.max(Event.id)).scalar() or 0) + 1
+            db.session.execute(db.insert(Event), rows)
+            reminder_rows = [
+                {'event_id': first_id + offset,
+                 'reminder_time': row['start_time'] - timedelta(minutes=row['reminder_minutes']),
+                 'sent': row['start_time'] < anchor,
+                 'created_at': row['created_at']}
+                for offset, row in enumerate(rows) if row['reminder_minutes'] > 0
+            ]
+            if reminder_rows:
+                db.session.execute(db.insert(Reminder), reminder_rows)
+            reminder_total += len(reminder_rows)
+            db.session.commit()
+
+        for calendar_id in range(1, calendar_count + 1):
+            for _ in range(events_per_calendar(rng, mean_events)):
+                pending.append(random_event(rng, calendar_id, anchor, history_days, future_days))
+                if len(pending) >= batch_size:
+                    event_total += len(pending)
+                    flush_events(pending)
+                    pending = []
+        event_total += len(pending)
+        flush_events(pending)
+
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    return {
+        'db_path': os.path.abspath(db_path),
+        'seed': seed,
+        'anchor': anchor.isoformat(),
+        'users': users,
+        'calendars': calendar_count,
+        'memberships': len(membership_rows),
+        'events': event_total,
+        'reminders': reminder_total,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic Calindar database')
+    parser.add_argument('--db', default='bench.db', help='Path of the SQLite file to create')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--calendars-per-user', type=float, default=0.6)
+    parser.add_argument('--mean-events', type=int, default=120,
+                        help='Typical events per calendar (Pareto-distributed)')
+    parser.add_argument('--history-days', type=int, default=730)
+    parser.add_argument('--future-days', type=int, default=180)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', help='ISO datetime used as "now" (default: current hour)')
+    args = parser.parse_args()
+
+    print(f"🌱 Seeding {args.db}...")
+    summary = seed_database(
+        args.db,
+        users=args.users,
+        calendars_per_user=args.calendars_per_user,
+        mean_events=args.mean_events,
+        history_days=args.history_days,
+        future_days=args.future_days,
+        seed=args.seed,
+        anchor=datetime.fromisoformat(args.anchor) if args.anchor else None,
+    )
+    for key, value in summary.items():
+        print(f"   {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Run the app on a real gevent server against a benchmark database.
+
+    python -m benchmarks.server --db /tmp/bench.db --port 5055
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+
+from benchmarks.common import create_bench_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Calindar on gevent for benchmarking')
+    parser.add_argument('--db', required=True, help='SQLite database created by benchmarks.seed')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    from app import socketio
+
+    app = create_bench_app(args.db)
+    print(f"🚀 Benchmark server on http://{args.host}:{args.port} (pid {os.getpid()})")
+    socketio.run(app, host=args.host, port=args.port, log_output=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Socket.IO broadcast fan-out benchmark.
+
+Starts the app on a gevent server, connects many python-socketio clients
+spread across calendar rooms (via `join_calendar`), fires event mutations
+through the REST API and measures:
+
+- end-to-end delivery latency (HTTP mutation sent -> broadcast received)
+- server memory per connected client
+- server CPU time per emitted frame
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.seed --db /tmp/bench.db
+    python -m benchmarks.socketio_fanout --db /tmp/bench.db --clients 2000 --rooms 100
+    python -m benchmarks.socketio_fanout --db /tmp/bench.db --clients 2000 --rooms 100 --serializer msgpack
+"""
+
+import argparse
+import asyncio
+import bisect
+import multiprocessing
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import start_server, summarize, write_results
+
+MUTATION_KINDS = ('event_created', 'event_updated', 'event_deleted')
+
+
+def room_share_codes(db_path, rooms):
+    """Share codes of the busiest calendars, one per room"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT c.id, c.share_code FROM calendar c LEFT JOIN event e ON e.calendar_id = c.id "
+            "GROUP BY c.id ORDER BY count(e.id) DESC LIMIT ?", (rooms,)
+        ).fetchall()
+    finally:
+        conn.close()
+    if len(rows) < rooms:
+        raise SystemExit(f"Database only has {len(rows)} calendars, need {rooms}")
+    return rows
+
+
+def _delivery_key(kind, payload):
+    """Identify which mutation a broadcast belongs to"""
+    if kind == 'event_deleted':
+        return str(payload['event_id'])
+    if kind == 'event_created':
+        return str(payload['event']['id'])
+    return str(payload['id'])
+
+
+async def _run_clients(url, share_codes, connect_concurrency, serializer, ready, stop, results):
+    import socketio
+
+    received = []
+    semaphore = asyncio.Semaphore(connect_concurrency)
+    clients = []
+
+    async def connect(share_code):
+        client = socketio.AsyncClient(reconnection=False, serializer='msgpack' if serializer == 'msgpack' else 'default')
+        joined = asyncio.Event()
+
+        @client.on('joined_calendar')
+        async def on_joined(data):
+            joined.set()
+
+        for kind in MUTATION_KINDS:
+            def handler(payload, kind=kind):
+                received.append((kind, _delivery_key(kind, payload), time.time()))
+            client.on(kind, handler)
+
+        async with semaphore:
+            # The query string asks the server for msgpack frames (see app/socket_serializer.py)
+            await client.connect(url + ('?serializer=msgpack' if serializer == 'msgpack' else ''),
+                                 transports=['websocket'])
+            await client.emit('join_calendar', {'share_code': share_code})
+            await asyncio.wait_for(joined.wait(), timeout=60)
+        clients.append(client)
+
+    connect_started = time.perf_counter()
+    await asyncio.gather(*(connect(code) for code in share_codes))
+    ready.put(time.perf_counter() - connect_started)
+
+    # Wait for the parent to finish firing mutations
+    while not stop.is_set():
+        await asyncio.sleep(0.05)
+
+    results.put(received)
+    for client in clients:
+        await client.disconnect()
+
+
+def _client_process(url, share_codes, connect_concurrency, serializer, ready, stop, results):
+    asyncio.run(_run_clients(url, share_codes, connect_concurrency, serializer, ready, stop, results))
+
+
+def fire_mutations(base_url, rooms, mutations, interval):
+    """Create, update and delete events round-robin across rooms, recording send times.
+
+    SQLite reuses the ids of deleted events, so each (kind, id) keeps a list of
+    send times; a delivery is matched with the latest send that precedes it.
+    """
+    import requests
+
+    session = requests.Session()
+    sent = {}
+    http_latencies = []
+
+    def timed(kind, key, method, url, **kwargs):
+        started = time.time()
+        response = getattr(session, method)(url, **kwargs)
+        http_latencies.append((time.time() - started) * 1000)
+        response.raise_for_status()
+        sent.setdefault((kind, key), []).append(started)
+        return response
+
+    for i in range(mutations):
+        calendar_id, _ = rooms[i % len(rooms)]
+        start_time = datetime.utcnow() + timedelta(days=30 + i % 30)
+        started = time.time()
+        response = session.post(f"{base_url}/api/events", json={
+            'title': f'Fan-out {i}',
+            'description': 'benchmarks.socketio_fanout',
+            'start_time': start_time.isoformat(),
+            'end_time': (start_time + timedelta(hours=1)).isoformat(),
+            'calendar_id': calendar_id,
+        })
+        http_latencies.append((time.time() - started) * 1000)
+        response.raise_for_status()
+        event_id = str(response.json()['id'])
+        sent.setdefault(('event_created', event_id), []).append(started)
+
+        timed('event_updated', event_id, 'put', f"{base_url}/api/events/{event_id}",
+              json={'title': f'Fan-out {i} (moved)'})
+        timed('event_deleted', event_id, 'delete', f"{base_url}/api/events/{event_id}")
+        if interval:
+            time.sleep(interval)
+
+    return sent, http_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Socket.IO broadcast fan-out')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--clients', type=int, default=1000, help='Total simulated clients')
+    parser.add_argument('--rooms', type=int, default=50, help='Number of calendar rooms to spread clients over')
+    parser.add_argument('--mutations', type=int, default=100, help='Create/update/delete cycles to fire')
+    parser.add_argument('--interval', type=float, default=0.0, help='Seconds to wait between cycles')
+    parser.add_argument('--processes', type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                        help='Client processes (keeps the client side from being the bottleneck)')
+    parser.add_argument('--connect-concurrency', type=int, default=50)
+    parser.add_argument('--serializer', choices=('json', 'msgpack'), default='json',
+                        help='Frame format the clients negotiate')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    import psutil
+
+    workdir = tempfile.mkdtemp(prefix='calindar-fanout-')
+    db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+    rooms = room_share_codes(db_copy, args.rooms)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    server = start_server(db_copy, args.port)
+    server_process = psutil.Process(server.pid)
+    try:
+        # Warm up imports and the DB connection pool before taking the baseline
+        import requests
+        requests.get(f"{base_url}/api/calendars/{rooms[0][0]}")
+        time.sleep(0.5)
+        rss_before = server_process.memory_info().rss
+
+        # Assign clients to rooms round-robin, then split them across processes
+        assignments = [rooms[i % len(rooms)][1] for i in range(args.clients)]
+        members_per_room = {}
+        for share_code in assignments:
+            members_per_room[share_code] = members_per_room.get(share_code, 0) + 1
+
+        ctx = multiprocessing.get_context('spawn')
+        ready, results = ctx.Queue(), ctx.Queue()
+        stop = ctx.Event()
+        workers = []
+        for p in range(args.processes):
+            chunk = assignments[p::args.processes]
+            if not chunk:
+                continue
+            worker = ctx.Process(target=_client_process, args=(
+                base_url, chunk, max(1, args.connect_concurrency // args.processes), args.serializer,
+                ready, stop, results))
+            worker.start()
+            workers.append(worker)
+
+        connect_seconds = max(ready.get(timeout=600) for _ in workers)
+        time.sleep(1.0)
+        rss_connected = server_process.memory_info().rss
+        print(f"🔌 {args.clients} clients connected in {connect_seconds:.1f}s")
+
+        # Fire mutations and measure server CPU over the broadcast phase
+        cpu_before = sum(server_process.cpu_times()[:2])
+        wall_started = time.perf_counter()
+        sent, http_latencies = fire_mutations(base_url, rooms, args.mutations, args.interval)
+
+        expected = 0
+        for i in range(args.mutations):
+            expected += members_per_room[rooms[i % len(rooms)][1]] * len(MUTATION_KINDS)
+
+        # Give in-flight broadcasts time to arrive, then collect
+        time.sleep(min(args.drain_timeout, 1.0 + expected / 20000.0))
+        cpu_after = sum(server_process.cpu_times()[:2])
+        wall_seconds = time.perf_counter() - wall_started
+        stop.set()
+
+        received = []
+        for _ in workers:
+            received.extend(results.get(timeout=600))
+        for worker in workers:
+            worker.join(timeout=60)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = {kind: [] for kind in MUTATION_KINDS}
+    for kind, key, received_at in received:
+        send_times = sent.get((kind, key))
+        if not send_times:
+            continue
+        index = bisect.bisect_right(send_times, received_at) - 1
+        if index >= 0:
+            latencies[kind].append((received_at - send_times[index]) * 1000)
+
+    delivered = sum(len(values) for values in latencies.values())
+    cpu_seconds = cpu_after - cpu_before
+    results_doc = {
+        'delivery_latency': {kind: summarize(values) for kind, values in latencies.items()},
+        'delivery_latency_all': summarize([v for values in latencies.values() for v in values]),
+        'mutation_http_latency': summarize(http_latencies),
+        'frames_expected': expected,
+        'frames_delivered': delivered,
+        'delivery_ratio': round(delivered / expected, 4) if expected else None,
+        'frames_per_second': round(delivered / wall_seconds, 1) if wall_seconds else None,
+        'connect_seconds': round(connect_seconds, 3),
+        'server_rss_baseline_mb': round(rss_before / 2 ** 20, 2),
+        'server_rss_connected_mb': round(rss_connected / 2 ** 20, 2),
+        'memory_per_connection_kb': round((rss_connected - rss_before) / 1024 / args.clients, 2),
+        'server_cpu_seconds': round(cpu_seconds, 3),
+        'cpu_us_per_frame': round(cpu_seconds * 1e6 / delivered, 2) if delivered else None,
+    }
+
+    all_latency = results_doc['delivery_latency_all']
+    print(f"📡 delivered {delivered}/{expected} frames, p50={all_latency['p50_ms']}ms "
+          f"p99={all_latency['p99_ms']}ms, {results_doc['memory_per_connection_kb']} KB/conn, "
+          f"{results_doc['cpu_us_per_frame']} µs CPU/frame")
+
+    params = {
+        'clients': args.clients,
+        'rooms': args.rooms,
+        'mutations': args.mutations,
+        'interval': args.interval,
+        'processes': len(workers),
+        'serializer': args.serializer,
+    }
+    write_results(args.output, 'socketio_fanout', params, results_doc)
+
+
+if __name__ == '__main__':
+    main()
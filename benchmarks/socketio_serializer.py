@@ -0,0 +1,116 @@
+"""
+Frame size and encode/decode CPU of JSON vs msgpack Socket.IO packets.
+
+Builds the broadcasts the app sends (a new event, a drag-and-drop move as a
+field patch, a delete) and bulk batches of events from the busiest calendar
+of a seeded database, wraps each one in a Socket.IO EVENT packet and encodes
+and decodes it with the JSON packet class and with msgpack (see
+app/socket_serializer.py). End-to-end delivery with msgpack clients is
+measured by `benchmarks.socketio_fanout --serializer msgpack`.
+
+    python -m benchmarks.socketio_serializer --db /tmp/bench.db
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.api import load_fixture
+from benchmarks.common import create_bench_app, write_results
+
+BATCH_SIZES = (10, 100, 1000)
+
+
+def fetch_events(app, fixture):
+    """Events of the fixture calendar, as the API returns them"""
+    client = app.test_client()
+    client.post('/api/user/login', json={'username': fixture['username']})
+    response = client.get(f"/api/calendars/{fixture['calendar_id']}/events", headers={'Accept-Encoding': 'identity'})
+    return response.get_json()
+
+
+def build_payloads(events):
+    """(event name, payload) of typical broadcasts and bulk batches"""
+    event = max(events, key=lambda e: len(e.get('description') or ''))
+    payloads = {
+        'event_created': ('event_created', {'event': event, 'calendar_id': event['calendar_id'], 'version': 1042}),
+        'event_updated_move': ('event_updated', {
+            'id': event['id'], 'calendar_id': event['calendar_id'], 'version': 1043,
+            'changes': {'start_time': event['start_time'], 'end_time': event['end_time'],
+                        'updated_at': event['updated_at']},
+        }),
+        'event_deleted': ('event_deleted', {'event_id': event['id'], 'calendar_id': event['calendar_id'], 'version': 1044}),
+    }
+    for size in BATCH_SIZES:
+        if len(events) >= size:
+            payloads[f"batch_{size}"] = ('events_batch', {'calendar_id': event['calendar_id'], 'events': events[:size]})
+    return payloads
+
+
+def time_per_call(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) * 1e6 / repeat
+
+
+def measure(name, payload, repeat):
+    from socketio import packet
+    from app.socket_serializer import NegotiatedPacket
+
+    pkt = NegotiatedPacket(packet.EVENT, data=[name, payload])
+    json_frame = pkt.encode()
+    msgpack_frame = pkt.encode_msgpack()
+    assert NegotiatedPacket(encoded_packet=json_frame).data == NegotiatedPacket(encoded_packet=msgpack_frame).data
+
+    results = {}
+    for fmt, frame, encode in (('json', json_frame, pkt.encode), ('msgpack', msgpack_frame, pkt.encode_msgpack)):
+        results[fmt] = {
+            # JSON frames go out as UTF-8 text
+            'bytes': len(frame.encode() if isinstance(frame, str) else frame),
+            'encode_us': round(time_per_call(encode, repeat), 2),
+            'decode_us': round(time_per_call(lambda: NegotiatedPacket(encoded_packet=frame), repeat), 2),
+        }
+    results['msgpack_size_ratio'] = round(results['msgpack']['bytes'] / results['json']['bytes'], 4)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON vs msgpack Socket.IO frames')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--repeat', type=int, default=2000, help='Encodes/decodes per payload (a tenth for batches)')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='calindar-serializer-')
+    try:
+        db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+        fixture = load_fixture(db_copy)
+        app = create_bench_app(db_copy)
+        with app.app_context():
+            from app.main.routes import init_db_if_needed
+            init_db_if_needed()
+        events = fetch_events(app, fixture)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    from app.socket_serializer import msgpack
+    if msgpack is None:
+        raise SystemExit('msgpack is not installed')
+
+    results = {}
+    for key, (name, payload) in build_payloads(events).items():
+        repeat = args.repeat // 10 if key.startswith('batch') else args.repeat
+        row = results[key] = measure(name, payload, max(1, repeat))
+        print(f"📦 {key:>20}: json {row['json']['bytes']:>9,} B enc {row['json']['encode_us']:>9.2f} µs "
+              f"dec {row['json']['decode_us']:>9.2f} µs | msgpack {row['msgpack']['bytes']:>9,} B "
+              f"enc {row['msgpack']['encode_us']:>9.2f} µs dec {row['msgpack']['decode_us']:>9.2f} µs "
+              f"({row['msgpack_size_ratio']:.1%})")
+
+    params = {'repeat': args.repeat, 'calendar_id': fixture['calendar_id'], 'events': len(events)}
+    write_results(args.output, 'socketio_serializer', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Event writes per second from concurrent worker processes, with one database or calendar shards,
+committing each write on its own or in groups.
+
+SQLite takes one writer at a time per file, so what limits writes is how
+many processes wait on the same lock, and how many commits (each one a
+journal sync) they pay for. Each mode copies the seeded database, starts
+--workers processes (like gunicorn workers) that each create their own
+calendar and then run --clients concurrent greenlets (like the connections
+a gevent worker serves) that POST /api/events to it through the Flask test
+client for --seconds, and reports writes per second, latency and failed
+writes:
+
+    python -m benchmarks.write_throughput --db /tmp/bench.db --workers 8 --clients 4 --seconds 10
+
+Modes: `single` (everything in the main database), `sharded`
+(SHARDING_ENABLED with --shards files, see app/shards.py), and both of them
+with GROUP_COMMIT_ENABLED (see app/group_commit.py), where the concurrent
+writes of a process share one transaction and commit.
+"""
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import create_bench_app, summarize, write_results
+
+MODES = {
+    'single': {},
+    'sharded': {'SHARDING_ENABLED': True},
+    'group_commit': {'GROUP_COMMIT_ENABLED': True},
+    'sharded_group_commit': {'SHARDING_ENABLED': True, 'GROUP_COMMIT_ENABLED': True},
+}
+
+
+def prepare(db_path, overrides):
+    """Create missing tables (and shards) once, before the workers start"""
+    app = create_bench_app(db_path, **overrides)
+    with app.app_context():
+        from app.main.routes import init_db_if_needed
+        if not init_db_if_needed():
+            raise SystemExit('Database initialization failed')
+
+
+def writer(index, db_path, overrides, clients, start_at, seconds, results):
+    import gevent
+
+    app = create_bench_app(db_path, **overrides)
+    client = app.test_client()
+    client.post('/api/users', json={'username': f'bench-writer-{index}-{time.time_ns()}'})
+    calendar_id = client.post('/api/calendars', json={'name': f'Write benchmark {index}'}).get_json()['id']
+
+    latencies, errors = [], []
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.time() + seconds
+
+    def post_events(client_index):
+        client = app.test_client()
+        sequence = 0
+        while time.time() < deadline:
+            sequence += 1
+            started = time.perf_counter()
+            response = client.post('/api/events', json={
+                'title': f'Write {index}-{client_index}-{sequence}',
+                'start_time': f'2031-01-01T{sequence % 24:02d}:00:00',
+                'end_time': f'2031-01-01T{sequence % 24:02d}:30:00',
+                'calendar_id': calendar_id,
+                'reminder_minutes': 15,
+            })
+            if response.status_code == 201:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors.append(response.status_code)
+
+    gevent.joinall([gevent.spawn(post_events, client_index) for client_index in range(clients)])
+    results.put((latencies, len(errors)))
+
+
+def run_mode(db_path, overrides, workers, clients, seconds):
+    # In a process of its own: SQLite connections must not be open in the parent when the writers fork
+    process = multiprocessing.Process(target=prepare, args=(db_path, overrides))
+    process.start()
+    process.join()
+    if process.exitcode:
+        raise SystemExit('Database initialization failed')
+    results = multiprocessing.Queue()
+    # Every worker starts writing at the same moment, after its app is up
+    start_at = time.time() + 2 + workers * 0.2
+    processes = [multiprocessing.Process(target=writer, args=(i, db_path, overrides, clients, start_at, seconds, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for worker_latencies, _ in collected for latency in worker_latencies]
+    summary = summarize(latencies, seconds)
+    summary['failed'] = sum(errors for _, errors in collected)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent event writes per second by storage mode')
+    parser.add_argument('--db', required=True, help='Database seeded with benchmarks.seed')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent writer processes')
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent requests per writer process')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--shards', type=int, default=4, help='SHARD_COUNT of the sharded mode')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to run')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(','):
+        workdir = tempfile.mkdtemp(prefix=f'calindar-writes-{mode}-')
+        try:
+            db_copy = shutil.copy(args.db, f"{workdir}/bench.db")
+            overrides = {'JOBS_ENABLED': False, 'UPCOMING_WINDOW_ENABLED': False, 'SHARD_COUNT': args.shards,
+                         **MODES[mode]}
+            row = results[mode] = run_mode(db_copy, overrides, args.workers, args.clients, args.seconds)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"✍️  {mode:>20}: {row['throughput_rps']:>8} writes/s p50={row['p50_ms']}ms "
+              f"p99={row['p99_ms']}ms failed={row['failed']}")
+
+    params = {'workers': args.workers, 'clients': args.clients, 'seconds': args.seconds, 'shards': args.shards}
+    write_results(args.output, 'write_throughput', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,9 +10,97 @@ class Config:
     # Use SQLite for all environments - use relative path in current directory
     SQLALCHEMY_DATABASE_URI = 'sqlite:///calendar.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
+
+    # Per-request query accounting (see app/query_stats.py)
+    QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', 'true').lower() == 'true'
+    QUERY_STATS_HEADERS = os.environ.get('QUERY_STATS_HEADERS', 'false').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+
+    # Compress /api responses above a size threshold (see app/compression.py)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_ALGORITHMS = tuple(os.environ.get('COMPRESS_ALGORITHMS', 'zstd,br,gzip').split(','))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    COMPRESS_ZSTD_LEVEL = int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3))
+
+    # Let Socket.IO clients opt into msgpack frames with ?serializer=msgpack (see app/socket_serializer.py)
+    # Needs the msgpack package (in requirements.txt); without it clients get JSON and a warning is logged
+    SOCKETIO_MSGPACK_ENABLED = os.environ.get('SOCKETIO_MSGPACK_ENABLED', 'true').lower() == 'true'
+
+    # Offload database work to a bounded native thread pool (see app/db_pool.py)
+    DB_OFFLOAD_ENABLED = os.environ.get('DB_OFFLOAD_ENABLED', 'true').lower() == 'true'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+
+    # Rolling window of upcoming events kept in memory (see app/upcoming_window.py)
+    UPCOMING_WINDOW_ENABLED = os.environ.get('UPCOMING_WINDOW_ENABLED', 'true').lower() == 'true'
+    UPCOMING_WINDOW_HOURS = int(os.environ.get('UPCOMING_WINDOW_HOURS', 24))
+    UPCOMING_WINDOW_REFRESH_SECONDS = int(os.environ.get('UPCOMING_WINDOW_REFRESH_SECONDS', 60))
+
+    # Move events older than the horizon into an attached archive database (see app/archive.py).
+    # Archived events are left out of search results
+    ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_DATABASE_PATH = os.environ.get('ARCHIVE_DATABASE_PATH')
+    ARCHIVE_HORIZON_DAYS = int(os.environ.get('ARCHIVE_HORIZON_DAYS', 365))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+
+    # Keep each calendar's events in one of SHARD_COUNT SQLite files (see app/shards.py)
+    SHARDING_ENABLED = os.environ.get('SHARDING_ENABLED', 'false').lower() == 'true'
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 4))
+    SHARD_DIR = os.environ.get('SHARD_DIR')
+    SHARD_ID_BLOCK_SIZE = int(os.environ.get('SHARD_ID_BLOCK_SIZE', 100))
+
+    # Batch concurrent event writes into one transaction and commit (see app/group_commit.py)
+    GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED', 'false').lower() == 'true'
+    GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 64))
+
+    # Durable background jobs with per-lane workers (see app/jobs.py)
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', 'true').lower() == 'true'
+    JOBS_LANE_WORKERS = os.environ.get('JOBS_LANE_WORKERS', 'high:2,default:2,low:1')
+    JOBS_LEASE_SECONDS = int(os.environ.get('JOBS_LEASE_SECONDS', 900))
+    JOBS_RETRY_BASE_SECONDS = int(os.environ.get('JOBS_RETRY_BASE_SECONDS', 10))
+    JOBS_POLL_SECONDS = int(os.environ.get('JOBS_POLL_SECONDS', 5))
+    JOBS_KEEP_HOURS = int(os.environ.get('JOBS_KEEP_HOURS', 24))
+    JOBS_FILES_DIR = os.environ.get('JOBS_FILES_DIR')
+
+    # Calendars with more events than this are deleted in background batches (see app/calendar_delete.py)
+    CALENDAR_DELETE_INLINE_EVENTS = int(os.environ.get('CALENDAR_DELETE_INLINE_EVENTS', 1000))
+    CALENDAR_DELETE_BATCH_SIZE = int(os.environ.get('CALENDAR_DELETE_BATCH_SIZE', 500))
+    CALENDAR_DELETE_PAUSE_SECONDS = float(os.environ.get('CALENDAR_DELETE_PAUSE_SECONDS', 0.05))
+
+    # Web Push delivery queue and worker (see app/push.py)
+    PUSH_ENABLED = os.environ.get('PUSH_ENABLED', 'false').lower() == 'true'
+    PUSH_TRANSPORT = os.environ.get('PUSH_TRANSPORT', 'webpush')
+    VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY')
+    VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY')
+    VAPID_SUBJECT = os.environ.get('VAPID_SUBJECT', 'mailto:admin@example.com')
+    PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', 4))
+    PUSH_BATCH_SIZE = int(os.environ.get('PUSH_BATCH_SIZE', 200))
+    PUSH_MAX_ATTEMPTS = int(os.environ.get('PUSH_MAX_ATTEMPTS', 6))
+    PUSH_RETRY_BASE_SECONDS = int(os.environ.get('PUSH_RETRY_BASE_SECONDS', 30))
+    PUSH_POLL_SECONDS = int(os.environ.get('PUSH_POLL_SECONDS', 15))
+    PUSH_TTL_SECONDS = int(os.environ.get('PUSH_TTL_SECONDS', 3600))
+
+    # Online SQLite backups, taken in small page steps (see app/backup.py)
+    BACKUP_ENABLED = os.environ.get('BACKUP_ENABLED', 'false').lower() == 'true'
+    BACKUP_DIR = os.environ.get('BACKUP_DIR')
+    BACKUP_INTERVAL_HOURS = float(os.environ.get('BACKUP_INTERVAL_HOURS', 24))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))
+    BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', 'true').lower() == 'true'
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+    BACKUP_STEP_SLEEP_SECONDS = float(os.environ.get('BACKUP_STEP_SLEEP_SECONDS', 0.01))
+
+    # Content-hashed static build from `flask build-assets` (see app/assets.py)
+    ASSETS_ENABLED = os.environ.get('ASSETS_ENABLED', 'true').lower() == 'true'
+    ASSETS_BUILD_DIR = os.environ.get('ASSETS_BUILD_DIR')
+    ASSETS_URL_PATH = os.environ.get('ASSETS_URL_PATH', '/assets')
+
 class DevelopmentConfig(Config):
     DEBUG = True
+    # Edited files would be shadowed by a stale build while developing
+    ASSETS_ENABLED = os.environ.get('ASSETS_ENABLED', 'false').lower() == 'true'
     
 class ProductionConfig(Config):
     DEBUG = False
@@ -4,9 +4,16 @@ Simple SQLite Database Browser
 Run this script to access your calendar database through a web interface.
 """
 
+import csv
+import io
+import json
 import sqlite3
 import os
-from flask import Flask, render_template, request, jsonify, g
+import threading
+import time
+from urllib.parse import quote
+from flask import Flask, Response, render_template, request, jsonify, g, stream_with_context
+from markupsafe import escape
 from datetime import datetime
 
 app = Flask(__name__)
@@ -15,26 +22,45 @@ app.config['SECRET_KEY'] = 'db-browser-key'
 # Database path
 DATABASE_PATH = os.path.join('instance', 'calendar.db')
 
+# Rows per table page, and rows per statement when exporting a whole table
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+# Custom query guardrails: wall-clock budget, rows fetched, and how often (in SQLite VM steps) the budget is checked
+QUERY_TIMEOUT_SECONDS = float(os.environ.get('DB_BROWSER_QUERY_TIMEOUT', 5))
+QUERY_MAX_ROWS = int(os.environ.get('DB_BROWSER_QUERY_MAX_ROWS', 10000))
+QUERY_PROGRESS_STEPS = 10000
+
+_local = threading.local()
+
 def get_db():
-    """Get database connection"""
+    """Get this thread's read-only database connection (opened once, then reused)"""
     if not os.path.exists(DATABASE_PATH):
         return None
     
-    db = sqlite3.connect(DATABASE_PATH)
-    db.row_factory = sqlite3.Row  # This allows us to access columns by name
+    db = getattr(_local, 'db', None)
+    if db is None:
+        # mode=ro: browsing can never modify or create the production database
+        uri = f"file:{quote(os.path.abspath(DATABASE_PATH))}?mode=ro"
+        db = sqlite3.connect(uri, uri=True)
+        db.row_factory = sqlite3.Row  # This allows us to access columns by name
+        db.execute("PRAGMA query_only = ON")
+        _local.db = db
     return db
 
+def quote_identifier(name):
+    """Quote a table or column name for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
 def get_table_names():
     """Get all table names in the database"""
     db = get_db()
     if db is None:
         return []
     
-    cursor = db.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-    tables = [row[0] for row in cursor.fetchall()]
-    db.close()
-    return tables
+    cursor = db.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+    return [row[0] for row in cursor.fetchall()]
 
 def get_table_info(table_name):
     """Get column information for a table"""
@@ -42,23 +68,102 @@ def get_table_info(table_name):
     if db is None:
         return []
     
-    cursor = db.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = cursor.fetchall()
-    db.close()
-    return columns
+    return db.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+
+def table_has_rowid(table_name):
+    """WITHOUT ROWID tables (e.g. FTS internals) can't be paged by rowid"""
+    try:
+        get_db().execute(f"SELECT rowid FROM {quote_identifier(table_name)} LIMIT 0")
+        return True
+    except sqlite3.OperationalError:
+        return False
 
-def get_table_data(table_name, limit=100):
-    """Get data from a table"""
+def get_table_data(table_name, limit=PAGE_SIZE, after=None, before=None):
+    """Get one page of a table, keyset-paginated over rowid.
+    
+    Returns (rows, has_more); each row starts with its rowid. has_more means
+    there is a further page in the direction being paged. Seeking by rowid
+    costs the same on the last page of a multi-GB table as on the first,
+    unlike OFFSET.
+    """
     db = get_db()
     if db is None:
-        return []
+        return [], False
+    
+    table = quote_identifier(table_name)
+    if not table_has_rowid(table_name):
+        rows = db.execute(f"SELECT NULL, * FROM {table} LIMIT ?", (limit,)).fetchall()
+        return rows, False
+    
+    if before is not None:
+        rows = db.execute(
+            f"SELECT rowid, * FROM {table} WHERE rowid < ? ORDER BY rowid DESC LIMIT ?", (before, limit + 1)
+        ).fetchall()
+        return rows[:limit][::-1], len(rows) > limit
     
-    cursor = db.cursor()
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit}")
-    data = cursor.fetchall()
-    db.close()
-    return data
+    if after is not None:
+        rows = db.execute(
+            f"SELECT rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit + 1)
+        ).fetchall()
+    else:
+        rows = db.execute(f"SELECT rowid, * FROM {table} ORDER BY rowid LIMIT ?", (limit + 1,)).fetchall()
+    return rows[:limit], len(rows) > limit
+
+def iter_table_rows(table_name, batch_size=EXPORT_BATCH_SIZE):
+    """Yield every row of a table, one rowid-keyed batch per statement.
+    
+    Each batch is its own short read, so an export of a huge table holds
+    neither the whole table in memory nor a read lock for its whole duration.
+    """
+    db = get_db()
+    table = quote_identifier(table_name)
+    
+    if not table_has_rowid(table_name):
+        cursor = db.execute(f"SELECT * FROM {table}")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from (tuple(row) for row in rows)
+    
+    last_rowid = None
+    while True:
+        if last_rowid is None:
+            rows = db.execute(f"SELECT rowid, * FROM {table} ORDER BY rowid LIMIT ?", (batch_size,)).fetchall()
+        else:
+            rows = db.execute(
+                f"SELECT rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)
+            ).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield from (tuple(row)[1:] for row in rows)
+
+def export_value(value):
+    """Blobs are written as hex so CSV and JSON stay text"""
+    return value.hex() if isinstance(value, bytes) else value
+
+def generate_csv(columns, rows, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([export_value(value) for value in row])
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def generate_ndjson(columns, rows, batch_size=EXPORT_BATCH_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, map(export_value, row))), default=str))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
 
 @app.route('/')
 def index():
@@ -116,7 +221,7 @@ def index():
         for table in tables:
             html += f"""
                 <div class="table-card">
-                    <a href="/table/{table}">{table}</a>
+                    <a href="/table/{quote(table)}">{escape(table)}</a>
                 </div>
             """
         
@@ -145,18 +250,34 @@ def index():
 
 @app.route('/table/<table_name>')
 def view_table(table_name):
-    """View data from a specific table"""
+    """View one page of a table"""
     if table_name not in get_table_names():
-        return f"Table '{table_name}' not found", 404
+        return f"Table '{escape(table_name)}' not found", 404
+    
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
     
     columns = get_table_info(table_name)
-    data = get_table_data(table_name)
+    data, has_more = get_table_data(table_name, limit=limit, after=after, before=before)
     
-    html = f"""
+    # Page links carry the first/last rowid shown instead of an offset
+    has_prev = has_more if before is not None else after is not None
+    has_next = has_more if before is None else True
+    
+    return Response(stream_with_context(
+        render_table_page(table_name, columns, data, limit, has_prev, has_next)
+    ), mimetype='text/html')
+
+def render_table_page(table_name, columns, data, limit, has_prev, has_next):
+    """Yield the table page in pieces instead of building one large string"""
+    name = escape(table_name)
+    url_name = quote(table_name)
+    yield f"""
     <!DOCTYPE html>
     <html>
     <head>
-        <title>Table: {table_name}</title>
+        <title>Table: {name}</title>
         <style>
             body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
             .container {{ max-width: 1400px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
@@ -170,94 +291,140 @@ def view_table(table_name):
             .back-link:hover {{ color: #0056b3; }}
             .table-info {{ background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; border-radius: 6px; margin: 20px 0; }}
             .no-data {{ text-align: center; color: #6c757d; font-style: italic; padding: 40px; }}
+            .pager a {{ color: #007bff; text-decoration: none; margin-right: 15px; }}
         </style>
     </head>
     <body>
         <div class="container">
             <a href="/" class="back-link">← Back to Database Overview</a>
-            <h1>📋 Table: {table_name}</h1>
+            <h1>📋 Table: {name}</h1>
             
             <div class="table-info">
-                <strong>Columns:</strong> {len(columns)} | <strong>Rows:</strong> {len(data)}
+                <strong>Columns:</strong> {len(columns)} | <strong>Rows on this page:</strong> {len(data)} |
+                <strong>Export:</strong> <a href="/table/{url_name}/export.csv">CSV</a> · <a href="/table/{url_name}/export.ndjson">NDJSON</a>
             </div>
     """
     
+    pager = '<div class="pager">'
+    if has_prev and data:
+        pager += f'<a href="/table/{url_name}?before={data[0][0]}&limit={limit}">← Previous {limit}</a>'
+    if has_next and data:
+        pager += f'<a href="/table/{url_name}?after={data[-1][0]}&limit={limit}">Next {limit} →</a>'
+    pager += '</div>'
+    
     if data:
-        html += """
+        header = "".join(f"<th>{escape(col[1])}<br><small>({escape(col[2])})</small></th>" for col in columns)
+        yield f"""
+            {pager}
             <table>
                 <thead>
-                    <tr>
-        """
-        
-        # Add column headers
-        for col in columns:
-            col_name = col[1]  # Column name
-            col_type = col[2]  # Column type
-            html += f"<th>{col_name}<br><small>({col_type})</small></th>"
-        
-        html += """
-                    </tr>
+                    <tr>{header}</tr>
                 </thead>
                 <tbody>
         """
         
-        # Add data rows
+        # Add data rows (the first value is the rowid used for paging)
         for row in data:
-            html += "<tr>"
-            for value in row:
+            cells = []
+            for value in tuple(row)[1:]:
                 # Format the value for display
                 if value is None:
                     display_value = "<em>NULL</em>"
                 elif isinstance(value, str) and len(value) > 50:
-                    display_value = value[:50] + "..."
+                    display_value = escape(value[:50]) + "..."
                 else:
-                    display_value = str(value)
-                html += f"<td>{display_value}</td>"
-            html += "</tr>"
+                    display_value = escape(str(value))
+                cells.append(f"<td>{display_value}</td>")
+            yield "<tr>" + "".join(cells) + "</tr>"
         
-        html += """
+        yield f"""
                 </tbody>
             </table>
+            {pager}
         """
     else:
-        html += '<div class="no-data">No data found in this table.</div>'
+        yield '<div class="no-data">No data found in this table.</div>'
     
-    html += """
+    yield """
         </div>
     </body>
     </html>
     """
+
+@app.route('/table/<table_name>/export.<fmt>')
+def export_table(table_name, fmt):
+    """Stream a whole table as CSV or NDJSON"""
+    if table_name not in get_table_names() or fmt not in ('csv', 'ndjson'):
+        return f"Table '{escape(table_name)}' not found", 404
     
-    return html
+    columns = [col[1] for col in get_table_info(table_name)]
+    rows = iter_table_rows(table_name)
+    if fmt == 'csv':
+        body, mimetype = generate_csv(columns, rows), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(columns, rows), 'application/x-ndjson'
+    
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{table_name}.{fmt}"'
+    })
 
 @app.route('/query', methods=['POST'])
 def execute_query():
-    """Execute a custom SQL query"""
+    """Execute a custom SQL query under a time and row budget"""
     sql = request.form.get('sql', '').strip()
     
     if not sql:
         return "No query provided", 400
     
+    if not os.path.exists(DATABASE_PATH):
+        return "Database not found", 404
+    
+    return Response(stream_with_context(render_query_page(sql)), mimetype='text/html')
+
+def explain_query_plan(db, sql):
+    """EXPLAIN QUERY PLAN rows as indented lines, or None for statements without a plan"""
     try:
-        db = get_db()
-        if db is None:
-            return "Database not found", 404
-        
-        cursor = db.cursor()
-        cursor.execute(sql)
-        
-        # Check if it's a SELECT query
-        if sql.lower().strip().startswith('select'):
-            results = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-        else:
-            db.commit()
-            results = []
-            columns = []
-        
-        db.close()
-        
-        html = f"""
+        rows = db.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except sqlite3.Error:
+        return None
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+def run_query(db, sql):
+    """Execute sql on the read-only connection and yield its rows page by page.
+    
+    A progress handler aborts the statement once QUERY_TIMEOUT_SECONDS have
+    passed (it is checked while SQLite works, so a runaway join is stopped
+    mid-scan), and no more than QUERY_MAX_ROWS rows are fetched.
+    """
+    deadline = time.perf_counter() + QUERY_TIMEOUT_SECONDS
+    db.set_progress_handler(lambda: time.perf_counter() > deadline, QUERY_PROGRESS_STEPS)
+    try:
+        cursor = db.execute(sql)
+        fetched = 0
+        while fetched < QUERY_MAX_ROWS:
+            rows = cursor.fetchmany(min(PAGE_SIZE, QUERY_MAX_ROWS - fetched))
+            if not rows:
+                return
+            fetched += len(rows)
+            yield cursor, rows
+        # Budget used up: tell the caller whether anything was left
+        if cursor.fetchone() is not None:
+            yield cursor, None
+    finally:
+        db.set_progress_handler(None, 0)
+
+def render_query_page(sql):
+    """Yield the result page: query, plan, then rows as they are fetched"""
+    db = get_db()
+    plan = explain_query_plan(db, sql)
+    plan_html = escape('\n'.join(plan)) if plan else 'n/a'
+    
+    yield f"""
         <!DOCTYPE html>
         <html>
         <head>
@@ -275,6 +442,7 @@ def execute_query():
                 .back-link:hover {{ color: #0056b3; }}
                 .query-info {{ background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; border-radius: 6px; margin: 20px 0; }}
                 .success {{ background: #d4edda; border: 1px solid #c3e6cb; color: #155724; }}
+                .error {{ background: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; padding: 15px; border-radius: 6px; margin: 20px 0; }}
                 pre {{ background: #f8f9fa; padding: 10px; border-radius: 4px; overflow-x: auto; }}
             </style>
         </head>
@@ -285,80 +453,67 @@ def execute_query():
                 
                 <div class="query-info">
                     <strong>Query:</strong><br>
-                    <pre>{sql}</pre>
+                    <pre>{escape(sql)}</pre>
+                    <strong>Query plan:</strong><br>
+                    <pre>{plan_html}</pre>
                 </div>
         """
-        
-        if columns and results:
-            html += f"""
-                <div class="query-info success">
-                    <strong>Results:</strong> {len(results)} rows returned
-                </div>
-                
-                <table>
-                    <thead>
-                        <tr>
-            """
-            
-            for col in columns:
-                html += f"<th>{col}</th>"
-            
-            html += """
-                        </tr>
-                    </thead>
-                    <tbody>
-            """
-            
-            for row in results:
-                html += "<tr>"
-                for value in row:
-                    if value is None:
-                        display_value = "<em>NULL</em>"
-                    else:
-                        display_value = str(value)
-                    html += f"<td>{display_value}</td>"
-                html += "</tr>"
+    
+    started = time.perf_counter()
+    row_count = 0
+    truncated = False
+    table_open = False
+    try:
+        for cursor, rows in run_query(db, sql):
+            if rows is None:
+                truncated = True
+                break
+            if not table_open:
+                header = "".join(f"<th>{escape(description[0])}</th>" for description in cursor.description)
+                yield f"<table><thead><tr>{header}</tr></thead><tbody>"
+                table_open = True
             
-            html += """
-                    </tbody>
-                </table>
-            """
-        elif sql.lower().strip().startswith('select'):
-            html += '<div class="query-info">Query executed successfully, but returned no results.</div>'
+            page = []
+            for row in rows:
+                cells = "".join(
+                    "<td><em>NULL</em></td>" if value is None else f"<td>{escape(str(value))}</td>" for value in row
+                )
+                page.append(f"<tr>{cells}</tr>")
+            row_count += len(rows)
+            yield "".join(page)
+    except sqlite3.Error as e:
+        if table_open:
+            yield "</tbody></table>"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if str(e) == 'interrupted':
+            message = f"Query stopped after exceeding the {QUERY_TIMEOUT_SECONDS} s time budget ({row_count} rows shown)"
         else:
-            html += '<div class="query-info success">Query executed successfully.</div>'
-        
-        html += """
+            message = f"{escape(str(e))}"
+            if 'readonly' in str(e):
+                message += " (the database browser opens the database read-only)"
+        yield f"""
+                <div class="error">
+                    <strong>Error:</strong> {message}<br>
+                    <strong>Execution time:</strong> {elapsed_ms:.1f} ms
+                </div>
             </div>
         </body>
         </html>
         """
-        
-        return html
-        
-    except Exception as e:
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Query Error</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-                .error {{ background: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; padding: 15px; border-radius: 6px; }}
-                .back-link {{ display: inline-block; margin-bottom: 20px; color: #007bff; text-decoration: none; }}
-                pre {{ background: #f8f9fa; padding: 10px; border-radius: 4px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <a href="/" class="back-link">← Back to Database Overview</a>
-                <h1>❌ Query Error</h1>
-                
-                <div class="error">
-                    <strong>Error:</strong> {str(e)}<br><br>
-                    <strong>Query:</strong><br>
-                    <pre>{sql}</pre>
+        return
+    
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if table_open:
+        yield "</tbody></table>"
+        note = f" (stopped at the {QUERY_MAX_ROWS} row limit)" if truncated else ""
+        summary = f"<strong>Results:</strong> {row_count} rows returned{note}"
+    else:
+        summary = "Query executed successfully, but returned no results."
+    
+    yield f"""
+                <div class="query-info success">
+                    {summary}<br>
+                    <strong>Execution time:</strong> {elapsed_ms:.1f} ms
                 </div>
             </div>
         </body>
@@ -369,7 +524,7 @@ if __name__ == '__main__':
     print("🚀 Starting Calendar Database Browser...")
     print(f"📂 Database path: {DATABASE_PATH}")
     print("🌐 Open your browser and go to: http://localhost:5001")
-    print("⚠️  Make sure your main calendar app is not running to avoid database conflicts")
+    print(f"🛡️  Read-only; custom queries stop after {QUERY_TIMEOUT_SECONDS:g}s or {QUERY_MAX_ROWS} rows")
     print("📝 Press Ctrl+C to stop the database browser")
     print("-" * 60)
     
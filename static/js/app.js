@@ -6,6 +6,8 @@ class CalendarApp {
         this.calendar = null;
         this.socket = null;
         this.currentUser = null;
+        // Last broadcast version applied, per joined calendar id
+        this.calendarVersions = {};
         
         this.init();
     }
@@ -46,6 +48,7 @@ class CalendarApp {
     
     init() {
         this.initializeSocketIO();
+        this.initializeOfflineSync();
         this.bindEvents();
         this.checkUser();
         this.checkForSharedCalendar();
@@ -54,21 +57,28 @@ class CalendarApp {
     initializeSocketIO() {
         this.socket = io();
         
-        this.socket.on('event_created', (event) => {
-            if (this.calendar) {
-                this.calendar.addEvent(event);
+        this.socket.on('event_created', (data) => {
+            if (this.acceptBroadcast(data)) {
+                this.calendar.addEvent(data.event);
                 // Only show notification if this is from another user
                 // The event creator already gets a success notification
                 
                 // Add to reminder service
                 if (window.reminderService) {
-                    window.reminderService.addEvent(event);
+                    window.reminderService.addEvent(data.event);
                 }
             }
         });
         
-        this.socket.on('event_updated', (event) => {
-            if (this.calendar) {
+        this.socket.on('event_updated', (data) => {
+            if (this.acceptBroadcast(data)) {
+                // Only the changed fields are sent; patch them onto the event we have
+                const existing = this.calendar.events.find(e => e.id === data.id);
+                if (!existing) {
+                    this.loadCalendarEvents(data.calendar_id);
+                    return;
+                }
+                const event = { ...existing, ...data.changes };
                 this.calendar.updateEvent(event);
                 // Only show notification if this is from another user
                 // The event updater already gets a success notification
@@ -81,7 +91,7 @@ class CalendarApp {
         });
         
         this.socket.on('event_deleted', (data) => {
-            if (this.calendar) {
+            if (this.acceptBroadcast(data)) {
                 this.calendar.removeEvent(data.event_id);
                 this.showNotification('Event deleted', 'info');
                 
@@ -94,6 +104,58 @@ class CalendarApp {
         
         this.socket.on('joined_calendar', (data) => {
             console.log('Joined calendar:', data.calendar);
+            this.calendarVersions[data.calendar.id] = data.version;
+        });
+    }
+    
+    // Whether a broadcast can be applied to the calendar on screen. Each one carries the calendar's
+    // version; if it doesn't follow the last version seen, a change was missed and the events are fetched again.
+    acceptBroadcast(data) {
+        const known = this.calendarVersions[data.calendar_id];
+        if (known !== undefined && data.version <= known) {
+            return false;
+        }
+        this.calendarVersions[data.calendar_id] = data.version;
+        
+        const onScreen = this.calendar && this.currentCalendar && this.currentCalendar.id === data.calendar_id;
+        if (known === undefined || data.version !== known + 1) {
+            if (onScreen) {
+                this.loadCalendarEvents(data.calendar_id);
+            }
+            return false;
+        }
+        return onScreen;
+    }
+    
+    initializeOfflineSync() {
+        if (!('serviceWorker' in navigator)) {
+            return;
+        }
+        
+        // The service worker serves events from its offline store and reports what the delta sync changed
+        navigator.serviceWorker.addEventListener('message', (event) => {
+            const message = event.data || {};
+            
+            if (message.type === 'events-updated' && this.calendar && this.currentCalendar &&
+                message.calendarId === this.currentCalendar.id) {
+                this.calendar.setEvents(message.events);
+                if (window.reminderService) {
+                    window.reminderService.loadReminders(message.events);
+                }
+            }
+            
+            if (message.type === 'outbox-flushed') {
+                if (message.sent) {
+                    this.showNotification(`${message.sent} offline change${message.sent > 1 ? 's' : ''} synced`, 'success');
+                }
+                if (message.rejected) {
+                    this.showNotification(`${message.rejected} offline change${message.rejected > 1 ? 's were' : ' was'} rejected by the server`, 'error');
+                }
+            }
+        });
+        
+        window.addEventListener('online', () => {
+            navigator.serviceWorker.controller?.postMessage({ type: 'flush-outbox' });
         });
     }
     
@@ -362,6 +424,10 @@ class CalendarApp {
     async logout() {
         try {
             this.showLoading();
+            // Stop pushes to this device before the session goes away
+            if (window.pushNotifications) {
+                await window.pushNotifications.unsubscribe();
+            }
             const response = await fetch('/api/user/logout', {
                 method: 'POST',
                 headers: {
@@ -412,6 +478,11 @@ class CalendarApp {
         } else {
             this.showWelcomeSection();
         }
+        
+        // Register this device for server-side push (no-op if unsupported or not allowed)
+        if (window.pushNotifications) {
+            window.pushNotifications.subscribe();
+        }
     }
     
     checkForSharedCalendar() {
@@ -992,7 +1063,13 @@ class CalendarApp {
                 // Socket event will handle adding to calendar display
                 
                 this.closeModal('addEventModal');
-                this.showNotification('Event added successfully!', 'success');
+                if (event.queued) {
+                    // Saved in the service worker outbox while offline, no socket event will follow
+                    this.calendar.addEvent(event);
+                    this.showNotification('Event saved offline, it will sync when you are back online', 'info');
+                } else {
+                    this.showNotification('Event added successfully!', 'success');
+                }
                 
                 // Reset form
                 document.getElementById('addEventForm').reset();
@@ -1126,7 +1203,12 @@ class CalendarApp {
                 // Socket event will handle calendar display update
                 
                 this.closeModal('addEventModal');
-                this.showNotification('Event updated successfully!', 'success');
+                if (updatedEvent.queued) {
+                    this.calendar.updateEvent(updatedEvent);
+                    this.showNotification('Changes saved offline, they will sync when you are back online', 'info');
+                } else {
+                    this.showNotification('Event updated successfully!', 'success');
+                }
                 
                 // Reset form for next use
                 this.resetEventForm();
@@ -1160,6 +1242,11 @@ class CalendarApp {
                     this.calendar.removeEvent(eventId);
                 }
                 
+                if (response.status === 202) {
+                    this.showNotification('Event deleted offline, it will sync when you are back online', 'info');
+                    return;
+                }
+                
                 // Reload upcoming events
                 await this.loadUpcomingEvents(this.currentCalendar.id);
                 
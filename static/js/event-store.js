@@ -0,0 +1,153 @@
+// Offline event store shared by the service worker.
+// Keeps each opened calendar's events in IndexedDB together with the
+// server's change-log cursor, plus an outbox of event writes made offline.
+const EVENT_STORE_NAME = 'calindar-events';
+const EVENT_STORE_VERSION = 1;
+
+class EventStore {
+    constructor() {
+        this.dbPromise = null;
+    }
+
+    open() {
+        if (!this.dbPromise) {
+            this.dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(EVENT_STORE_NAME, EVENT_STORE_VERSION);
+
+                request.onupgradeneeded = (event) => {
+                    const db = event.target.result;
+                    if (!db.objectStoreNames.contains('events')) {
+                        const events = db.createObjectStore('events', { keyPath: 'id' });
+                        events.createIndex('calendar_id', 'calendar_id');
+                    }
+                    if (!db.objectStoreNames.contains('calendars')) {
+                        // Keyed by the URL reference ("id:3" or "code:ABC123"), value holds the sync cursor
+                        db.createObjectStore('calendars', { keyPath: 'ref' });
+                    }
+                    if (!db.objectStoreNames.contains('outbox')) {
+                        db.createObjectStore('outbox', { keyPath: 'key', autoIncrement: true });
+                    }
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => {
+                    this.dbPromise = null;
+                    reject(request.error);
+                };
+            });
+        }
+        return this.dbPromise;
+    }
+
+    // Run fn(stores) inside one transaction and resolve with its return value once committed
+    async transaction(storeNames, mode, fn) {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(storeNames, mode);
+            const stores = {};
+            for (const name of storeNames) {
+                stores[name] = tx.objectStore(name);
+            }
+            let result;
+            Promise.resolve(fn(stores)).then((value) => { result = value; }, reject);
+            tx.oncomplete = () => resolve(result);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    static request(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    static calendarRef(reference) {
+        return /^\d+$/.test(reference) ? `id:${reference}` : `code:${reference}`;
+    }
+
+    getCalendar(reference) {
+        const ref = EventStore.calendarRef(reference);
+        return this.transaction(['calendars'], 'readonly', ({ calendars }) => EventStore.request(calendars.get(ref)));
+    }
+
+    async calendarReferences(calendarId) {
+        const calendars = await this.transaction(['calendars'], 'readonly', ({ calendars }) => EventStore.request(calendars.getAll()));
+        return calendars.filter((calendar) => calendar.calendarId === calendarId).map((calendar) => calendar.reference);
+    }
+
+    listEvents(calendarId) {
+        return this.transaction(['events'], 'readonly', ({ events }) =>
+            EventStore.request(events.index('calendar_id').getAll(calendarId))
+        ).then((events) => events.sort((a, b) => a.start_time.localeCompare(b.start_time)));
+    }
+
+    getEvent(eventId) {
+        return this.transaction(['events'], 'readonly', ({ events }) => EventStore.request(events.get(eventId)));
+    }
+
+    // Apply one page of /events/changes; a reset replaces everything but not-yet-sent offline events
+    applyChanges(reference, delta) {
+        return this.transaction(['events', 'calendars'], 'readwrite', async ({ events, calendars }) => {
+            if (delta.reset) {
+                const existing = await EventStore.request(events.index('calendar_id').getAllKeys(delta.calendar_id));
+                for (const id of existing) {
+                    if (id > 0) {
+                        events.delete(id);
+                    }
+                }
+            }
+            for (const event of delta.events) {
+                events.put(event);
+            }
+            for (const id of delta.deleted) {
+                events.delete(id);
+            }
+            calendars.put({
+                ref: EventStore.calendarRef(reference),
+                reference: String(reference),
+                calendarId: delta.calendar_id,
+                cursor: delta.cursor,
+                syncedAt: Date.now()
+            });
+        });
+    }
+
+    putEvent(event) {
+        return this.transaction(['events'], 'readwrite', ({ events }) => { events.put(event); });
+    }
+
+    deleteEvent(eventId) {
+        return this.transaction(['events'], 'readwrite', ({ events }) => { events.delete(eventId); });
+    }
+
+    addToOutbox(entry) {
+        return this.transaction(['outbox'], 'readwrite', ({ outbox }) => EventStore.request(outbox.add(entry)));
+    }
+
+    outboxEntries() {
+        return this.transaction(['outbox'], 'readonly', ({ outbox }) => EventStore.request(outbox.getAll()));
+    }
+
+    removeFromOutbox(key) {
+        return this.transaction(['outbox'], 'readwrite', ({ outbox }) => { outbox.delete(key); });
+    }
+
+    // Swap an offline-created event's temporary id for the server's, in the store and in queued writes
+    resolveTempId(tempId, event) {
+        return this.transaction(['events', 'outbox'], 'readwrite', async ({ events, outbox }) => {
+            events.delete(tempId);
+            events.put(event);
+
+            const entries = await EventStore.request(outbox.getAll());
+            for (const entry of entries) {
+                if (entry.url === `/api/events/${tempId}`) {
+                    entry.url = `/api/events/${event.id}`;
+                    outbox.put(entry);
+                }
+            }
+        });
+    }
+}
+
+self.eventStore = new EventStore();
@@ -0,0 +1,92 @@
+// Server-side Web Push registration.
+// Subscribes this browser with the server's VAPID key and stores the
+// subscription, so reminders and calendar changes arrive even with no tab open.
+class PushNotifications {
+    constructor() {
+        this.supported = 'serviceWorker' in navigator && 'PushManager' in window && 'Notification' in window;
+        this.config = null;
+    }
+
+    async getConfig() {
+        if (!this.config) {
+            const response = await fetch('/api/push/public-key');
+            this.config = response.ok ? await response.json() : { enabled: false };
+        }
+        return this.config;
+    }
+
+    async subscribe() {
+        if (!this.supported || Notification.permission !== 'granted') {
+            return null;
+        }
+
+        try {
+            const config = await this.getConfig();
+            if (!config.enabled || !config.public_key) {
+                return null;
+            }
+
+            const registration = await navigator.serviceWorker.ready;
+            let subscription = await registration.pushManager.getSubscription();
+            if (!subscription) {
+                subscription = await registration.pushManager.subscribe({
+                    userVisibleOnly: true,
+                    applicationServerKey: this.urlBase64ToUint8Array(config.public_key)
+                });
+            }
+
+            const response = await fetch('/api/push/subscriptions', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(subscription.toJSON())
+            });
+            if (!response.ok) {
+                console.error('🔔 Push: server rejected subscription', response.status);
+                return null;
+            }
+            console.log('🔔 Push: subscribed');
+            return subscription;
+        } catch (error) {
+            console.error('🔔 Push: subscribe failed', error);
+            return null;
+        }
+    }
+
+    async unsubscribe() {
+        if (!this.supported) {
+            return;
+        }
+
+        try {
+            const registration = await navigator.serviceWorker.ready;
+            const subscription = await registration.pushManager.getSubscription();
+            if (!subscription) {
+                return;
+            }
+
+            await fetch('/api/push/subscriptions', {
+                method: 'DELETE',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ endpoint: subscription.endpoint })
+            });
+            await subscription.unsubscribe();
+            console.log('🔔 Push: unsubscribed');
+        } catch (error) {
+            console.error('🔔 Push: unsubscribe failed', error);
+        }
+    }
+
+    async sendTest() {
+        const response = await fetch('/api/push/test', { method: 'POST' });
+        return response.ok;
+    }
+
+    urlBase64ToUint8Array(base64String) {
+        const padding = '='.repeat((4 - base64String.length % 4) % 4);
+        const base64 = (base64String + padding).replace(/-/g, '+').replace(/_/g, '/');
+        const raw = atob(base64);
+        return Uint8Array.from(raw, char => char.charCodeAt(0));
+    }
+}
+
+window.pushNotifications = new PushNotifications();
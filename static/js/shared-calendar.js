@@ -5,12 +5,15 @@ class SharedCalendarApp {
         this.calendar = null;
         this.calendarData = null;
         this.socket = null;
+        // Last broadcast version applied, set when the room is joined
+        this.version = null;
         
         this.init();
     }
     
     init() {
         this.initializeSocketIO();
+        this.initializeOfflineSync();
         this.bindEvents();
         this.loadCalendar();
     }
@@ -18,20 +21,27 @@ class SharedCalendarApp {
     initializeSocketIO() {
         this.socket = io();
         
-        this.socket.on('event_created', (event) => {
-            if (this.calendar) {
-                this.calendar.addEvent(event);
-                this.showNotification('New event added: ' + event.title, 'success');
+        this.socket.on('event_created', (data) => {
+            if (this.acceptBroadcast(data)) {
+                this.calendar.addEvent(data.event);
+                this.showNotification('New event added: ' + data.event.title, 'success');
                 
                 // Add to reminder service
                 if (window.reminderService) {
-                    window.reminderService.addEvent(event);
+                    window.reminderService.addEvent(data.event);
                 }
             }
         });
         
-        this.socket.on('event_updated', (event) => {
-            if (this.calendar) {
+        this.socket.on('event_updated', (data) => {
+            if (this.acceptBroadcast(data)) {
+                // Only the changed fields are sent; patch them onto the event we have
+                const existing = this.calendar.events.find(e => e.id === data.id);
+                if (!existing) {
+                    this.loadCalendar();
+                    return;
+                }
+                const event = { ...existing, ...data.changes };
                 this.calendar.updateEvent(event);
                 this.showNotification('Event updated: ' + event.title, 'info');
                 
@@ -43,7 +53,7 @@ class SharedCalendarApp {
         });
         
         this.socket.on('event_deleted', (data) => {
-            if (this.calendar) {
+            if (this.acceptBroadcast(data)) {
                 this.calendar.removeEvent(data.event_id);
                 this.showNotification('Event deleted', 'info');
                 
@@ -57,6 +67,49 @@ class SharedCalendarApp {
         this.socket.on('joined_calendar', (data) => {
             console.log('Joined calendar:', data.calendar);
             this.calendarData = data.calendar;
+            this.version = data.version;
+        });
+    }
+    
+    // Whether a broadcast can be applied as is. Each one carries the calendar's version; if it
+    // doesn't follow the last version seen, a change was missed and the calendar is loaded again.
+    acceptBroadcast(data) {
+        if (!this.calendar || (this.version !== null && data.version <= this.version)) {
+            return false;
+        }
+        const missed = this.version === null || data.version !== this.version + 1;
+        this.version = data.version;
+        if (missed) {
+            this.loadCalendar();
+            return false;
+        }
+        return true;
+    }
+    
+    initializeOfflineSync() {
+        if (!('serviceWorker' in navigator)) {
+            return;
+        }
+        
+        // Delta-synced events from the service worker's offline store
+        navigator.serviceWorker.addEventListener('message', (event) => {
+            const message = event.data || {};
+            
+            if (message.type === 'events-updated' && this.calendar && this.calendarData &&
+                message.calendarId === this.calendarData.id) {
+                this.calendar.setEvents(message.events);
+                if (window.reminderService) {
+                    window.reminderService.loadReminders(message.events);
+                }
+            }
+            
+            if (message.type === 'outbox-flushed' && message.sent) {
+                this.showNotification(`${message.sent} offline change${message.sent > 1 ? 's' : ''} synced`, 'success');
+            }
+        });
+        
+        window.addEventListener('online', () => {
+            navigator.serviceWorker.controller?.postMessage({ type: 'flush-outbox' });
         });
     }
     
@@ -234,7 +287,11 @@ class SharedCalendarApp {
                 const event = await response.json();
                 this.calendar.addEvent(event);
                 this.closeModal('addEventModal');
-                this.showNotification('Event added successfully!', 'success');
+                if (event.queued) {
+                    this.showNotification('Event saved offline, it will sync when you are back online', 'info');
+                } else {
+                    this.showNotification('Event added successfully!', 'success');
+                }
                 
                 // Add to reminder service
                 if (window.reminderService) {
@@ -1,3 +1,5 @@
+importScripts('/static/js/event-store.js');
+
 const CACHE_NAME = 'calindar-v1';
 const urlsToCache = [
     '/',
@@ -7,6 +9,8 @@ const urlsToCache = [
     '/static/js/app.js',
     '/static/js/shared-calendar.js',
     '/static/js/reminder-service.js',
+    '/static/js/push-notifications.js',
+    '/static/js/event-store.js',
     '/static/icons/icon-192x192.png',
     '/static/icons/icon-512x512.png'
 ];
@@ -47,8 +51,28 @@ self.addEventListener('activate', (event) => {
     );
 });
 
+const CALENDAR_EVENTS_PATH = /^\/api\/calendars\/([^/]+)\/events$/;
+const EVENT_WRITE_PATH = /^\/api\/events(\/-?\d+)?$/;
+
 // Fetch event - serve from cache when offline
 self.addEventListener('fetch', (event) => {
+    const url = new URL(event.request.url);
+
+    if (url.origin === self.location.origin) {
+        // Calendar event lists come from IndexedDB and are delta-synced in the background
+        const calendarMatch = url.pathname.match(CALENDAR_EVENTS_PATH);
+        if (calendarMatch && event.request.method === 'GET' && !url.search) {
+            event.respondWith(serveCalendarEvents(event, decodeURIComponent(calendarMatch[1])));
+            return;
+        }
+
+        // Event writes made while offline are queued in the outbox
+        if (EVENT_WRITE_PATH.test(url.pathname) && ['POST', 'PUT', 'DELETE'].includes(event.request.method)) {
+            event.respondWith(sendOrQueueEventWrite(event.request, url.pathname));
+            return;
+        }
+    }
+
     event.respondWith(
         caches.match(event.request)
             .then((response) => {
@@ -68,8 +92,199 @@ self.addEventListener('sync', (event) => {
             checkRemindersInBackground()
         );
     }
+
+    if (event.tag === 'outbox-sync') {
+        event.waitUntil(flushOutbox());
+    }
 });
 
+// Pages ask for an outbox flush when the browser comes back online
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'flush-outbox') {
+        event.waitUntil(flushOutbox());
+    }
+});
+
+function jsonResponse(body, status = 200) {
+    return new Response(JSON.stringify(body), {
+        status,
+        headers: { 'Content-Type': 'application/json' }
+    });
+}
+
+async function notifyClients(message) {
+    const windowClients = await clients.matchAll({ type: 'window', includeUncontrolled: true });
+    for (const client of windowClients) {
+        client.postMessage(message);
+    }
+}
+
+// Stale-while-revalidate: answer from IndexedDB, then pull only what changed since the stored cursor
+async function serveCalendarEvents(event, reference) {
+    let calendar = null;
+    try {
+        calendar = await self.eventStore.getCalendar(reference);
+    } catch (error) {
+        console.error('Service Worker: Event store unavailable:', error);
+        return fetch(event.request);
+    }
+
+    if (calendar) {
+        event.waitUntil(
+            syncCalendar(reference, calendar.cursor)
+                .catch((error) => console.log('Service Worker: Delta sync skipped:', error.message))
+        );
+        return jsonResponse(await self.eventStore.listEvents(calendar.calendarId));
+    }
+
+    try {
+        const calendarId = await syncCalendar(reference, null, false);
+        return jsonResponse(await self.eventStore.listEvents(calendarId));
+    } catch (error) {
+        return fetch(event.request);
+    }
+}
+
+async function syncCalendar(reference, cursor, notify = true) {
+    let changed = false;
+    let delta;
+    do {
+        const query = cursor === null ? '' : `?since=${cursor}`;
+        const response = await fetch(`/api/calendars/${encodeURIComponent(reference)}/events/changes${query}`, {
+            credentials: 'same-origin'
+        });
+        if (!response.ok) {
+            throw new Error(`changes request failed with ${response.status}`);
+        }
+
+        delta = await response.json();
+        await self.eventStore.applyChanges(reference, delta);
+        changed = changed || delta.reset || delta.events.length > 0 || delta.deleted.length > 0;
+        cursor = delta.cursor;
+    } while (delta.has_more);
+
+    if (changed && notify) {
+        await notifyClients({
+            type: 'events-updated',
+            calendarId: delta.calendar_id,
+            events: await self.eventStore.listEvents(delta.calendar_id)
+        });
+    }
+    return delta.calendar_id;
+}
+
+async function sendOrQueueEventWrite(request, pathname) {
+    const body = request.method === 'DELETE' ? null : await request.clone().text();
+    try {
+        return await fetch(request);
+    } catch (error) {
+        return queueEventWrite(request.method, pathname, body);
+    }
+}
+
+// Apply the write to the local store optimistically and keep it for replay
+async function queueEventWrite(method, pathname, body) {
+    const data = body ? JSON.parse(body) : {};
+    const eventId = pathname === '/api/events' ? null : parseInt(pathname.split('/').pop(), 10);
+    const entry = { method, url: pathname, body, queuedAt: Date.now() };
+    let event = null;
+
+    if (method === 'POST') {
+        entry.tempId = -Date.now();
+        event = { ...data, id: entry.tempId, pending: true };
+        await self.eventStore.putEvent(event);
+    } else {
+        const existing = await self.eventStore.getEvent(eventId);
+        if (existing && method === 'PUT') {
+            event = { ...existing, ...data, pending: true };
+            await self.eventStore.putEvent(event);
+        } else if (existing) {
+            await self.eventStore.deleteEvent(eventId);
+        }
+        event = event || { id: eventId };
+    }
+    entry.calendarId = event.calendar_id;
+    await self.eventStore.addToOutbox(entry);
+
+    if (self.registration.sync) {
+        try {
+            await self.registration.sync.register('outbox-sync');
+        } catch (error) {
+            console.log('Service Worker: Background sync unavailable, waiting for the page to flush');
+        }
+    }
+
+    return jsonResponse({ ...event, queued: true }, 202);
+}
+
+let outboxFlush = null;
+
+function flushOutbox() {
+    // Both the sync event and a page message can ask at once; replay the queue only once
+    if (!outboxFlush) {
+        outboxFlush = replayOutbox().finally(() => { outboxFlush = null; });
+    }
+    return outboxFlush;
+}
+
+async function replayOutbox() {
+    const entries = await self.eventStore.outboxEntries();
+    const calendarIds = new Set();
+    let sent = 0;
+    let rejected = 0;
+
+    for (const queued of entries) {
+        // Earlier entries may have swapped a temporary id in this one's URL
+        const entry = (await self.eventStore.outboxEntries()).find((item) => item.key === queued.key);
+        if (!entry) {
+            continue;
+        }
+
+        let response;
+        try {
+            response = await fetch(entry.url, {
+                method: entry.method,
+                headers: entry.body ? { 'Content-Type': 'application/json' } : {},
+                body: entry.body,
+                credentials: 'same-origin'
+            });
+        } catch (error) {
+            break; // Still offline, keep the rest for the next attempt
+        }
+
+        if (response.status >= 500) {
+            break;
+        }
+
+        if (response.ok) {
+            sent++;
+            if (entry.tempId) {
+                await self.eventStore.resolveTempId(entry.tempId, await response.json());
+            }
+        } else {
+            rejected++;
+            if (entry.tempId) {
+                await self.eventStore.deleteEvent(entry.tempId);
+            }
+        }
+        if (entry.calendarId) {
+            calendarIds.add(entry.calendarId);
+        }
+        await self.eventStore.removeFromOutbox(entry.key);
+    }
+
+    for (const calendarId of calendarIds) {
+        for (const reference of await self.eventStore.calendarReferences(calendarId)) {
+            const calendar = await self.eventStore.getCalendar(reference);
+            await syncCalendar(reference, calendar.cursor).catch(() => {});
+        }
+    }
+
+    if (sent || rejected) {
+        await notifyClients({ type: 'outbox-flushed', sent, rejected });
+    }
+}
+
 // Push notifications for reminders
 self.addEventListener('push', (event) => {
     console.log('Service Worker: Push received');
@@ -94,11 +309,11 @@ self.addEventListener('push', (event) => {
         icon: notificationData.icon,
         badge: notificationData.badge,
         vibrate: [200, 100, 200],
-        tag: 'calindar-reminder',
+        tag: notificationData.tag || 'calindar-reminder',
         requireInteraction: true,
         data: {
             dateOfArrival: Date.now(),
-            url: '/'
+            url: notificationData.url || '/'
         },
         actions: [
             {
@@ -220,12 +435,23 @@ self.addEventListener('notificationclick', (event) => {
     
     event.notification.close();
 
-    if (event.action === 'explore') {
-        // Open the app
-        event.waitUntil(
-            clients.openWindow('/')
-        );
+    if (event.action === 'dismiss') {
+        return;
     }
+
+    // Focus an open app window if there is one, otherwise open the notification's page
+    const url = (event.notification.data && event.notification.data.url) || '/';
+    event.waitUntil(
+        clients.matchAll({ type: 'window', includeUncontrolled: true }).then((windowClients) => {
+            for (const client of windowClients) {
+                if ('focus' in client) {
+                    client.navigate(url);
+                    return client.focus();
+                }
+            }
+            return clients.openWindow(url);
+        })
+    );
 });
 
 // Function to check reminders in background
@@ -0,0 +1,32 @@
+import pytest
+
+import config
+from app import create_app
+from app.main.routes import init_db_if_needed
+from app.shards import shard_router
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Build an app on a fresh SQLite file, with config overrides"""
+
+    def make(**overrides):
+        settings = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'calendar.db'}",
+            'JOBS_FILES_DIR': str(tmp_path / 'jobs'),
+            'BACKUP_DIR': str(tmp_path / 'backups'),
+            'ARCHIVE_DATABASE_PATH': str(tmp_path / 'archive.db'),
+            'JOBS_ENABLED': False,
+            'UPCOMING_WINDOW_ENABLED': False,
+            **overrides,
+        }
+        # The extensions are module singletons; only a sharded app turns routing on
+        monkeypatch.setattr(shard_router, 'enabled', False)
+        monkeypatch.setitem(config.config, 'test', type('TestConfig', (config.Config,), settings))
+        app = create_app('test')
+        with app.app_context():
+            init_db_if_needed()
+        return app
+
+    return make
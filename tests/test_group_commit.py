@@ -0,0 +1,118 @@
+import sqlite3
+from collections import defaultdict, deque
+
+import gevent
+import pytest
+from werkzeug.exceptions import NotFound
+
+from app.api.event_routes import _delete_event, _insert_event
+from app.group_commit import _Unit, group_commit
+from app.models import db, CalendarVersion, Event, EventChange, Reminder
+from app.shards import shard_router
+
+
+@pytest.fixture(params=[False, True], ids=['single', 'sharded'])
+def app(request, make_app, monkeypatch):
+    # Writers are per app; don't hand units to one started by an earlier test's app
+    monkeypatch.setattr(group_commit, '_queues', defaultdict(deque))
+    monkeypatch.setattr(group_commit, '_wakeup', {})
+    return make_app(GROUP_COMMIT_ENABLED=True, GROUP_COMMIT_WINDOW_MS=50,
+                    SHARDING_ENABLED=request.param, SHARD_COUNT=2)
+
+
+@pytest.fixture
+def calendar_id(app):
+    client = app.test_client()
+    client.post('/api/users', json={'username': 'alice'})
+    return client.post('/api/calendars', json={'name': 'Team'}).get_json()['id']
+
+
+def _event(calendar_id, title):
+    return {'title': title, 'calendar_id': calendar_id,
+            'start_time': '2030-01-01T10:00:00', 'end_time': '2030-01-01T11:00:00'}
+
+
+def _insert_then_fail(data):
+    _insert_event(data, None)
+    raise ValueError('failed after writing')
+
+
+def _seen_from_outside(calendar_id):
+    """(events visible, write lock free) for another connection to the unit's database, mid-batch"""
+    other = sqlite3.connect(db.session.get_bind().url.database, timeout=0, isolation_level=None)
+    try:
+        visible = other.execute("SELECT count(*) FROM event WHERE calendar_id = ?", (calendar_id,)).fetchone()[0]
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("ROLLBACK")
+            lock_free = True
+        except sqlite3.OperationalError:
+            lock_free = False
+        return visible, lock_free
+    finally:
+        other.close()
+
+
+def _stored(app, calendar_id):
+    """(event titles, reminder count, change-log entries, version) of a calendar, read in a fresh session"""
+    with app.app_context(), shard_router.calendar(calendar_id):
+        titles = sorted(db.session.execute(
+            db.select(Event.title).where(Event.calendar_id == calendar_id)
+        ).scalars())
+        reminders = db.session.execute(
+            db.select(db.func.count()).select_from(Reminder).join(Event, Event.id == Reminder.event_id)
+            .where(Event.calendar_id == calendar_id)
+        ).scalar()
+        changes = db.session.execute(
+            db.select(db.func.count()).select_from(EventChange).where(EventChange.calendar_id == calendar_id)
+        ).scalar()
+        return titles, reminders, changes, CalendarVersion.get(calendar_id)
+
+
+def test_failing_unit_rolls_back_alone(app, calendar_id):
+    batch = [
+        _Unit(_seen_from_outside, (calendar_id,), None),
+        _Unit(_insert_event, (_event(calendar_id, 'first'), None), None),
+        _Unit(_insert_then_fail, (_event(calendar_id, 'rolled back'),), None),
+        _Unit(_delete_event, (10 ** 9,), None),
+        _Unit(_insert_event, (_event(calendar_id, 'second'), None), None),
+        _Unit(_seen_from_outside, (calendar_id,), None),
+    ]
+    with app.app_context():
+        # Runs the raw BEGIN and write-lock UPDATE on main, with core attached when sharded
+        group_commit._apply(shard_router.route(calendar_id), batch)
+
+    assert [unit.error for unit in batch[:2] + batch[4:]] == [None] * 4
+    assert isinstance(batch[2].error, ValueError)
+    assert isinstance(batch[3].error, NotFound)
+    assert batch[1].result[0].title == 'first'
+    # The batch holds the write lock before its first unit runs, and released savepoints
+    # stay inside its transaction until the single commit
+    assert batch[0].result == (0, False)
+    assert batch[5].result == (0, False)
+    # The failed unit's event, reminder, change-log entry and version bump are all gone
+    assert _stored(app, calendar_id) == (['first', 'second'], 2, 2, 2)
+
+
+def test_concurrent_writes_share_one_commit(app, calendar_id):
+    before = group_commit.stats()
+
+    def write(fn, *args):
+        with app.app_context():
+            try:
+                return group_commit.run(fn, *args, shard=shard_router.route(calendar_id))[0].title
+            except Exception as e:
+                return e
+
+    greenlets = [gevent.spawn(write, _insert_event, _event(calendar_id, f'event {i}'), None) for i in range(4)]
+    greenlets.append(gevent.spawn(write, _insert_then_fail, _event(calendar_id, 'rolled back')))
+    gevent.joinall(greenlets, timeout=30, raise_error=True)
+
+    results = [greenlet.value for greenlet in greenlets]
+    assert results[:4] == [f'event {i}' for i in range(4)]
+    assert isinstance(results[4], ValueError)
+    after = group_commit.stats()
+    assert after['units'] - before.get('units', 0) == 5
+    assert after['batches'] - before.get('batches', 0) == 1
+    assert after['failed'] - before.get('failed', 0) == 1
+    assert _stored(app, calendar_id) == ([f'event {i}' for i in range(4)], 4, 4, 4)